@@ -39,6 +39,7 @@ class DBPostProcess(object):
                  use_dilation=False,
                  score_mode="fast",
                  box_type='quad',
+                 box_engine='legacy',
                  **kwargs):
         self.thresh = thresh
         self.box_thresh = box_thresh
@@ -47,9 +48,13 @@ class DBPostProcess(object):
         self.min_size = 3
         self.score_mode = score_mode
         self.box_type = box_type
+        self.box_engine = box_engine
         assert score_mode in [
             "slow", "fast"
         ], "Score mode must be in [slow, fast] but got: {}".format(score_mode)
+        assert box_engine in [
+            "legacy", "fast"
+        ], "Box engine must be in [legacy, fast] but got: {}".format(box_engine)
 
         self.dilation_kernel = None if not use_dilation else np.array(
             [[1, 1], [1, 1]])
@@ -148,6 +153,118 @@ class DBPostProcess(object):
             scores.append(score)
         return np.array(boxes, dtype="int32"), scores
 
+    def boxes_from_bitmap_fast(self, pred, _bitmap, dest_width, dest_height):
+        '''
+        same contract as boxes_from_bitmap, but works on all candidates at once:
+        rectangle corners are computed in closed form, axis-aligned boxes are
+        scored from an integral image of the probability map, the unclip of a
+        rectangle is the rectangle grown by the offset distance on every side,
+        and size/score rejection happens in bulk.
+        '''
+        bitmap = _bitmap
+        height, width = bitmap.shape
+
+        outs = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST,
+                                cv2.CHAIN_APPROX_SIMPLE)
+        contours = outs[-2][:self.max_candidates]
+        if len(contours) == 0:
+            return np.zeros((0, 4, 2), dtype="int32"), []
+
+        rects = [cv2.minAreaRect(contour) for contour in contours]
+        centers = np.array([rect[0] for rect in rects], dtype=np.float64)
+        sizes = np.array([rect[1] for rect in rects], dtype=np.float64)
+        angles = np.array([rect[2] for rect in rects], dtype=np.float64)
+
+        keep = sizes.min(axis=1) >= self.min_size
+        points = self.rect_points(centers, sizes, angles)
+
+        scores = np.zeros(len(rects), dtype=np.float64)
+        index = np.nonzero(keep)[0]
+        if self.score_mode == "fast":
+            scores[index] = self.box_scores_fast(pred, points[index],
+                                                 angles[index])
+        else:
+            for i in index:
+                scores[i] = self.box_score_slow(pred, contours[i])
+        keep &= scores >= self.box_thresh
+
+        # offset distance of pyclipper unclip for a w x h rectangle
+        area = sizes[:, 0] * sizes[:, 1]
+        length = 2 * (sizes[:, 0] + sizes[:, 1])
+        distance = area * self.unclip_ratio / np.maximum(length, 1e-6)
+        sizes = sizes + 2 * distance[:, None]
+        keep &= sizes.min(axis=1) >= self.min_size + 2
+
+        boxes = self.rect_points(centers[keep], sizes[keep], angles[keep])
+        boxes[:, :, 0] = np.clip(
+            np.round(boxes[:, :, 0] / width * dest_width), 0, dest_width)
+        boxes[:, :, 1] = np.clip(
+            np.round(boxes[:, :, 1] / height * dest_height), 0, dest_height)
+        return boxes.astype("int32"), scores[keep].tolist()
+
+    def rect_points(self, centers, sizes, angles):
+        '''
+        vectorized cv2.boxPoints + get_mini_boxes point ordering
+        centers/sizes: (N, 2), angles: (N,) in degrees, return (N, 4, 2)
+        '''
+        theta = np.deg2rad(angles)
+        b = np.cos(theta) * 0.5
+        a = np.sin(theta) * 0.5
+        w, h = sizes[:, 0], sizes[:, 1]
+        cx, cy = centers[:, 0], centers[:, 1]
+        p0 = np.stack([cx - a * h - b * w, cy + b * h - a * w], axis=1)
+        p1 = np.stack([cx + a * h - b * w, cy - b * h - a * w], axis=1)
+        p2 = 2 * centers - p0
+        p3 = 2 * centers - p1
+        points = np.stack([p0, p1, p2, p3], axis=1)
+
+        order = np.argsort(points[:, :, 0], axis=1, kind="stable")
+        points = np.take_along_axis(points, order[:, :, None], axis=1)
+        rows = np.arange(len(points))
+        first = np.where(points[:, 1, 1] > points[:, 0, 1], 0, 1)
+        last = np.where(points[:, 3, 1] > points[:, 2, 1], 2, 3)
+        return np.stack([
+            points[rows, first], points[rows, last], points[rows, 5 - last],
+            points[rows, 1 - first]
+        ], axis=1)
+
+    def box_scores_fast(self, bitmap, boxes, angles):
+        '''
+        box_score_fast for many boxes: axis-aligned boxes use an integral image,
+        rotated boxes fall back to the polygon mask
+        '''
+        h, w = bitmap.shape[:2]
+        scores = np.zeros(len(boxes), dtype=np.float64)
+        aligned = np.isclose(np.mod(angles, 90.0), 0.0) | np.isclose(
+            np.mod(angles, 90.0), 90.0)
+        for i in np.nonzero(~aligned)[0]:
+            scores[i] = self.box_score_fast(bitmap, boxes[i])
+        if not aligned.any():
+            return scores
+
+        box = boxes[aligned].astype(np.float32)
+        xmin = np.clip(np.floor(box[:, :, 0].min(axis=1)).astype("int32"), 0, w - 1)
+        xmax = np.clip(np.ceil(box[:, :, 0].max(axis=1)).astype("int32"), 0, w - 1)
+        ymin = np.clip(np.floor(box[:, :, 1].min(axis=1)).astype("int32"), 0, h - 1)
+        ymax = np.clip(np.ceil(box[:, :, 1].max(axis=1)).astype("int32"), 0, h - 1)
+        # same pixels as fillPoly on the int32-truncated local box in box_score_fast
+        x0 = xmin + np.maximum(
+            (box[:, :, 0].min(axis=1) - xmin).astype("int32"), 0)
+        x1 = xmin + np.minimum(
+            (box[:, :, 0].max(axis=1) - xmin).astype("int32"), xmax - xmin)
+        y0 = ymin + np.maximum(
+            (box[:, :, 1].min(axis=1) - ymin).astype("int32"), 0)
+        y1 = ymin + np.minimum(
+            (box[:, :, 1].max(axis=1) - ymin).astype("int32"), ymax - ymin)
+
+        integral = cv2.integral(np.ascontiguousarray(bitmap, dtype=np.float32),
+                                sdepth=cv2.CV_64F)
+        total = (integral[y1 + 1, x1 + 1] - integral[y0, x1 + 1] -
+                 integral[y1 + 1, x0] + integral[y0, x0])
+        count = (y1 - y0 + 1) * (x1 - x0 + 1)
+        scores[aligned] = np.where(count > 0, total / np.maximum(count, 1), 0)
+        return scores
+
     def unclip(self, box, unclip_ratio):
         poly = Polygon(box)
         distance = poly.area * unclip_ratio / poly.length
@@ -236,13 +353,16 @@ class DBPostProcess(object):
             if self.box_type == 'poly':
                 boxes, scores = self.polygons_from_bitmap(pred[batch_index],
                                                           mask, src_w, src_h)
+            elif self.box_type == 'quad' and self.box_engine == 'fast':
+                boxes, scores = self.boxes_from_bitmap_fast(
+                    pred[batch_index], mask, src_w, src_h)
             elif self.box_type == 'quad':
                 boxes, scores = self.boxes_from_bitmap(pred[batch_index], mask,
                                                        src_w, src_h)
             else:
                 raise ValueError("box_type can only be one of ['quad', 'poly']")
 
-            boxes_batch.append({'points': boxes})
+            boxes_batch.append({'points': boxes, 'scores': scores})
         return boxes_batch
 
 
@@ -257,6 +377,7 @@ class DistillationDBPostProcess(object):
                  use_dilation=False,
                  score_mode="fast",
                  box_type='quad',
+                 box_engine='legacy',
                  **kwargs):
         self.model_name = model_name
         self.key = key
@@ -267,7 +388,8 @@ class DistillationDBPostProcess(object):
             unclip_ratio=unclip_ratio,
             use_dilation=use_dilation,
             score_mode=score_mode,
-            box_type=box_type)
+            box_type=box_type,
+            box_engine=box_engine)
 
     def __call__(self, predicts, shape_list):
         results = {}
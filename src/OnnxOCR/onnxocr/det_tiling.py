@@ -0,0 +1,166 @@
+import math
+import cv2
+import numpy as np
+
+
+def tile_extent(length, tile_size):
+    """
+    单个方向上的切块长度: 不超过 2 * tile_size 时整边作为一块 (补齐到 32 的倍数),
+    避免 1080 宽的长截图被竖着切开; 否则按 tile_size 切
+    """
+    padded = int(math.ceil(length / 32.0) * 32)
+    return padded if padded <= 2 * tile_size else int(tile_size)
+
+
+def tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    stride = max(tile - overlap, 32)
+    # 最后一块与边缘对齐, 保证完整覆盖
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def axis_cores(starts, tile, length):
+    """
+    相邻两块以重叠区的中线为界, 每块负责的核心区间
+    """
+    cores = []
+    for i, start in enumerate(starts):
+        core0 = 0 if i == 0 else (start + starts[i - 1] + tile) / 2.0
+        core1 = length if i == len(starts) - 1 else (starts[i + 1] + start + tile) / 2.0
+        cores.append((core0, core1))
+    return cores
+
+
+def plan_tiles(img_h, img_w, tile_size, overlap):
+    """
+    按原始分辨率把图片切成大小相同、相互重叠的块
+    return(tuple):
+        tile_h, tile_w, 每块的 (y, x, 核心区域 (top, left, bottom, right)) 列表
+    """
+    tile_h = tile_extent(img_h, tile_size)
+    tile_w = tile_extent(img_w, tile_size)
+    ys = tile_starts(img_h, tile_h, overlap)
+    xs = tile_starts(img_w, tile_w, overlap)
+    tiles = [
+        (y, x, (cy0, cx0, cy1, cx1))
+        for y, (cy0, cy1) in zip(ys, axis_cores(ys, tile_h, img_h))
+        for x, (cx0, cx1) in zip(xs, axis_cores(xs, tile_w, img_w))
+    ]
+    return tile_h, tile_w, tiles
+
+
+def box_bounds(boxes):
+    """
+    每个框的 [left, top, right, bottom], 支持点数不同的多边形
+    """
+    bounds = np.zeros((len(boxes), 4), dtype=np.float64)
+    for i, box in enumerate(boxes):
+        points = np.asarray(box, dtype=np.float64).reshape(-1, 2)
+        bounds[i, :2] = points.min(axis=0)
+        bounds[i, 2:] = points.max(axis=0)
+    return bounds
+
+
+def truncated_mask(bounds, tile_box, img_h, img_w, margin):
+    """
+    框是否贴着块的内部边缘 (不是图片边缘), 即可能被块边界截断
+    """
+    y0, x0, y1, x1 = tile_box
+    mask = np.zeros(len(bounds), dtype=bool)
+    if x0 > 0:
+        mask |= bounds[:, 0] <= x0 + margin
+    if y0 > 0:
+        mask |= bounds[:, 1] <= y0 + margin
+    if x1 < img_w:
+        mask |= bounds[:, 2] >= x1 - margin
+    if y1 < img_h:
+        mask |= bounds[:, 3] >= y1 - margin
+    return mask
+
+
+def outside_core(bounds, core):
+    """
+    框完全落在核心区域之外, 即完全位于相邻块负责的那半个重叠区内, 相邻块能看到完整的框
+    """
+    top, left, bottom, right = core
+    return (
+        (bounds[:, 2] <= left)
+        | (bounds[:, 0] >= right)
+        | (bounds[:, 3] <= top)
+        | (bounds[:, 1] >= bottom)
+    )
+
+
+def interval_iou(a0, a1, b0, b1):
+    inter = np.maximum(np.minimum(a1, b1) - np.maximum(a0, b0), 0)
+    union = np.maximum(a1, b1) - np.minimum(a0, b0)
+    return inter / np.maximum(union, 1e-6)
+
+
+def merge_tile_boxes(boxes, scores, truncated, merge_thresh):
+    """
+    合并各块的检测结果:
+        1. 完整的框优先, 面积大的优先
+        2. 与已保留框的交集占较小框面积超过 merge_thresh 时视为重复, 丢弃
+        3. 两个都被截断、在一个方向上对齐且另一个方向相接的框, 视为同一行的两段, 合并为外接矩形,
+           得分取两段中较高的
+    return(tuple):
+        合并后的框和对应的得分
+    """
+    if len(boxes) == 0:
+        return [], []
+    bounds = box_bounds(boxes)
+    areas = np.maximum(bounds[:, 2] - bounds[:, 0], 1) * np.maximum(
+        bounds[:, 3] - bounds[:, 1], 1
+    )
+    order = sorted(range(len(boxes)), key=lambda i: (truncated[i], -areas[i]))
+
+    kept_boxes, kept_scores, kept_trunc = [], [], []
+    kept_bounds = np.zeros((len(boxes), 4), dtype=np.float64)
+    for i in order:
+        num = len(kept_boxes)
+        l, t, r, b = bounds[i]
+        kb = kept_bounds[:num]
+        iw = np.minimum(kb[:, 2], r) - np.maximum(kb[:, 0], l)
+        ih = np.minimum(kb[:, 3], b) - np.maximum(kb[:, 1], t)
+        inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+        kept_areas = (kb[:, 2] - kb[:, 0]).clip(1) * (kb[:, 3] - kb[:, 1]).clip(1)
+        ios = inter / np.minimum(kept_areas, areas[i])
+
+        target = None
+        if truncated[i]:
+            # 同一行的两段: 一个方向对齐, 另一个方向的重叠不小于行高 (或列宽) 的一半,
+            # 相邻两行只在边缘相接, 不会被合并
+            min_h = np.minimum(kb[:, 3] - kb[:, 1], b - t)
+            min_w = np.minimum(kb[:, 2] - kb[:, 0], r - l)
+            row_joined = (interval_iou(kb[:, 1], kb[:, 3], t, b) >= merge_thresh) & (
+                iw >= 0.5 * min_h
+            )
+            col_joined = (interval_iou(kb[:, 0], kb[:, 2], l, r) >= merge_thresh) & (
+                ih >= 0.5 * min_w
+            )
+            joined = np.array(kept_trunc[:num], dtype=bool) & (row_joined | col_joined)
+            candidates = np.nonzero(joined)[0]
+            if len(candidates):
+                target = candidates[0]
+        if target is not None:
+            points = np.concatenate(
+                [
+                    np.asarray(kept_boxes[target], dtype=np.float32).reshape(-1, 2),
+                    np.asarray(boxes[i], dtype=np.float32).reshape(-1, 2),
+                ]
+            )
+            merged = cv2.boxPoints(cv2.minAreaRect(points))
+            kept_boxes[target] = merged
+            kept_scores[target] = max(kept_scores[target], scores[i])
+            kept_bounds[target, :2] = np.minimum(kept_bounds[target, :2], bounds[i, :2])
+            kept_bounds[target, 2:] = np.maximum(kept_bounds[target, 2:], bounds[i, 2:])
+            continue
+        if num and ios.max() > merge_thresh:
+            continue
+        kept_boxes.append(boxes[i])
+        kept_scores.append(scores[i])
+        kept_trunc.append(bool(truncated[i]))
+        kept_bounds[num] = bounds[i]
+    return kept_boxes, kept_scores
@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+import threading
+from .providers import requested_providers
+
+logger = logging.getLogger(__name__)
+
+
+def process_rss(pid=None):
+    """
+    进程当前的常驻内存 (字节), 读取 /proc, 其他平台返回 None
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ModelRegistry(object):
+    """
+    进程内共享的模型实例表, 同一个 key 只加载一次, 按引用计数释放
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        # 正在加载的 key -> {"done": Event, "error": 异常}, 同一个 key 并发 acquire 时只加载一次
+        self._loading = {}
+        self._loads_started = 0
+
+    def acquire(self, key, factory, on_release=None):
+        """
+        返回 key 对应的共享实例, 不存在时调用 factory() 创建
+        factory() 在全局锁之外执行, 加载一个模型不会阻塞其他 key 的 acquire / release
+        :param key: 可哈希的 key
+        :param factory: 无参构造函数
+        :param on_release: 引用计数归零时以实例为参数调用, 用于释放进程、共享内存等资源
+        :return: 实例
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["refcount"] += 1
+                    logger.info(
+                        f"Reusing shared model {key[0]}: {key[1]} "
+                        f"(refcount {entry['refcount']})"
+                    )
+                    return entry["instance"]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = {"done": threading.Event(), "error": None}
+                    self._loading[key] = loading
+                    self._loads_started += 1
+                    loads_started = self._loads_started
+                    overlapped = len(self._loading) > 1
+                    break
+            # 其他线程正在加载同一个 key, 等它完成后复用
+            loading["done"].wait()
+            if loading["error"] is not None:
+                raise loading["error"]
+
+        try:
+            # 记录加载前后的 RSS 之差; 它不是模型的实际占用: 重新加载时分配器复用已释放的页, 差值接近 0,
+            # 预热时 arena 的增长另由 add_warmup_rss 记录; 与其他模型同时加载时无法区分, 记为 None
+            rss_before = process_rss()
+            instance = factory()
+            rss_after = process_rss()
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+            loading["error"] = e
+            loading["done"].set()
+            raise
+        with self._lock:
+            overlapped = (
+                overlapped or len(self._loading) > 1 or self._loads_started != loads_started
+            )
+            rss = None
+            if rss_before is not None and rss_after is not None and not overlapped:
+                rss = max(rss_after - rss_before, 0)
+            self._entries[key] = {
+                "instance": instance,
+                "refcount": 1,
+                "on_release": on_release,
+                "load_rss_delta": rss,
+                "warmup_rss_delta": None,
+                "loaded_at": time.time(),
+            }
+            del self._loading[key]
+        loading["done"].set()
+        rss_info = f" (RSS +{rss / 2 ** 20:.1f} MB while loading)" if rss is not None else ""
+        logger.info(f"Loaded shared model {key[0]}: {key[1]}{rss_info}")
+        return instance
+
+    def release(self, key):
+        """
+        引用计数减一, 归零时从表中移除, 实例随之被回收
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["refcount"] -= 1
+            if entry["refcount"] > 0:
+                return
+            del self._entries[key]
+        # 关闭进程池等可能较慢, 在锁外执行
+        if entry["on_release"] is not None:
+            entry["on_release"](entry["instance"])
+        logger.info(f"Released shared model {key[0]}: {key[1]}")
+
+    def add_warmup_rss(self, key, rss):
+        """
+        记录该模型预热前后的 RSS 之差 (arena 等在首次推理时分配的内存), 与加载时的差值分开保存
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and rss is not None:
+                entry["warmup_rss_delta"] = (entry["warmup_rss_delta"] or 0) + max(rss, 0)
+
+    def refcount(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["refcount"] if entry is not None else 0
+
+    def stats(self):
+        with self._lock:
+            return {key: entry["refcount"] for key, entry in self._entries.items()}
+
+    def memory_report(self):
+        """
+        各共享模型加载和预热时测得的进程 RSS 增量, 只能粗略反映内存变化, 不是模型的实际占用
+        return:
+            [{"model", "path", "refcount", "load_rss_delta", "warmup_rss_delta", "loaded_at"}],
+            增量单位为字节, 无法测量时为 None
+        """
+        with self._lock:
+            return [
+                {
+                    "model": key[0],
+                    "path": key[1],
+                    "refcount": entry["refcount"],
+                    "load_rss_delta": entry["load_rss_delta"],
+                    "warmup_rss_delta": entry["warmup_rss_delta"],
+                    "loaded_at": entry["loaded_at"],
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
+def get_providers(args):
+    providers = requested_providers(args)
+    return providers if providers == "auto" else tuple(providers)
+
+
+# 预测器读取的参数: 以 det_/rec_/cls_ 开头的参数 + 下面列出的参数
+ENGINE_ARG_KEYS = (
+    "use_gpu",
+    "ir_optim",
+    "cpu_threads",
+    "inter_op_num_threads",
+    "graph_optimization_level",
+    "execution_mode",
+    "enable_cpu_mem_arena",
+    "enable_mem_pattern",
+    "intra_op_thread_affinity",
+    "enable_mkldnn",
+    "providers",
+    "provider_options",
+)
+PREDICTOR_ARG_KEYS = {
+    "det": ("use_dilation",),
+    "rec": ("use_space_char", "max_text_length"),
+    "cls": ("label_list",),
+}
+
+
+def predictor_key(model_type, model_dir, args):
+    """
+    共享 key: 模型类型 + 模型路径 + provider + 该预测器用到的参数,
+    参数不同的实例不会误用同一个预测器
+    """
+    prefix = model_type + "_"
+    extra_keys = ENGINE_ARG_KEYS + PREDICTOR_ARG_KEYS.get(model_type, ())
+    fingerprint = tuple(
+        sorted(
+            (k, repr(v))
+            for k, v in vars(args).items()
+            if k.startswith(prefix) or k in extra_keys
+        )
+    )
+    return (
+        model_type,
+        os.path.abspath(model_dir),
+        get_providers(args),
+        fingerprint,
+    )
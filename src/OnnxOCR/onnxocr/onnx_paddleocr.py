@@ -24,8 +24,10 @@ class ONNXPaddleOcr(TextSystem):
 
         # Initialize model
         super().__init__(params)
+        if params.warmup:
+            self.start_warmup()
 
-    def ocr(self, img, det=True, rec=True, cls=True):
+    def ocr(self, img, det=True, rec=True, cls=True, info=None):
         if cls == True and self.use_angle_cls == False:
             print(
                 "Since the angle classifier is not initialized, the angle classifier will not be used during the forward process"
@@ -33,7 +35,7 @@ class ONNXPaddleOcr(TextSystem):
 
         if det and rec:
             ocr_res = []
-            dt_boxes, rec_res = self.__call__(img, cls)
+            dt_boxes, rec_res = self.__call__(img, cls, info)
             tmp_res = [[box.tolist(), res] for box, res in zip(dt_boxes, rec_res)]
             ocr_res.append(tmp_res)
             return ocr_res
@@ -60,6 +62,19 @@ class ONNXPaddleOcr(TextSystem):
                 return cls_res
             return ocr_res
 
+    def ocr_batch(self, images, cls=True):
+        """
+        多张图片一起检测识别, 返回与 images 一一对应的 ocr() 结果
+        """
+        ocr_res = []
+        for dt_boxes, rec_res in self.ocr_many(images, cls):
+            if dt_boxes is None:
+                ocr_res.append([None])
+                continue
+            tmp_res = [[box.tolist(), res] for box, res in zip(dt_boxes, rec_res)]
+            ocr_res.append([tmp_res])
+        return ocr_res
+
 
 def sav2Img(org_img, result, name="draw_ocr.jpg"):
     # 显示结果
@@ -2,6 +2,19 @@ import numpy as np
 import cv2
 import sys
 import math
+import threading
+from PIL import Image
+
+
+def parse_scale(scale):
+    """ parse scale configs such as "1./255." without eval
+    """
+    if not isinstance(scale, str):
+        return scale
+    value = 1.0
+    for i, part in enumerate(scale.split('/')):
+        value = float(part) if i == 0 else value / float(part)
+    return value
 
 
 class NormalizeImage(object):
@@ -10,7 +23,7 @@ class NormalizeImage(object):
 
     def __init__(self, scale=None, mean=None, std=None, order='chw', **kwargs):
         if isinstance(scale, str):
-            scale = eval(scale)
+            scale = parse_scale(scale)
         self.scale = np.float32(scale if scale is not None else 1.0 / 255.0)
         mean = mean if mean is not None else [0.485, 0.456, 0.406]
         std = std if std is not None else [0.229, 0.224, 0.225]
@@ -21,7 +34,6 @@ class NormalizeImage(object):
 
     def __call__(self, data):
         img = data['image']
-        from PIL import Image
         if isinstance(img, Image.Image):
             img = np.array(img)
         assert isinstance(img,
@@ -53,21 +65,25 @@ class DetResizeForTest(object):
 
     def __call__(self, data):
         img = data['image']
+        src_h, src_w, _ = img.shape
+        img, [ratio_h, ratio_w] = self.resize(img)
+        data['image'] = img
+        data['shape'] = np.array([src_h, src_w, ratio_h, ratio_w])
+        return data
+
+    def resize(self, img):
         src_h, src_w, _ = img.shape
         if sum([src_h, src_w]) < 64:
             img = self.image_padding(img)
 
         if self.resize_type == 0:
             # img, shape = self.resize_image_type0(img)
-            img, [ratio_h, ratio_w] = self.resize_image_type0(img)
+            return self.resize_image_type0(img)
         elif self.resize_type == 2:
-            img, [ratio_h, ratio_w] = self.resize_image_type2(img)
+            return self.resize_image_type2(img)
         else:
             # img, shape = self.resize_image_type1(img)
-            img, [ratio_h, ratio_w] = self.resize_image_type1(img)
-        data['image'] = img
-        data['shape'] = np.array([src_h, src_w, ratio_h, ratio_w])
-        return data
+            return self.resize_image_type1(img)
 
     def image_padding(self, im, value=0):
         h, w, c = im.shape
@@ -160,6 +176,51 @@ class DetResizeForTest(object):
 
         return img, [ratio_h, ratio_w]
 
+class DetResizeNormalize(DetResizeForTest):
+    """ fused DetResizeForTest + NormalizeImage + ToCHWImage + KeepKeys(['image', 'shape'])
+
+    resizes the uint8 image, then maps every pixel through a precomputed
+    per-channel lookup table straight into a reusable float32 CHW buffer.
+    the returned image is only valid until the next call in the same thread.
+    """
+
+    def __init__(self, scale=None, mean=None, std=None, **kwargs):
+        super(DetResizeNormalize, self).__init__(**kwargs)
+        scale = parse_scale(scale) if scale is not None else 1.0 / 255.0
+        mean = np.array(mean if mean is not None else [0.485, 0.456, 0.406])
+        std = np.array(std if std is not None else [0.229, 0.224, 0.225])
+        values = np.arange(256, dtype=np.float64)[None, :]
+        self.lut = ((values * scale - mean[:, None]) / std[:, None]).astype('float32')
+        self._local = threading.local()
+
+    def get_buffer(self, shape):
+        buf = getattr(self._local, 'buf', None)
+        size = int(np.prod(shape))
+        if buf is None or buf.size < size:
+            buf = np.empty(size, dtype=np.float32)
+            self._local.buf = buf
+        return buf[:size].reshape(shape)
+
+    def __call__(self, data):
+        img = data['image']
+        if isinstance(img, Image.Image):
+            img = np.array(img)
+        src_h, src_w, _ = img.shape
+        img, [ratio_h, ratio_w] = self.resize(img)
+        if img is None:
+            return None
+        h, w, c = img.shape
+        out = self.normalize_into(img, self.get_buffer((c, h, w)))
+        return [out, np.array([src_h, src_w, ratio_h, ratio_w])]
+
+    def normalize_into(self, img, out):
+        """ normalize uint8 HWC img into the top-left corner of a float32 CHW out """
+        h, w = img.shape[:2]
+        for ch in range(img.shape[2]):
+            np.take(self.lut[ch], img[:, :, ch], out=out[ch, :h, :w], mode='clip')
+        return out
+
+
 class ToCHWImage(object):
     """ convert hwc image to chw image
     """
@@ -169,7 +230,6 @@ class ToCHWImage(object):
 
     def __call__(self, data):
         img = data['image']
-        from PIL import Image
         if isinstance(img, Image.Image):
             img = np.array(img)
         data['image'] = img.transpose((2, 0, 1))
@@ -0,0 +1,109 @@
+import os
+import hashlib
+import logging
+import platform
+import tempfile
+import onnxruntime
+
+logger = logging.getLogger(__name__)
+
+# 缓存时最多做到 extended 级别的优化: all 级别的 NCHWc 布局转换与 CPU 指令集相关,
+# 留到加载时再做
+SAVE_OPT_LEVEL = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+
+
+def save_level(opt_level):
+    if int(opt_level) > int(SAVE_OPT_LEVEL):
+        return SAVE_OPT_LEVEL
+    return opt_level
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(model_path, providers, opt_level, provider_options=None):
+    """
+    模型内容 + onnxruntime 版本 + provider 及其选项 + 优化级别 + 机器架构, 任一变化都会换一个缓存文件
+    """
+    key = "|".join(
+        [
+            file_digest(model_path),
+            onnxruntime.__version__,
+            ",".join(providers),
+            repr(provider_options or []),
+            str(int(save_level(opt_level))),
+            platform.machine(),
+        ]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()[:24]
+
+
+def cached_model_path(model_path, cache_dir, providers, opt_level, provider_options=None):
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    key = cache_key(model_path, providers, opt_level, provider_options)
+    return os.path.join(cache_dir, f"{name}-{key}.ort")
+
+
+def save_options(sess_options, path):
+    """
+    复制一份 SessionOptions, 创建 session 时把优化后的图以 ORT 格式写到 path
+    """
+    options = onnxruntime.SessionOptions()
+    for attr in (
+        "intra_op_num_threads",
+        "inter_op_num_threads",
+        "execution_mode",
+        "enable_cpu_mem_arena",
+        "enable_mem_pattern",
+    ):
+        setattr(options, attr, getattr(sess_options, attr))
+    options.graph_optimization_level = save_level(sess_options.graph_optimization_level)
+    options.optimized_model_filepath = path
+    options.add_session_config_entry("session.save_model_format", "ORT")
+    return options
+
+
+def load_cached_session(model_path, cache_dir, sess_options, providers, provider_options=None):
+    """
+    优先加载缓存的 ORT 格式模型, 没有缓存时优化原模型并写入缓存;
+    缓存不可用 (损坏、版本不匹配等) 时删除缓存并回退到原模型
+    """
+    if sess_options is None:
+        sess_options = onnxruntime.SessionOptions()
+    opt_level = sess_options.graph_optimization_level
+    path = cached_model_path(model_path, cache_dir, providers, opt_level, provider_options)
+    session_kwargs = dict(providers=providers, provider_options=provider_options)
+    if os.path.exists(path):
+        try:
+            session = onnxruntime.InferenceSession(path, sess_options, **session_kwargs)
+            logger.info(f"Loaded cached optimized model {path}")
+            return session
+        except Exception as e:
+            logger.warning(f"Cached model {path} could not be loaded, rebuilding: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # 先写临时文件再改名, 并发启动的进程不会读到写了一半的缓存
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".ort.tmp")
+    os.close(fd)
+    try:
+        onnxruntime.InferenceSession(
+            model_path, save_options(sess_options, tmp_path), **session_kwargs
+        )
+        os.replace(tmp_path, path)
+        logger.info(f"Cached optimized model {model_path} -> {path}")
+        return onnxruntime.InferenceSession(path, sess_options, **session_kwargs)
+    except Exception as e:
+        logger.warning(f"Failed to cache optimized model {model_path}: {e}")
+        return onnxruntime.InferenceSession(model_path, sess_options, **session_kwargs)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
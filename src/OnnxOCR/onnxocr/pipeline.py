@@ -0,0 +1,168 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("det", "crop", "cls", "rec")
+
+
+class _Job(object):
+    __slots__ = ("img", "cls", "info", "future", "dt_boxes", "crops", "rec_res")
+
+    def __init__(self, img, cls, info):
+        self.img = img
+        self.cls = cls
+        self.info = info
+        self.future = Future()
+        self.dt_boxes = None
+        self.crops = None
+        self.rec_res = None
+
+
+class StageStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+
+    def record(self, busy):
+        with self.lock:
+            self.processed += 1
+            self.busy_time += busy
+
+
+class OCRPipeline(object):
+    """
+    流水线模式: det / crop / cls / rec 各占一个线程, 阶段之间用有界队列连接,
+    下一张图片的检测与当前图片的识别重叠执行 (onnxruntime 在 session.run 期间释放 GIL)
+    每个预测器只在自己的阶段线程中使用
+
+    args:
+        text_system(TextSystem): 提供预测器和裁剪、阅读顺序、过滤逻辑
+        queue_size(int): 每个阶段输入队列的长度, 队列满时 submit 阻塞
+    """
+
+    def __init__(self, text_system, queue_size=4):
+        self.text_system = text_system
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in STAGES}
+        self.stage_stats = {name: StageStats() for name in STAGES}
+        self.handlers = {
+            "det": self.run_det,
+            "crop": self.run_crop,
+            "cls": self.run_cls,
+            "rec": self.run_rec,
+        }
+        self.start_time = time.time()
+        self.threads = []
+        for name in STAGES:
+            thread = threading.Thread(
+                target=self.stage_loop, args=(name,), name=f"ocr-{name}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, img, cls=True, info=None):
+        """
+        提交一张图片, 返回 Future, 结果与 TextSystem.__call__ 相同: (dt_boxes, rec_res),
+        info 在 Future 完成前写入
+        """
+        job = _Job(img, cls, info)
+        self.put("det", job)
+        return job.future
+
+    def __call__(self, img, cls=True, info=None):
+        return self.submit(img, cls, info).result()
+
+    def put(self, name, job):
+        q = self.queues[name]
+        q.put(job)
+        stats = self.stage_stats[name]
+        with stats.lock:
+            stats.max_depth = max(stats.max_depth, q.qsize())
+
+    def stage_loop(self, name):
+        q = self.queues[name]
+        handler = self.handlers[name]
+        next_stage = STAGES.index(name) + 1
+        while True:
+            job = q.get()
+            if job is None:
+                # 把结束信号传给下一个阶段
+                if next_stage < len(STAGES):
+                    self.put(STAGES[next_stage], None)
+                return
+            # 进入第一个阶段时标记为运行中, 此后 Future 不能再被取消; 已取消的任务直接丢弃
+            if name == STAGES[0] and not job.future.set_running_or_notify_cancel():
+                continue
+            if job.future.done():
+                continue
+            start = time.time()
+            try:
+                done = handler(job)
+            except Exception as e:
+                logger.error(f"OCR pipeline stage {name} failed: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+                done = True
+            self.stage_stats[name].record(time.time() - start)
+            if not done:
+                self.put(STAGES[next_stage], job)
+
+    # 每个阶段返回 True 表示该图片已完成, 不再进入后续阶段
+    def run_det(self, job):
+        system = self.text_system
+        dt_boxes, det_scores = system.text_detector.detect(job.img, job.info)
+        if dt_boxes is None:
+            job.future.set_result((None, None))
+            return True
+        job.dt_boxes = system.prefilter_boxes(dt_boxes, det_scores, job.info)
+        return False
+
+    def run_crop(self, job):
+        job.crops = self.text_system.crop_images(job.img, job.dt_boxes, job.info)
+        # 原图不再需要, 尽早释放
+        job.img = None
+        return False
+
+    def run_cls(self, job):
+        system = self.text_system
+        if system.use_angle_cls and job.cls:
+            job.crops, _ = system.text_classifier(job.crops)
+        return False
+
+    def run_rec(self, job):
+        rec_res = self.text_system.text_recognizer(job.crops, job.info)
+        dt_boxes, rec_res = self.text_system.filter_results(job.dt_boxes, rec_res)
+        job.future.set_result(self.text_system.order_results(dt_boxes, rec_res, job.info))
+        return True
+
+    def stats(self):
+        """
+        各阶段的当前队列长度、最大队列长度、处理数量、平均耗时和利用率 (忙碌时间 / 运行时间),
+        利用率最高的阶段即瓶颈
+        """
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        result = {}
+        for name in STAGES:
+            stats = self.stage_stats[name]
+            with stats.lock:
+                result[name] = {
+                    "queue_depth": self.queues[name].qsize(),
+                    "max_queue_depth": stats.max_depth,
+                    "processed": stats.processed,
+                    "avg_time": stats.busy_time / stats.processed if stats.processed else 0.0,
+                    "utilization": stats.busy_time / elapsed,
+                }
+        return result
+
+    def close(self):
+        """
+        处理完已提交的图片后停止各阶段线程
+        """
+        self.put("det", None)
+        for thread in self.threads:
+            thread.join()
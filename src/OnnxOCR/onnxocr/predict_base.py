@@ -1,17 +1,207 @@
+import cv2
+import time
+import logging
+import threading
+import numpy as np
 import onnxruntime
+from .ort_cache import load_cached_session
+from .providers import select_providers
+
+logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+SESSION_OPTION_KEYS = (
+    "intra_op_num_threads",
+    "inter_op_num_threads",
+    "graph_optimization_level",
+    "execution_mode",
+    "enable_cpu_mem_arena",
+    "enable_mem_pattern",
+    "intra_op_thread_affinity",
+)
+
+
+class BatchBufferPool(object):
+    """
+    batch 输入缓冲区: 每个线程持有一块 float32 内存, 不够时才扩容,
+    按需 reshape 成 (N, C, H, W) 复用, 避免每个 batch 重新分配和拼接
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, shape):
+        size = int(np.prod(shape))
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.size < size:
+            buf = np.empty(size, dtype=np.float32)
+            self._local.buf = buf
+        return buf[:size].reshape(shape)
+
+
+def resize_norm_into(img, out, resized_w):
+    """
+    把 uint8 HWC 图片缩放到 (resized_w, H) 后直接写入 out (C, H, W),
+    就地完成 (x / 255 - 0.5) / 0.5 归一化, 右侧补 0
+    """
+    imgH = out.shape[1]
+    resized_image = cv2.resize(img, (resized_w, imgH))
+    valid = out[:, :, :resized_w]
+    np.multiply(
+        resized_image.transpose((2, 0, 1)), np.float32(2.0 / 255.0), out=valid
+    )
+    valid -= np.float32(1.0)
+    out[:, :, resized_w:] = 0
+    return out
+
 
 class PredictBase(object):
+    # 是否已预热, 共享的预测器只预热一次
+    warmed_up = False
+
     def __init__(self):
         pass
 
-    def get_onnx_session(self, model_dir, use_gpu):
-        # 使用gpu
-        if use_gpu:
-            providers = providers=['CUDAExecutionProvider']
-        else:
-            providers = providers = ['CPUExecutionProvider']
+    def warmup_shapes(self):
+        """
+        预热和 provider 测速使用的输入形状, 由各预测器给出
+        """
+        return []
+
+    def warmup_session(self, onnx_session, input_name, output_name, shapes):
+        """
+        用全零输入依次按 shapes 跑一遍 session, 提前完成 onnxruntime 的内核选择和内存池扩容
+        :return: 耗时 (秒)
+        """
+        start = time.time()
+        for shape in shapes:
+            dummy = np.zeros(shape, dtype=np.float32)
+            onnx_session.run(output_name, input_feed=self.get_input_feed(input_name, dummy))
+        self.warmed_up = True
+        return time.time() - start
+
+    def get_session_config(self, args, model_type):
+        """
+        全局配置(args)叠加模型级配置(args.<model_type>_session_options)
+        :param args: infer_args 参数
+        :param model_type: det / rec / cls
+        :return: dict, key 见 SESSION_OPTION_KEYS
+        """
+        config = {
+            "intra_op_num_threads": args.cpu_threads,
+            "inter_op_num_threads": args.inter_op_num_threads,
+            "graph_optimization_level": (
+                args.graph_optimization_level if args.ir_optim else "disable"
+            ),
+            "execution_mode": args.execution_mode,
+            "enable_cpu_mem_arena": args.enable_cpu_mem_arena,
+            "enable_mem_pattern": args.enable_mem_pattern,
+            "intra_op_thread_affinity": args.intra_op_thread_affinity,
+        }
+        overrides = getattr(args, "{}_session_options".format(model_type), None) or {}
+        for key, value in overrides.items():
+            if key not in SESSION_OPTION_KEYS:
+                raise ValueError(
+                    "Unknown {} session option: {}, expected one of {}".format(
+                        model_type, key, SESSION_OPTION_KEYS
+                    )
+                )
+            if value is not None:
+                config[key] = value
+        return config
+
+    def get_session_options(self, args, model_type):
+        """
+        根据配置构建 onnxruntime.SessionOptions, 并打印实际生效的配置
+        """
+        config = self.get_session_config(args, model_type)
+
+        opt_level = str(config["graph_optimization_level"]).lower()
+        if opt_level not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(
+                "graph_optimization_level must be one of {}, but got: {}".format(
+                    list(GRAPH_OPTIMIZATION_LEVELS), opt_level
+                )
+            )
+        execution_mode = str(config["execution_mode"]).lower()
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(
+                "execution_mode must be one of {}, but got: {}".format(
+                    list(EXECUTION_MODES), execution_mode
+                )
+            )
+
+        sess_options = onnxruntime.SessionOptions()
+        # 0 表示由 onnxruntime 自行决定线程数
+        sess_options.intra_op_num_threads = max(int(config["intra_op_num_threads"] or 0), 0)
+        sess_options.inter_op_num_threads = max(int(config["inter_op_num_threads"] or 0), 0)
+        sess_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[opt_level]
+        sess_options.execution_mode = EXECUTION_MODES[execution_mode]
+        sess_options.enable_cpu_mem_arena = bool(config["enable_cpu_mem_arena"])
+        sess_options.enable_mem_pattern = bool(config["enable_mem_pattern"])
+        if config["intra_op_thread_affinity"]:
+            # 格式如 "1;2;3", 每个 intra-op 线程(主线程除外)一组逻辑核
+            sess_options.add_session_config_entry(
+                "session.intra_op_thread_affinities",
+                str(config["intra_op_thread_affinity"]),
+            )
+
+        logger.info(
+            f"{model_type} session options: "
+            f"intra_op_num_threads={sess_options.intra_op_num_threads}, "
+            f"inter_op_num_threads={sess_options.inter_op_num_threads}, "
+            f"graph_optimization_level={opt_level}, "
+            f"execution_mode={execution_mode}, "
+            f"enable_cpu_mem_arena={sess_options.enable_cpu_mem_arena}, "
+            f"enable_mem_pattern={sess_options.enable_mem_pattern}, "
+            f"intra_op_thread_affinity={config['intra_op_thread_affinity'] or 'none'}"
+        )
+        return sess_options
+
+    def get_onnx_session(
+        self,
+        model_dir,
+        use_gpu,
+        sess_options=None,
+        cache_dir=None,
+        providers=None,
+        provider_options=None,
+        model_type="",
+    ):
+        """
+        :param providers: 按优先级排列的 provider 列表, 或 "auto" (测速选择最快的 CPU provider);
+            为空时按 use_gpu 选择 CUDA 或 CPU. 不可用的 provider 被跳过, 总以 CPU 兜底
+        :param provider_options: {provider: 选项 dict}
+        """
+        if providers is None:
+            # 使用gpu
+            providers = ["CUDAExecutionProvider"] if use_gpu else ["CPUExecutionProvider"]
+        providers, options = select_providers(
+            model_type or model_dir,
+            model_dir,
+            providers,
+            sess_options,
+            self.warmup_shapes()[:1] if providers == "auto" else [],
+            provider_options,
+        )
 
-        onnx_session = onnxruntime.InferenceSession(model_dir, None,providers=providers)
+        if cache_dir:
+            # 优化后的模型缓存为 ORT 格式, 之后启动时直接加载
+            return load_cached_session(model_dir, cache_dir, sess_options, providers, options)
+        onnx_session = onnxruntime.InferenceSession(
+            model_dir, sess_options, providers=providers, provider_options=options
+        )
 
         # print("providers:", onnxruntime.get_device())
         return onnx_session
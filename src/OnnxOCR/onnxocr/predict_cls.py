@@ -1,10 +1,14 @@
 import cv2
-import copy
-import numpy as np
 import math
+import logging
+import threading
+import numpy as np
 
 from .cls_postprocess import ClsPostProcess
-from .predict_base import PredictBase
+from .predict_base import PredictBase, BatchBufferPool, resize_norm_into
+from .providers import requested_providers
+
+logger = logging.getLogger(__name__)
 
 
 class TextClassifier(PredictBase):
@@ -13,9 +17,40 @@ class TextClassifier(PredictBase):
         self.cls_batch_num = args.cls_batch_num
         self.cls_thresh = args.cls_thresh
         self.postprocess_op = ClsPostProcess(label_list=args.label_list)
+        self.batch_buffers = BatchBufferPool()
+
+        # adaptive: 先对少量文本条分类, 整页方向一致时跳过其余文本条
+        self.cls_mode = args.cls_mode
+        if self.cls_mode not in ("full", "adaptive"):
+            raise ValueError(
+                "cls_mode must be full or adaptive, but got: {}".format(self.cls_mode)
+            )
+        self.cls_sample_num = args.cls_sample_num
+        self.cls_adaptive_min_crops = args.cls_adaptive_min_crops
+        self.cls_adaptive_thresh = args.cls_adaptive_thresh
+        self.cls_tall_ratio = args.cls_tall_ratio
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "pages": 0,
+            "full": 0,
+            "precheck_full": 0,
+            "skipped_upright": 0,
+            "rotated_all": 0,
+            "sample_disagree": 0,
+            "crops_classified": 0,
+            "crops_skipped": 0,
+        }
 
         # 初始化模型
-        self.cls_onnx_session = self.get_onnx_session(args.cls_model_dir, args.use_gpu)
+        self.cls_onnx_session = self.get_onnx_session(
+            args.cls_model_dir,
+            args.use_gpu,
+            self.get_session_options(args, "cls"),
+            cache_dir=args.model_cache_dir,
+            providers=requested_providers(args),
+            provider_options=args.provider_options,
+            model_type="cls",
+        )
         self.cls_input_name = self.get_input_name(self.cls_onnx_session)
         self.cls_output_name = self.get_output_name(self.cls_onnx_session)
 
@@ -41,35 +76,72 @@ class TextClassifier(PredictBase):
         padding_im[:, :, 0:resized_w] = resized_image
         return padding_im
 
-    def __call__(self, img_list):
-        img_list = copy.deepcopy(img_list)
-        img_num = len(img_list)
+    def resize_norm_img_into(self, img, out):
+        """
+        与 resize_norm_img 相同, 直接写入 batch 缓冲区中该文本条的位置 out (C, H, W)
+        """
+        imgC, imgH, imgW = out.shape
+        h, w = img.shape[:2]
+        resized_w = min(imgW, int(math.ceil(imgH * w / float(h))))
+        return resize_norm_into(img, out, resized_w)
+
+    def stats(self):
+        """
+        adaptive 模式的统计: 各种决策的页数, 实际分类和跳过的文本条数
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, decision, classified, skipped):
+        with self._stats_lock:
+            self._stats["pages"] += 1
+            self._stats[decision] += 1
+            self._stats["crops_classified"] += classified
+            self._stats["crops_skipped"] += skipped
+
+    def warmup_shapes(self):
+        return [[self.cls_batch_num] + self.cls_image_shape]
+
+    def warmup(self):
+        return self.warmup_session(
+            self.cls_onnx_session,
+            self.cls_input_name,
+            self.cls_output_name,
+            self.warmup_shapes(),
+        )
+
+    def classify(self, img_list, cls_res, index_list):
+        """
+        对 index_list 中的文本条分类, 结果写入 cls_res, 180 度的文本条在 img_list 中原位旋转
+        """
         # Calculate the aspect ratio of all text bars
-        width_list = []
-        for img in img_list:
-            width_list.append(img.shape[1] / float(img.shape[0]))
+        width_list = [
+            img_list[idx].shape[1] / float(img_list[idx].shape[0]) for idx in index_list
+        ]
         # Sorting can speed up the cls process
-        indices = np.argsort(np.array(width_list))
-
-        cls_res = [["", 0.0]] * img_num
+        indices = [index_list[i] for i in np.argsort(np.array(width_list))]
+        img_num = len(indices)
         batch_num = self.cls_batch_num
 
         for beg_img_no in range(0, img_num, batch_num):
 
             end_img_no = min(img_num, beg_img_no + batch_num)
-            norm_img_batch = []
-            max_wh_ratio = 0
-
-            for ino in range(beg_img_no, end_img_no):
-                h, w = img_list[indices[ino]].shape[0:2]
-                wh_ratio = w * 1.0 / h
-                max_wh_ratio = max(max_wh_ratio, wh_ratio)
-            for ino in range(beg_img_no, end_img_no):
-                norm_img = self.resize_norm_img(img_list[indices[ino]])
-                norm_img = norm_img[np.newaxis, :]
-                norm_img_batch.append(norm_img)
-            norm_img_batch = np.concatenate(norm_img_batch)
-            norm_img_batch = norm_img_batch.copy()
+            if self.cls_image_shape[0] == 3:
+                # Resize and normalize each text bar straight into the reused batch buffer
+                norm_img_batch = self.batch_buffers.get(
+                    [end_img_no - beg_img_no] + self.cls_image_shape
+                )
+                for slot, ino in enumerate(range(beg_img_no, end_img_no)):
+                    self.resize_norm_img_into(
+                        img_list[indices[ino]], norm_img_batch[slot]
+                    )
+            else:
+                norm_img_batch = []
+                for ino in range(beg_img_no, end_img_no):
+                    norm_img = self.resize_norm_img(img_list[indices[ino]])
+                    norm_img = norm_img[np.newaxis, :]
+                    norm_img_batch.append(norm_img)
+                norm_img_batch = np.concatenate(norm_img_batch)
 
             input_feed = self.get_input_feed(self.cls_input_name, norm_img_batch)
             outputs = self.cls_onnx_session.run(
@@ -86,4 +158,67 @@ class TextClassifier(PredictBase):
                     img_list[indices[beg_img_no + rno]] = cv2.rotate(
                         img_list[indices[beg_img_no + rno]], 1
                     )
+
+    def sample_indices(self, img_list):
+        """
+        在横向文本条中均匀取样 (竖直的文本条方向判断不可靠), 不足时返回 None
+        """
+        candidates = [
+            idx
+            for idx, img in enumerate(img_list)
+            if img.shape[0] < img.shape[1] * self.cls_tall_ratio
+        ]
+        if len(candidates) < self.cls_sample_num:
+            return None
+        picks = np.linspace(0, len(candidates) - 1, self.cls_sample_num)
+        return sorted({candidates[int(round(p))] for p in picks})
+
+    def __call__(self, img_list):
+        # 旋转时只替换列表元素, 不修改原图, 浅拷贝即可
+        img_list = list(img_list)
+        img_num = len(img_list)
+        cls_res = [["", 0.0]] * img_num
+
+        if self.cls_mode == "full":
+            self.classify(img_list, cls_res, list(range(img_num)))
+            self._count("full", img_num, 0)
+            return img_list, cls_res
+
+        # 整页预检: 文本条太少时取样省不了多少, 竖直文本条过多时整页方向不明确
+        tall_num = sum(
+            img.shape[0] >= img.shape[1] * self.cls_tall_ratio for img in img_list
+        )
+        sample = None
+        if img_num >= self.cls_adaptive_min_crops and tall_num * 2 <= img_num:
+            sample = self.sample_indices(img_list)
+        if sample is None:
+            self.classify(img_list, cls_res, list(range(img_num)))
+            self._count("precheck_full", img_num, 0)
+            return img_list, cls_res
+
+        self.classify(img_list, cls_res, sample)
+        labels = {cls_res[idx][0] for idx in sample}
+        min_score = min(cls_res[idx][1] for idx in sample)
+        sampled = set(sample)
+        rest = [idx for idx in range(img_num) if idx not in sampled]
+        if len(labels) == 1 and min_score >= self.cls_adaptive_thresh:
+            label = labels.pop()
+            # 未单独分类的文本条沿用整页方向, score 为这一判断依据的最低取样置信度
+            for idx in rest:
+                cls_res[idx] = [label, min_score]
+            if "180" in label:
+                for idx in rest:
+                    img_list[idx] = cv2.rotate(img_list[idx], 1)
+                decision = "rotated_all"
+            else:
+                decision = "skipped_upright"
+            self._count(decision, len(sample), len(rest))
+        else:
+            self.classify(img_list, cls_res, rest)
+            decision = "sample_disagree"
+            self._count(decision, img_num, 0)
+        logger.debug(
+            f"cls {decision}: sampled {len(sample)}/{img_num} crops, "
+            f"labels={sorted(labels)}, min score={min_score:.3f}"
+        )
         return img_list, cls_res
@@ -1,31 +1,30 @@
+import cv2
 import numpy as np
 from .imaug import transform, create_operators
 from .db_postprocess import DBPostProcess
-from .predict_base import PredictBase
+from .det_tiling import (
+    plan_tiles,
+    box_bounds,
+    truncated_mask,
+    outside_core,
+    merge_tile_boxes,
+)
+from .operators import DetResizeNormalize
+from .predict_base import PredictBase, BatchBufferPool
+from .providers import requested_providers
 
 
 class TextDetector(PredictBase):
     def __init__(self, args):
         self.args = args
         self.det_algorithm = args.det_algorithm
-        pre_process_list = [
-            {
-                "DetResizeForTest": {
-                    "limit_side_len": args.det_limit_side_len,
-                    "limit_type": args.det_limit_type,
-                }
-            },
-            {
-                "NormalizeImage": {
-                    "std": [0.229, 0.224, 0.225],
-                    "mean": [0.485, 0.456, 0.406],
-                    "scale": "1./255.",
-                    "order": "hwc",
-                }
-            },
-            {"ToCHWImage": None},
-            {"KeepKeys": {"keep_keys": ["image", "shape"]}},
-        ]
+        normalize_params = {
+            "std": [0.229, 0.224, 0.225],
+            "mean": [0.485, 0.456, 0.406],
+            "scale": "1./255.",
+        }
+        self.normalize_params = normalize_params
+        pre_process_list = self.build_preprocess_list(args.det_limit_side_len)
         postprocess_params = {}
         postprocess_params["name"] = "DBPostProcess"
         postprocess_params["thresh"] = args.det_db_thresh
@@ -35,6 +34,7 @@ class TextDetector(PredictBase):
         postprocess_params["use_dilation"] = args.use_dilation
         postprocess_params["score_mode"] = args.det_db_score_mode
         postprocess_params["box_type"] = args.det_box_type
+        postprocess_params["box_engine"] = args.det_db_box_engine
 
         # 实例化预处理操作类
         self.preprocess_op = create_operators(pre_process_list)
@@ -42,11 +42,72 @@ class TextDetector(PredictBase):
         # 实例化后处理操作类
         self.postprocess_op = DBPostProcess(**postprocess_params)
 
+        # 分块检测: 长截图、超大图按原始分辨率切成重叠的块, 批量检测后合并
+        self.det_tile_mode = args.det_tile_mode
+        if self.det_tile_mode not in ("off", "auto", "on"):
+            raise ValueError(
+                "det_tile_mode must be one of off, auto, on, but got: {}".format(
+                    self.det_tile_mode
+                )
+            )
+        self.tile_normalizer = DetResizeNormalize(
+            limit_side_len=args.det_limit_side_len,
+            limit_type=args.det_limit_type,
+            **normalize_params
+        )
+        self.tile_buffers = BatchBufferPool()
+        self.batch_buffers = BatchBufferPool()
+
+        # 多尺度: 先小尺度粗检, 只对小字或低置信度区域做高分辨率重检
+        self.det_scale_mode = args.det_scale_mode
+        if self.det_scale_mode not in ("single", "adaptive"):
+            raise ValueError(
+                "det_scale_mode must be single or adaptive, but got: {}".format(
+                    self.det_scale_mode
+                )
+            )
+        self.coarse_preprocess_op = create_operators(
+            self.build_preprocess_list(args.det_coarse_side_len)
+        )
+
         # 初始化模型
-        self.det_onnx_session = self.get_onnx_session(args.det_model_dir, args.use_gpu)
+        self.det_onnx_session = self.get_onnx_session(
+            args.det_model_dir,
+            args.use_gpu,
+            self.get_session_options(args, "det"),
+            cache_dir=args.model_cache_dir,
+            providers=requested_providers(args),
+            provider_options=args.provider_options,
+            model_type="det",
+        )
         self.det_input_name = self.get_input_name(self.det_onnx_session)
         self.det_output_name = self.get_output_name(self.det_onnx_session)
 
+    def build_preprocess_list(self, limit_side_len):
+        normalize_params = self.normalize_params
+        if self.args.det_fused_preprocess:
+            # 缩放、查表归一化、转 CHW 一次完成
+            return [
+                {
+                    "DetResizeNormalize": dict(
+                        limit_side_len=limit_side_len,
+                        limit_type=self.args.det_limit_type,
+                        **normalize_params
+                    )
+                }
+            ]
+        return [
+            {
+                "DetResizeForTest": {
+                    "limit_side_len": limit_side_len,
+                    "limit_type": self.args.det_limit_type,
+                }
+            },
+            {"NormalizeImage": dict(order="hwc", **normalize_params)},
+            {"ToCHWImage": None},
+            {"KeepKeys": {"keep_keys": ["image", "shape"]}},
+        ]
+
     def order_points_clockwise(self, pts):
         rect = np.zeros((4, 2), dtype="float32")
         s = pts.sum(axis=1)
@@ -64,17 +125,26 @@ class TextDetector(PredictBase):
             points[pno, 1] = int(min(max(points[pno, 1], 0), img_height - 1))
         return points
 
+    def tag_det_box(self, box, img_height, img_width):
+        """
+        排序并裁剪一个 quad 框, 宽或高不超过 3 像素时返回 None
+        """
+        if type(box) is list:
+            box = np.array(box)
+        box = self.order_points_clockwise(box)
+        box = self.clip_det_res(box, img_height, img_width)
+        rect_width = int(np.linalg.norm(box[0] - box[1]))
+        rect_height = int(np.linalg.norm(box[0] - box[3]))
+        if rect_width <= 3 or rect_height <= 3:
+            return None
+        return box
+
     def filter_tag_det_res(self, dt_boxes, image_shape):
         img_height, img_width = image_shape[0:2]
         dt_boxes_new = []
         for box in dt_boxes:
-            if type(box) is list:
-                box = np.array(box)
-            box = self.order_points_clockwise(box)
-            box = self.clip_det_res(box, img_height, img_width)
-            rect_width = int(np.linalg.norm(box[0] - box[1]))
-            rect_height = int(np.linalg.norm(box[0] - box[3]))
-            if rect_width <= 3 or rect_height <= 3:
+            box = self.tag_det_box(box, img_height, img_width)
+            if box is None:
                 continue
             dt_boxes_new.append(box)
         dt_boxes = np.array(dt_boxes_new)
@@ -91,17 +161,154 @@ class TextDetector(PredictBase):
         dt_boxes = np.array(dt_boxes_new)
         return dt_boxes
 
-    def __call__(self, img):
-        ori_im = img.copy()
+    def filter_det_res(self, dt_boxes, scores, image_shape):
+        """
+        按 det_box_type 过滤框, 得分与保留的框一一对应
+        """
+        if self.args.det_box_type == "poly":
+            return self.filter_tag_det_res_only_clip(dt_boxes, image_shape), list(scores)
+        img_height, img_width = image_shape[0:2]
+        dt_boxes_new, scores_new = [], []
+        for box, score in zip(dt_boxes, scores):
+            box = self.tag_det_box(box, img_height, img_width)
+            if box is None:
+                continue
+            dt_boxes_new.append(box)
+            scores_new.append(float(score))
+        return np.array(dt_boxes_new), scores_new
+
+    def warmup_shapes(self):
+        """
+        常见的检测输入: det_limit_side_len 下的方图、竖图和横图 (按 32 对齐),
+        多尺度模式加上粗尺度, 固定分块时加上整个分块 batch
+        """
+        shapes = []
+        side_lens = [self.args.det_limit_side_len]
+        if self.det_scale_mode == "adaptive":
+            side_lens.append(self.args.det_coarse_side_len)
+        for side_len in side_lens:
+            long_side = max(int(round(side_len / 32.0)) * 32, 32)
+            short_side = max(int(round(long_side * 0.75 / 32.0)) * 32, 32)
+            shapes += [
+                (1, 3, long_side, long_side),
+                (1, 3, long_side, short_side),
+                (1, 3, short_side, long_side),
+            ]
+        if self.det_tile_mode == "on":
+            tile = max(int(round(self.args.det_tile_size / 32.0)) * 32, 32)
+            shapes.append((max(int(self.args.det_tile_batch), 1), 3, tile, tile))
+        return shapes
+
+    def warmup(self):
+        return self.warmup_session(
+            self.det_onnx_session,
+            self.det_input_name,
+            self.det_output_name,
+            self.warmup_shapes(),
+        )
+
+    def use_tiles(self, img):
+        """
+        auto 模式只对长截图、长扫描件分块: 长宽比不低于 det_tile_min_aspect,
+        且常规缩放会把图片缩小到 det_tile_max_downscale 以下; 普通照片仍整图缩放检测一次
+        """
+        if self.det_tile_mode == "off":
+            return False
+        if self.det_tile_mode == "on":
+            return True
+        h, w = img.shape[:2]
+        if self.args.det_limit_type != "max" or max(h, w) <= self.args.det_tile_size:
+            return False
+        if max(h, w) < self.args.det_tile_min_aspect * min(h, w):
+            return False
+        ratio = float(self.args.det_limit_side_len) / max(h, w)
+        return ratio < self.args.det_tile_max_downscale
+
+    def tile_overlap(self, img_h, img_w):
+        """
+        块之间的重叠: 文字高度随分辨率增长, 按短边比例放大, 最多为块大小的一半
+        """
+        overlap = max(
+            int(self.args.det_tile_overlap),
+            int(self.args.det_tile_overlap_ratio * min(img_h, img_w)),
+        )
+        return min(overlap, int(self.args.det_tile_size) // 2)
+
+    def detect_tiled(self, img, det_info):
+        """
+        按原始分辨率切成大小相同、相互重叠的块, 每 det_tile_batch 块组成一个 batch 检测,
+        框坐标平移回原图后去重合并; 峰值内存只与块大小和 det_tile_batch 有关
+        det_info: 写入块数、块大小等本次检测的信息
+        """
+        img_h, img_w = img.shape[:2]
+        tile_h, tile_w, tiles = plan_tiles(
+            img_h, img_w, self.args.det_tile_size, self.tile_overlap(img_h, img_w)
+        )
+        batch_num = max(int(self.args.det_tile_batch), 1)
+        boxes, scores, truncated = [], [], []
+        for beg in range(0, len(tiles), batch_num):
+            batch_tiles = tiles[beg : beg + batch_num]
+            batch = self.tile_buffers.get([len(batch_tiles), 3, tile_h, tile_w])
+            # 超出图片的部分补 0, 即归一化后的均值
+            batch.fill(0)
+            for slot, (y, x, _) in enumerate(batch_tiles):
+                self.tile_normalizer.normalize_into(
+                    img[y : y + tile_h, x : x + tile_w], batch[slot]
+                )
+            shape_list = np.array(
+                [[tile_h, tile_w, 1.0, 1.0]] * len(batch_tiles), dtype=np.float64
+            )
+            input_feed = self.get_input_feed(self.det_input_name, batch)
+            outputs = self.det_onnx_session.run(
+                self.det_output_name, input_feed=input_feed
+            )
+            post_result = self.postprocess_op({"maps": outputs[0]}, shape_list)
+            for (y, x, core), result in zip(batch_tiles, post_result):
+                tile_boxes = [
+                    np.asarray(box, dtype=np.float32).reshape(-1, 2) + np.float32([x, y])
+                    for box in result["points"]
+                ]
+                if not tile_boxes:
+                    continue
+                tile_box = (y, x, min(y + tile_h, img_h), min(x + tile_w, img_w))
+                bounds = box_bounds(tile_boxes)
+                tile_truncated = truncated_mask(bounds, tile_box, img_h, img_w, margin=2)
+                # 被截断且整个落在相邻块核心区的框, 由相邻块完整检测
+                keep = ~(tile_truncated & outside_core(bounds, core))
+                boxes += [box for box, k in zip(tile_boxes, keep) if k]
+                scores += [score for score, k in zip(result["scores"], keep) if k]
+                truncated += tile_truncated[keep].tolist()
+        merged, merged_scores = merge_tile_boxes(
+            boxes, scores, truncated, self.args.det_tile_merge_thresh
+        )
+        det_info.update(
+            mode="tiled",
+            tiles=len(tiles),
+            tile_shape=(tile_h, tile_w),
+            overlap=self.tile_overlap(img_h, img_w),
+            raw_boxes=len(boxes),
+            boxes=len(merged),
+        )
+        return merged, merged_scores
+
+    def detect_single(self, img, preprocess_op):
+        """
+        按 preprocess_op 的缩放方式检测一次
+        return(tuple):
+            未过滤的框, 框的得分, 概率图 (H, W), shape (src_h, src_w, ratio_h, ratio_w);
+            预处理失败时返回 None
+        """
         data = {"image": img}
 
-        data = transform(data, self.preprocess_op)
+        data = transform(data, preprocess_op)
+        if data is None:
+            return None
         img, shape_list = data
         if img is None:
-            return None, 0
+            return None
         img = np.expand_dims(img, axis=0)
         shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
+        img = np.ascontiguousarray(img)
 
         input_feed = self.get_input_feed(self.det_input_name, img)
         outputs = self.det_onnx_session.run(self.det_output_name, input_feed=input_feed)
@@ -110,11 +317,247 @@ class TextDetector(PredictBase):
         preds["maps"] = outputs[0]
 
         post_result = self.postprocess_op(preds, shape_list)
-        dt_boxes = post_result[0]["points"]
+        return (
+            post_result[0]["points"],
+            post_result[0]["scores"],
+            outputs[0][0, 0],
+            shape_list[0],
+        )
 
-        if self.args.det_box_type == "poly":
-            dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_im.shape)
+    def refine_regions(self, boxes, pred, shape):
+        """
+        在粗尺度结果中找需要高分辨率重检的区域 (原图坐标 [top, left, bottom, right]):
+        概率图上有响应, 但没有被足够高的框覆盖 (字太小或置信度低)
+        """
+        ratio_h, ratio_w = shape[2], shape[3]
+        bounds = box_bounds(boxes) if len(boxes) else np.zeros((0, 4))
+        # 框高度换算到粗尺度概率图上的像素
+        heights = (bounds[:, 3] - bounds[:, 1]) * ratio_h
+        reliable = bounds[heights >= self.args.det_coarse_min_text_height]
+
+        mask = (pred > self.args.det_coarse_low_thresh).astype(np.uint8)
+        mask = cv2.dilate(mask, np.ones((3, 3), np.uint8), iterations=2)
+        num, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        regions = []
+        for label in range(1, num):
+            x, y, w, h, area = stats[label]
+            if area < self.args.det_coarse_min_region_area:
+                continue
+            top, left = y / ratio_h, x / ratio_w
+            bottom, right = (y + h) / ratio_h, (x + w) / ratio_w
+            # 区域已被可靠的框覆盖
+            centers_x = (reliable[:, 0] + reliable[:, 2]) / 2.0
+            centers_y = (reliable[:, 1] + reliable[:, 3]) / 2.0
+            inside = (
+                (centers_x >= left)
+                & (centers_x <= right)
+                & (centers_y >= top)
+                & (centers_y <= bottom)
+            )
+            covered = (reliable[inside, 2] - reliable[inside, 0]) * (
+                reliable[inside, 3] - reliable[inside, 1]
+            )
+            if covered.sum() >= 0.5 * (bottom - top) * (right - left):
+                continue
+            regions.append([top, left, bottom, right])
+        return regions, heights
+
+    def detect_multiscale(self, img, det_info):
+        """
+        先在 det_coarse_side_len 下检测, 字太小或置信度低的区域再按 det_limit_side_len 重检,
+        小字为主或需要重检的面积过大时整图重检
+        det_info: 写入实际使用的尺度 (coarse / full / refined) 和重检区域数
+        """
+        img_h, img_w = img.shape[:2]
+        result = self.detect_single(img, self.coarse_preprocess_op)
+        if result is None:
+            return None
+        boxes, scores, pred, shape = result
+        regions, heights = self.refine_regions(boxes, pred, shape)
+
+        small_font = len(heights) > 0 and (
+            np.median(heights) < self.args.det_coarse_min_text_height
+        )
+        margin = self.args.det_refine_margin
+        regions = [
+            [
+                int(max(top - margin, 0)),
+                int(max(left - margin, 0)),
+                int(min(bottom + margin, img_h)),
+                int(min(right + margin, img_w)),
+            ]
+            for top, left, bottom, right in regions
+        ]
+        region_area = sum((b - t) * (r - l) for t, l, b, r in regions)
+        det_info.update(
+            mode="multiscale",
+            coarse_side_len=self.args.det_coarse_side_len,
+            regions=len(regions),
+        )
+        if not regions:
+            det_info["scale"] = "coarse"
+            return boxes, scores
+        if (
+            small_font
+            or len(regions) > self.args.det_refine_max_regions
+            or region_area > self.args.det_refine_max_area_ratio * img_h * img_w
+        ):
+            result = self.detect_single(img, self.preprocess_op)
+            det_info["scale"] = "full"
+            return None if result is None else result[:2]
+
+        # 重检区域内的粗尺度框由高分辨率结果替换
+        bounds = box_bounds(boxes) if len(boxes) else np.zeros((0, 4))
+        keep = np.ones(len(boxes), dtype=bool)
+        refined, refined_scores = [], []
+        for top, left, bottom, right in regions:
+            keep &= ~(
+                (bounds[:, 0] >= left)
+                & (bounds[:, 2] <= right)
+                & (bounds[:, 1] >= top)
+                & (bounds[:, 3] <= bottom)
+            )
+            result = self.detect_single(
+                img[top:bottom, left:right], self.preprocess_op
+            )
+            if result is None:
+                continue
+            refined += [
+                np.asarray(box, dtype=np.float32).reshape(-1, 2)
+                + np.float32([left, top])
+                for box in result[0]
+            ]
+            refined_scores += list(result[1])
+        det_info["scale"] = "refined"
+        return (
+            [box for box, k in zip(boxes, keep) if k] + refined,
+            [score for score, k in zip(scores, keep) if k] + refined_scores,
+        )
+
+    def plan_shape_buckets(self, shapes):
+        """
+        按缩放后的 (h, w) 排序分桶, 桶内补齐到最大的 h, w; 数量超过 det_batch_max_num
+        或补齐的面积占比超过 det_batch_pad_waste 时另起一个桶, 尺寸相同的图片总在同一个桶里
+        """
+        order = sorted(range(len(shapes)), key=lambda i: shapes[i])
+        buckets = []
+        bucket, area, max_h, max_w = [], 0, 0, 0
+        for i in order:
+            h, w = shapes[i]
+            if bucket:
+                new_h, new_w = max(max_h, h), max(max_w, w)
+                num = len(bucket) + 1
+                waste = 1.0 - (area + h * w) / float(num * new_h * new_w)
+                if num > self.args.det_batch_max_num or (
+                    waste > self.args.det_batch_pad_waste and (h, w) != (max_h, max_w)
+                ):
+                    buckets.append(bucket)
+                    bucket, area, max_h, max_w = [], 0, 0, 0
+            bucket.append(i)
+            area += h * w
+            max_h, max_w = max(max_h, h), max(max_w, w)
+        if bucket:
+            buckets.append(bucket)
+        return buckets
+
+    def detect_batch(self, images, info=None):
+        """
+        多张图片批量检测: 缩放后按尺寸分桶, 每个桶补齐后调用一次 onnxruntime,
+        概率图裁回各自的尺寸后按各自的 shape_list 还原坐标
+        需要分块检测的图片, 以及 det_scale_mode 为 adaptive 时的所有图片, 逐张走 detect,
+        保证与单张调用得到相同的框 (多尺度的粗检和重检尺寸因图而异, 无法合批)
+        info: 可选的 dict, 写入 info["det"]: 图片数、每个 batch 的大小和逐张检测的图片数
+        return(list):
+            与 images 一一对应的 (dt_boxes, scores), 预处理失败的图片为 (None, None)
+        """
+        results = [(None, None)] * len(images)
+        fused = isinstance(self.preprocess_op[0], DetResizeNormalize)
+        prepared, shape_rows, indices = [], [], []
+        single = 0
+        for idx, img in enumerate(images):
+            if self.use_tiles(img) or self.det_scale_mode == "adaptive":
+                results[idx] = self.detect(img)
+                single += 1
+                continue
+            if fused:
+                # 只缩放, 归一化时直接写入 batch 缓冲区
+                src_h, src_w = img.shape[:2]
+                resized, (ratio_h, ratio_w) = self.preprocess_op[0].resize(img)
+                if resized is None:
+                    continue
+                shape_row = [src_h, src_w, ratio_h, ratio_w]
+            else:
+                data = transform({"image": img}, self.preprocess_op)
+                if data is None or data[0] is None:
+                    continue
+                resized, shape_row = data
+            prepared.append(resized)
+            shape_rows.append(np.array(shape_row, dtype=np.float64))
+            indices.append(idx)
+
+        if fused:
+            shapes = [img.shape[:2] for img in prepared]
+        else:
+            shapes = [img.shape[1:] for img in prepared]
+        buckets = self.plan_shape_buckets(shapes)
+        for bucket in buckets:
+            max_h = max(shapes[i][0] for i in bucket)
+            max_w = max(shapes[i][1] for i in bucket)
+            batch = self.batch_buffers.get([len(bucket), 3, max_h, max_w])
+            # 补齐部分为 0, 即归一化后的均值
+            batch.fill(0)
+            for slot, i in enumerate(bucket):
+                h, w = shapes[i]
+                if fused:
+                    self.preprocess_op[0].normalize_into(prepared[i], batch[slot])
+                else:
+                    batch[slot, :, :h, :w] = prepared[i]
+            input_feed = self.get_input_feed(self.det_input_name, batch)
+            outputs = self.det_onnx_session.run(
+                self.det_output_name, input_feed=input_feed
+            )
+            for slot, i in enumerate(bucket):
+                h, w = shapes[i]
+                preds = {"maps": outputs[0][slot : slot + 1, :, :h, :w]}
+                post_result = self.postprocess_op(preds, shape_rows[i][np.newaxis])[0]
+                results[indices[i]] = self.filter_det_res(
+                    post_result["points"],
+                    post_result["scores"],
+                    images[indices[i]].shape,
+                )
+        if info is not None:
+            info["det"] = {
+                "mode": "batch",
+                "images": len(images),
+                "batch_sizes": [len(bucket) for bucket in buckets],
+                "single_images": single,
+            }
+        return results
+
+    def detect(self, img, info=None):
+        """
+        info: 可选的 dict, 写入 info["det"]: 本次的检测方式 (单尺度 / 多尺度 / 分块) 及实际使用的尺度;
+            预测器在多个线程间共享, 请求信息只通过调用方传入的 dict 返回
+        return(tuple):
+            过滤后的框和对应的 DB 得分 (框内概率均值); 预处理失败时为 (None, None)
+        """
+        ori_shape = img.shape
+        det_info = {}
+        if info is not None:
+            info["det"] = det_info
+        if self.use_tiles(img):
+            result = self.detect_tiled(img, det_info)
+        elif self.det_scale_mode == "adaptive":
+            result = self.detect_multiscale(img, det_info)
         else:
-            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+            det_info["mode"] = "single"
+            result = self.detect_single(img, self.preprocess_op)
+        if result is None:
+            return None, None
+        return self.filter_det_res(result[0], result[1], ori_shape)
 
+    def __call__(self, img):
+        dt_boxes, _ = self.detect(img)
+        if dt_boxes is None:
+            return None, 0
         return dt_boxes
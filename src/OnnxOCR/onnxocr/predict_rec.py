@@ -1,25 +1,51 @@
 import cv2
+import logging
+import hashlib
+import threading
 import numpy as np
 import math
+from collections import OrderedDict
 from PIL import Image
 
 
 from .rec_postprocess import CTCLabelDecode
-from .predict_base import PredictBase
+from .predict_base import PredictBase, BatchBufferPool, resize_norm_into
+from .providers import requested_providers
+from .rec_batching import plan_bucket_batches, plan_fixed_batches, batch_stats
+
+logger = logging.getLogger(__name__)
 
 
 class TextRecognizer(PredictBase):
     def __init__(self, args):
         self.rec_image_shape = [int(v) for v in args.rec_image_shape.split(",")]
         self.rec_batch_num = args.rec_batch_num
+        self.rec_batch_mode = args.rec_batch_mode
+        self.rec_bucket_max_batch_num = args.rec_bucket_max_batch_num
+        self.rec_bucket_pad_waste = args.rec_bucket_pad_waste
+        self.rec_bucket_max_pixels = args.rec_bucket_max_pixels
+        self.rec_seq_len_hint = args.rec_seq_len_hint
+        self.batch_buffers = BatchBufferPool()
         self.rec_algorithm = args.rec_algorithm
+        # 文本条识别结果缓存 (截图中重复的时间戳、按钮文字等), 按 LRU 淘汰
+        self.rec_cache_size = args.rec_cache_size
+        self.rec_cache = OrderedDict()
+        self.rec_cache_lock = threading.Lock()
         self.postprocess_op = CTCLabelDecode(
             character_dict_path=args.rec_char_dict_path,
             use_space_char=args.use_space_char,
         )
 
         # 初始化模型
-        self.rec_onnx_session = self.get_onnx_session(args.rec_model_dir, args.use_gpu)
+        self.rec_onnx_session = self.get_onnx_session(
+            args.rec_model_dir,
+            args.use_gpu,
+            self.get_session_options(args, "rec"),
+            cache_dir=args.model_cache_dir,
+            providers=requested_providers(args),
+            provider_options=args.provider_options,
+            model_type="rec",
+        )
         self.rec_input_name = self.get_input_name(self.rec_onnx_session)
         self.rec_output_name = self.get_output_name(self.rec_onnx_session)
 
@@ -79,6 +105,29 @@ class TextRecognizer(PredictBase):
         padding_im[:, :, 0:resized_w] = resized_image
         return padding_im
 
+    def resize_norm_img_into(self, img, out):
+        """
+        resize_norm_img 的默认分支, 直接写入 batch 缓冲区中该文本条的位置 out (C, H, W)
+        """
+        imgC, imgH, imgW = out.shape
+        assert imgC == img.shape[2]
+        h, w = img.shape[:2]
+        resized_w = min(imgW, int(math.ceil(imgH * w / float(h))))
+        return resize_norm_into(img, out, resized_w)
+
+    def get_seq_lens(self, img_list, batch_w, num_frames):
+        """
+        按文本条缩放后的实际宽度估算有效帧数, padding 对应的尾部帧不参与解码,
+        多留 1 帧避免截掉边缘字符
+        """
+        imgH = self.rec_image_shape[1]
+        seq_lens = []
+        for img in img_list:
+            h, w = img.shape[:2]
+            resized_w = min(batch_w, int(math.ceil(imgH * w / float(h))))
+            seq_lens.append(int(math.ceil(resized_w * num_frames / float(batch_w))) + 1)
+        return np.minimum(np.array(seq_lens), num_frames)
+
     def resize_norm_img_vl(self, img, image_shape):
 
         imgC, imgH, imgW = image_shape
@@ -277,34 +326,167 @@ class TextRecognizer(PredictBase):
 
         return img
 
-    def __call__(self, img_list):
+    def plan_batches(self, width_list, info=None):
+        """
+        bucket: 按宽度分桶并逐桶决定 batch 大小; fixed: 排序后每 rec_batch_num 个一组
+        info: 可选的 dict, bucket 模式下写入 info["rec_batch"]: batch 划分的统计
+        """
+        imgC, imgH, imgW = self.rec_image_shape[:3]
+        if self.rec_batch_mode == "fixed":
+            return plan_fixed_batches(width_list, self.rec_batch_num)
+        if self.rec_batch_mode != "bucket":
+            raise ValueError(
+                "rec_batch_mode must be one of ['bucket', 'fixed'], but got: {}".format(
+                    self.rec_batch_mode
+                )
+            )
+        batches = plan_bucket_batches(
+            width_list,
+            imgH,
+            imgW,
+            self.rec_bucket_max_batch_num,
+            self.rec_bucket_pad_waste,
+            self.rec_bucket_max_pixels,
+        )
+        stats = batch_stats(batches, width_list, imgH, imgW, self.rec_batch_num)
+        if info is not None:
+            info["rec_batch"] = stats
+        logger.debug(
+            f"rec batches: {stats['batch_sizes']}, padding avoided: "
+            f"{stats['padding_avoided_ratio']:.1%}"
+        )
+        return batches
+
+    def warmup_shapes(self):
+        """
+        按识别输入宽度的 1/2/4 倍各跑一个 batch, batch 大小与 bucket 分组时该宽度能容纳的上限一致
+        输入形状固定的算法 (NRTR/ViTSTR/RFL/RARE) 不预热
+        """
+        if self.rec_algorithm in ("NRTR", "ViTSTR", "RFL", "RARE"):
+            return []
+        imgC, imgH, imgW = self.rec_image_shape[:3]
+        shapes = []
+        for scale in (1, 2, 4):
+            width = imgW * scale
+            if self.rec_batch_mode == "bucket":
+                batch_num = min(
+                    self.rec_bucket_max_batch_num,
+                    self.rec_bucket_max_pixels // (imgH * width),
+                )
+            else:
+                batch_num = self.rec_batch_num
+            shapes.append((max(batch_num, 1), imgC, imgH, width))
+        return shapes
+
+    def warmup(self):
+        return self.warmup_session(
+            self.rec_onnx_session,
+            self.rec_input_name,
+            self.rec_output_name,
+            self.warmup_shapes(),
+        )
+
+    def crop_key(self, img):
+        """
+        缓存 key: 按识别输入高度缩放后 (尚未补零和归一化) 的像素哈希,
+        缩放后相同的文本条得到相同的识别输入
+        """
+        imgH = self.rec_image_shape[1]
+        h, w = img.shape[:2]
+        resized_w = max(1, int(math.ceil(imgH * w / float(h))))
+        resized = np.ascontiguousarray(cv2.resize(img, (resized_w, imgH)))
+        digest = hashlib.blake2b(resized.data, digest_size=16)
+        digest.update(str(resized.shape).encode())
+        return digest.digest()
+
+    def __call__(self, img_list, info=None):
+        """
+        info: 可选的 dict, 写入本次调用的缓存命中 (info["rec_cache"]) 和 batch 划分 (info["rec_batch"]);
+            预测器在多个线程间共享, 请求统计只通过调用方传入的 dict 返回
+        """
+        if self.rec_cache_size <= 0 or self.rec_algorithm in (
+            "NRTR",
+            "ViTSTR",
+            "RFL",
+            "RARE",
+        ):
+            return self.recognize(img_list, info)
+
+        rec_res = [None] * len(img_list)
+        keys = [self.crop_key(img) for img in img_list]
+        with self.rec_cache_lock:
+            for ino, key in enumerate(keys):
+                cached = self.rec_cache.get(key)
+                if cached is not None:
+                    self.rec_cache.move_to_end(key)
+                    rec_res[ino] = cached
+        miss_index = [ino for ino, res in enumerate(rec_res) if res is None]
+        # 同一请求内重复的文本条只识别一次
+        first_index = {}
+        for ino in miss_index:
+            first_index.setdefault(keys[ino], ino)
+        unique_index = list(first_index.values())
+        if unique_index:
+            unique_res = self.recognize([img_list[ino] for ino in unique_index], info)
+            with self.rec_cache_lock:
+                for ino, res in zip(unique_index, unique_res):
+                    self.rec_cache[keys[ino]] = res
+                    self.rec_cache.move_to_end(keys[ino])
+                while len(self.rec_cache) > self.rec_cache_size:
+                    self.rec_cache.popitem(last=False)
+            for ino, res in zip(unique_index, unique_res):
+                first_index[keys[ino]] = res
+            for ino in miss_index:
+                rec_res[ino] = first_index[keys[ino]]
+
+        hits = len(img_list) - len(unique_index)
+        cache_stats = {
+            "crops": len(img_list),
+            "hits": hits,
+            "recognized": len(unique_index),
+            "hit_rate": hits / len(img_list) if img_list else 0.0,
+            "cache_entries": len(self.rec_cache),
+        }
+        if info is not None:
+            info["rec_cache"] = cache_stats
+        logger.debug(
+            f"rec cache: {hits}/{len(img_list)} crops reused "
+            f"({cache_stats['hit_rate']:.1%})"
+        )
+        return rec_res
+
+    def recognize(self, img_list, info=None):
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
         for img in img_list:
             width_list.append(img.shape[1] / float(img.shape[0]))
         # Sorting can speed up the recognition process
-        indices = np.argsort(np.array(width_list))
+        batches = self.plan_batches(width_list, info)
         rec_res = [["", 0.0]] * img_num
-        batch_num = self.rec_batch_num
 
-        for beg_img_no in range(0, img_num, batch_num):
-            end_img_no = min(img_num, beg_img_no + batch_num)
-            norm_img_batch = []
+        for batch in batches:
             imgC, imgH, imgW = self.rec_image_shape[:3]
             max_wh_ratio = imgW / imgH
             # max_wh_ratio = 0
-            for ino in range(beg_img_no, end_img_no):
-                h, w = img_list[indices[ino]].shape[0:2]
+            for ino in batch:
+                h, w = img_list[ino].shape[0:2]
                 wh_ratio = w * 1.0 / h
                 max_wh_ratio = max(max_wh_ratio, wh_ratio)
-            for ino in range(beg_img_no, end_img_no):
-                norm_img = self.resize_norm_img(img_list[indices[ino]], max_wh_ratio)
-                norm_img = norm_img[np.newaxis, :]
-                norm_img_batch.append(norm_img)
-
-            norm_img_batch = np.concatenate(norm_img_batch)
-            norm_img_batch = norm_img_batch.copy()
+            if self.rec_algorithm in ("NRTR", "ViTSTR", "RFL", "RARE"):
+                norm_img_batch = []
+                for ino in batch:
+                    norm_img = self.resize_norm_img(img_list[ino], max_wh_ratio)
+                    norm_img = norm_img[np.newaxis, :]
+                    norm_img_batch.append(norm_img)
+                norm_img_batch = np.concatenate(norm_img_batch)
+            else:
+                # 每个文本条直接缩放归一化到复用的 batch 缓冲区中
+                norm_img_batch = self.batch_buffers.get(
+                    (len(batch), imgC, imgH, int(imgH * max_wh_ratio))
+                )
+                for slot, ino in enumerate(batch):
+                    self.resize_norm_img_into(img_list[ino], norm_img_batch[slot])
 
             # img = img[:, :, ::-1].transpose(2, 0, 1)
             # img = img[:, :, ::-1]
@@ -319,8 +501,15 @@ class TextRecognizer(PredictBase):
 
             preds = outputs[0]
 
-            rec_result = self.postprocess_op(preds)
+            seq_lens = None
+            if self.rec_seq_len_hint and preds.ndim == 3:
+                seq_lens = self.get_seq_lens(
+                    [img_list[ino] for ino in batch],
+                    norm_img_batch.shape[3],
+                    preds.shape[1],
+                )
+            rec_result = self.postprocess_op(preds, seq_lens=seq_lens)
             for rno in range(len(rec_result)):
-                rec_res[indices[beg_img_no + rno]] = rec_result[rno]
+                rec_res[batch[rno]] = rec_result[rno]
 
         return rec_res
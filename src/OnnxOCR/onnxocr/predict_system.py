@@ -1,23 +1,174 @@
 import os
 import cv2
-import copy
+import time
+import numpy as np
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from . import predict_det
 from . import predict_cls
 from . import predict_rec
-from .utils import get_rotate_crop_image, get_minarea_rect_crop
+from .utils import (
+    get_rotate_crop_image,
+    get_minarea_rect_crop,
+    is_axis_aligned_box,
+    get_axis_aligned_crop,
+)
+from .model_registry import MODEL_REGISTRY, predictor_key, process_rss
+from .reading_order import ReadingOrder
+
+logger = logging.getLogger(__name__)
 
 
 class TextSystem(object):
     def __init__(self, args):
-        self.text_detector = predict_det.TextDetector(args)
-        self.text_recognizer = predict_rec.TextRecognizer(args)
+        self.args = args
+        self._model_keys = []
+        self.text_detector = self._load_predictor(
+            "det", args.det_model_dir, predict_det.TextDetector
+        )
+        self.text_recognizer = self._load_predictor(
+            "rec", args.rec_model_dir, predict_rec.TextRecognizer
+        )
         self.use_angle_cls = args.use_angle_cls
         self.drop_score = args.drop_score
         if self.use_angle_cls:
-            self.text_classifier = predict_cls.TextClassifier(args)
+            self.text_classifier = self._load_predictor(
+                "cls", args.cls_model_dir, predict_cls.TextClassifier
+            )
 
-        self.args = args
         self.crop_image_res_index = 0
+        # 透视变换线程池按需创建; 并发请求和 close() 通过锁访问
+        self.crop_executor = None
+        self._crop_executor_lock = threading.Lock()
+        self.reading_order = ReadingOrder(
+            line_tol_ratio=args.reading_order_line_tol,
+            detect_columns=args.reading_order_columns,
+        )
+        # 每个文本条裁剪 + 分类 + 识别的平均耗时, 用于估算预过滤节省的时间
+        self.crop_time_per_box = 0.0
+        # 预热完成 (或不预热) 后置位
+        self.ready = threading.Event()
+        if not args.warmup:
+            self.ready.set()
+
+    def _load_predictor(self, model_type, model_dir, predictor_cls):
+        # share_models 时同进程内参数相同的 TextSystem 复用同一个预测器
+        if not self.args.share_models:
+            return predictor_cls(self.args)
+        key = predictor_key(model_type, model_dir, self.args)
+        predictor = MODEL_REGISTRY.acquire(key, lambda: predictor_cls(self.args))
+        self._model_keys.append(key)
+        return predictor
+
+    def warmup(self):
+        """
+        用合成输入预热各个模型, 完成后置位 ready; 预热失败只记录日志, 不阻止后续请求
+        """
+        start = time.time()
+        predictors = [("det", self.text_detector), ("rec", self.text_recognizer)]
+        if self.use_angle_cls:
+            predictors.append(("cls", self.text_classifier))
+        try:
+            for name, predictor in predictors:
+                if predictor.warmed_up:
+                    continue
+                rss_before = process_rss()
+                elapsed = predictor.warmup()
+                logger.info(f"{name} warmup: {elapsed:.2f} s")
+                self._record_warmup_rss(name, rss_before)
+        except Exception as e:
+            logger.warning(f"OCR warmup failed: {e}")
+        finally:
+            self.ready.set()
+        logger.info(f"OCR warmup finished in {time.time() - start:.2f} s")
+
+    def _record_warmup_rss(self, model_type, rss_before):
+        rss_after = process_rss()
+        if rss_before is None or rss_after is None:
+            return
+        for key in self._model_keys:
+            if key[0] == model_type:
+                MODEL_REGISTRY.add_warmup_rss(key, rss_after - rss_before)
+
+    def start_warmup(self):
+        if self.args.warmup_background:
+            threading.Thread(target=self.warmup, name="ocr-warmup", daemon=True).start()
+        else:
+            self.warmup()
+
+    def wait_ready(self, timeout=None):
+        """
+        等待预热完成, 超时返回 False
+        """
+        return self.ready.wait(timeout)
+
+    def close(self):
+        """
+        释放共享预测器的引用, 最后一个引用释放时模型被卸载
+        """
+        for key in self._model_keys:
+            MODEL_REGISTRY.release(key)
+        self._model_keys = []
+        with self._crop_executor_lock:
+            executor, self.crop_executor = self.crop_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _get_crop_executor(self):
+        with self._crop_executor_lock:
+            if self.crop_executor is None:
+                self.crop_executor = ThreadPoolExecutor(
+                    max_workers=self.args.crop_num_threads,
+                    thread_name_prefix="ocr-crop",
+                )
+            return self.crop_executor
+
+    def crop_one(self, img, box):
+        if self.args.det_box_type == "quad":
+            return get_rotate_crop_image(img, box)
+        return get_minarea_rect_crop(img, box)
+
+    def crop_images(self, img, dt_boxes, info=None):
+        """
+        水平矩形直接切片, 其余 box 做透视变换; 透视变换在线程池中并行 (OpenCV 会释放 GIL)
+        """
+        start = time.time()
+        img_crop_list = [None] * len(dt_boxes)
+        warp_index = []
+        tol = self.args.crop_axis_aligned_tol
+        for bno, box in enumerate(dt_boxes):
+            if (
+                self.args.det_box_type == "quad"
+                and tol >= 0
+                and is_axis_aligned_box(box, tol)
+            ):
+                img_crop_list[bno] = get_axis_aligned_crop(img, box)
+            else:
+                warp_index.append(bno)
+
+        if len(warp_index) > 1 and self.args.crop_num_threads > 1:
+            crops = self._get_crop_executor().map(
+                lambda bno: self.crop_one(img, dt_boxes[bno]), warp_index
+            )
+            for bno, img_crop in zip(warp_index, crops):
+                img_crop_list[bno] = img_crop
+        else:
+            for bno in warp_index:
+                img_crop_list[bno] = self.crop_one(img, dt_boxes[bno])
+
+        crop_stats = {
+            "time": time.time() - start,
+            "sliced": len(dt_boxes) - len(warp_index),
+            "warped": len(warp_index),
+        }
+        if info is not None:
+            info["crop"] = crop_stats
+        logger.debug(
+            f"crop: {len(dt_boxes)} boxes in {crop_stats['time'] * 1000:.1f} ms "
+            f"({crop_stats['sliced']} sliced, {len(warp_index)} warped)"
+        )
+        return img_crop_list
 
     def draw_crop_rec_res(self, output_dir, img_crop_list, rec_res):
         os.makedirs(output_dir, exist_ok=True)
@@ -32,36 +183,79 @@ class TextSystem(object):
 
         self.crop_image_res_index += bbox_num
 
-    def __call__(self, img, cls=True):
-        ori_im = img.copy()
+    def prefilter_boxes(self, dt_boxes, scores, info=None):
+        """
+        识别前丢弃太小、det 得分过低或长宽比异常的框, 这些框的识别结果几乎都会被 drop_score 过滤
+        info: 可选的 dict, 写入 info["prerec_filter"]: 各原因丢弃的框数和估算节省的时间
+        """
+        args = self.args
+        if not (args.prerec_min_side or args.prerec_min_score or args.prerec_max_aspect):
+            return dt_boxes
+        stats = {"small": 0, "low_score": 0, "aspect": 0}
+        kept = []
+        for box, score in zip(dt_boxes, scores):
+            _, (w, h), _ = cv2.minAreaRect(np.asarray(box, dtype=np.float32).reshape(-1, 2))
+            short_side, long_side = min(w, h), max(w, h)
+            if short_side < args.prerec_min_side:
+                stats["small"] += 1
+            elif score < args.prerec_min_score:
+                stats["low_score"] += 1
+            elif args.prerec_max_aspect and long_side > args.prerec_max_aspect * max(
+                short_side, 1.0
+            ):
+                stats["aspect"] += 1
+            else:
+                kept.append(box)
+        stats["skipped"] = len(dt_boxes) - len(kept)
+        stats["est_saved_time"] = stats["skipped"] * self.crop_time_per_box
+        if info is not None:
+            info["prerec_filter"] = stats
+        if stats["skipped"]:
+            logger.debug(
+                f"prerec filter: skipped {stats['skipped']} of {len(dt_boxes)} boxes, "
+                f"~{stats['est_saved_time'] * 1000:.1f} ms saved"
+            )
+        return kept
+
+    def record_box_time(self, elapsed, num_boxes):
+        if num_boxes:
+            per_box = elapsed / num_boxes
+            if self.crop_time_per_box:
+                per_box = 0.9 * self.crop_time_per_box + 0.1 * per_box
+            self.crop_time_per_box = per_box
+
+    def __call__(self, img, cls=True, info=None):
+        """
+        info: 可选的 dict, 写入本次调用的检测方式和尺度 (见 TextDetector.detect)、
+            预过滤和裁剪统计、识别缓存命中 (见 TextRecognizer.__call__)、版面 (见 order_results);
+            TextSystem 可能被多个线程同时调用, 请求统计只通过这个 dict 返回
+        """
         # Text detection
-        dt_boxes = self.text_detector(img)
+        dt_boxes, det_scores = self.text_detector.detect(img, info)
 
         if dt_boxes is None:
             return None, None
 
-        img_crop_list = []
-
-        dt_boxes = sorted_boxes(dt_boxes)
+        dt_boxes = self.prefilter_boxes(dt_boxes, det_scores, info)
+        start = time.time()
 
         # Image cropping
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            if self.args.det_box_type == "quad":
-                img_crop = get_rotate_crop_image(ori_im, tmp_box)
-            else:
-                img_crop = get_minarea_rect_crop(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+        img_crop_list = self.crop_images(img, dt_boxes, info)
 
         # Direction classification
         if self.use_angle_cls and cls:
             img_crop_list, angle_list = self.text_classifier(img_crop_list)
 
         # Text recognition
-        rec_res = self.text_recognizer(img_crop_list)
+        rec_res = self.text_recognizer(img_crop_list, info)
+        self.record_box_time(time.time() - start, len(dt_boxes))
 
         if self.args.save_crop_res:
             self.draw_crop_rec_res(self.args.crop_res_save_dir, img_crop_list, rec_res)
+        dt_boxes, rec_res = self.filter_results(dt_boxes, rec_res)
+        return self.order_results(dt_boxes, rec_res, info)
+
+    def filter_results(self, dt_boxes, rec_res):
         filter_boxes, filter_rec_res = [], []
         for box, rec_result in zip(dt_boxes, rec_res):
             text, score = rec_result
@@ -71,6 +265,74 @@ class TextSystem(object):
 
         return filter_boxes, filter_rec_res
 
+    def order_results(self, dt_boxes, rec_res, info=None):
+        """
+        把过滤后的结果按阅读顺序排列, 行和段落只计算这一次
+        info 不为 None 时写入 info["layout"]: lines 为每行结果的下标 (排序后的下标), paragraphs 为每段的行号
+        """
+        layout = self.reading_order(dt_boxes)
+        order = layout["order"]
+        if info is not None:
+            position = {index: pos for pos, index in enumerate(order)}
+            info["layout"] = {
+                "lines": [[position[i] for i in line] for line in layout["lines"]],
+                "paragraphs": layout["paragraphs"],
+            }
+        return [dt_boxes[i] for i in order], [rec_res[i] for i in order]
+
+    def ocr_many(self, images, cls=True, info=None):
+        """
+        多张图片一起识别: 批量检测后, 所有图片的文本条汇总到同一批 cls / rec batch 中,
+        结果再按图片拆分, 每张图片内的顺序与 __call__ 相同
+        adaptive 方向分类按整页判断方向, 仍逐张图片分类
+        info: 可选的 dict, 写入批量检测 (info["det"]) 和 batch 划分 (info["ocr_many"]) 的统计
+        return(list):
+            与 images 一一对应的 (dt_boxes, rec_res), 检测失败的图片为 (None, None)
+        """
+        start = time.time()
+        if info is None:
+            info = {}
+        det_results = self.text_detector.detect_batch(images, info)
+
+        all_crops, offsets, boxes_list = [], [], []
+        box_start = time.time()
+        for img, (dt_boxes, det_scores) in zip(images, det_results):
+            if dt_boxes is None:
+                boxes_list.append(None)
+                offsets.append((len(all_crops), len(all_crops)))
+                continue
+            dt_boxes = self.prefilter_boxes(dt_boxes, det_scores)
+            img_crop_list = self.crop_images(img, dt_boxes)
+            if self.use_angle_cls and cls and self.text_classifier.cls_mode != "full":
+                img_crop_list, _ = self.text_classifier(img_crop_list)
+            boxes_list.append(dt_boxes)
+            offsets.append((len(all_crops), len(all_crops) + len(img_crop_list)))
+            all_crops += img_crop_list
+
+        if self.use_angle_cls and cls and self.text_classifier.cls_mode == "full":
+            all_crops, _ = self.text_classifier(all_crops)
+        rec_res = self.text_recognizer(all_crops, info)
+        self.record_box_time(time.time() - box_start, len(all_crops))
+
+        results = []
+        for dt_boxes, (beg, end) in zip(boxes_list, offsets):
+            if dt_boxes is None:
+                results.append((None, None))
+                continue
+            results.append(self.order_results(*self.filter_results(dt_boxes, rec_res[beg:end])))
+        many_stats = {
+            "images": len(images),
+            "crops": len(all_crops),
+            "rec_batches": info.get("rec_batch", {}).get("num_batches"),
+            "time": time.time() - start,
+        }
+        info["ocr_many"] = many_stats
+        logger.debug(
+            f"ocr_many: {len(images)} images, {len(all_crops)} crops, "
+            f"{many_stats['rec_batches']} rec batches"
+        )
+        return results
+
 
 def sorted_boxes(dt_boxes):
     """
@@ -80,18 +342,4 @@ def sorted_boxes(dt_boxes):
     return:
         sorted boxes(array) with shape [4, 2]
     """
-    num_boxes = dt_boxes.shape[0]
-    sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-    _boxes = list(sorted_boxes)
-
-    for i in range(num_boxes - 1):
-        for j in range(i, -1, -1):
-            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and (
-                _boxes[j + 1][0][0] < _boxes[j][0][0]
-            ):
-                tmp = _boxes[j]
-                _boxes[j] = _boxes[j + 1]
-                _boxes[j + 1] = tmp
-            else:
-                break
-    return _boxes
+    return [dt_boxes[i] for i in ReadingOrder()(dt_boxes)["order"]]
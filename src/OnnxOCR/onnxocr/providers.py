@@ -0,0 +1,152 @@
+import time
+import logging
+import numpy as np
+import onnxruntime
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_ALIASES = {
+    "cpu": "CPUExecutionProvider",
+    "cuda": "CUDAExecutionProvider",
+    "tensorrt": "TensorrtExecutionProvider",
+    "openvino": "OpenVINOExecutionProvider",
+    "xnnpack": "XnnpackExecutionProvider",
+    "dnnl": "DnnlExecutionProvider",
+    "coreml": "CoreMLExecutionProvider",
+    "directml": "DmlExecutionProvider",
+}
+
+# auto 模式参与比较的 CPU provider, 只比较当前 onnxruntime 中可用的
+AUTO_CPU_PROVIDERS = (
+    "CPUExecutionProvider",
+    "OpenVINOExecutionProvider",
+    "XnnpackExecutionProvider",
+    "DnnlExecutionProvider",
+)
+
+
+def normalize_provider(name):
+    name = str(name).strip()
+    return PROVIDER_ALIASES.get(name.lower(), name)
+
+
+def requested_providers(args):
+    """
+    args.providers: 逗号分隔的字符串或列表, 按优先级排列, 如 "openvino,cpu"; "auto" 表示逐个模型测速选择
+    为空时沿用 use_gpu, enable_mkldnn 时优先使用 DNNL
+    return:
+        provider 名称列表, 或 "auto"
+    """
+    spec = getattr(args, "providers", None)
+    if not spec:
+        if args.use_gpu:
+            return ["CUDAExecutionProvider"]
+        if args.enable_mkldnn:
+            return ["DnnlExecutionProvider", "CPUExecutionProvider"]
+        return ["CPUExecutionProvider"]
+    if isinstance(spec, str):
+        spec = spec.split(",")
+    names = [normalize_provider(name) for name in spec if str(name).strip()]
+    if [name.lower() for name in names] == ["auto"]:
+        return "auto"
+    return names
+
+
+def resolve_providers(names, provider_options=None):
+    """
+    去掉当前 onnxruntime 中不可用的 provider, 并保证最后有 CPU 兜底
+    provider_options: {provider 名称或别名: 选项 dict}
+    return:
+        (providers, 与之对应的选项列表)
+    """
+    available = onnxruntime.get_available_providers()
+    options_by_name = {
+        normalize_provider(name): dict(options or {})
+        for name, options in (provider_options or {}).items()
+    }
+    providers = []
+    for name in names:
+        if name not in available:
+            logger.warning(f"Execution provider {name} is not available, skipped")
+            continue
+        if name not in providers:
+            providers.append(name)
+    if "CPUExecutionProvider" not in providers:
+        providers.append("CPUExecutionProvider")
+    return providers, [options_by_name.get(name, {}) for name in providers]
+
+
+def metadata_input_shape(shape, dynamic_size=320):
+    """
+    按模型输入的元数据构造测速输入的尺寸: batch 维取 1, 其余动态维取 dynamic_size
+    """
+    return tuple(
+        dim if isinstance(dim, int) and dim > 0 else (1 if i == 0 else dynamic_size)
+        for i, dim in enumerate(shape)
+    )
+
+
+def benchmark_providers(model_path, sess_options, shapes, provider_options=None, repeat=3):
+    """
+    可用的 CPU provider 逐个建 session, 全零输入按 shapes 先跑一遍, 再计时 repeat 遍;
+    shapes 为空 (预测器没有预热尺寸, 如固定宽度的识别算法) 时按模型输入的元数据构造
+    return:
+        {provider: 每遍平均耗时 (秒)}, 创建或运行失败的 provider 不在其中
+    """
+    available = onnxruntime.get_available_providers()
+    timings = {}
+    for name in AUTO_CPU_PROVIDERS:
+        if name not in available:
+            continue
+        providers, options = resolve_providers([name], provider_options)
+        try:
+            session = onnxruntime.InferenceSession(
+                model_path, sess_options, providers=providers, provider_options=options
+            )
+            model_input = session.get_inputs()[0]
+            input_shapes = shapes or [metadata_input_shape(model_input.shape)]
+            feeds = [
+                {model_input.name: np.zeros(shape, dtype=np.float32)} for shape in input_shapes
+            ]
+            for feed in feeds:
+                session.run(None, feed)
+            start = time.perf_counter()
+            for _ in range(max(repeat, 1)):
+                for feed in feeds:
+                    session.run(None, feed)
+            timings[name] = (time.perf_counter() - start) / max(repeat, 1)
+        except Exception as e:
+            logger.warning(f"Benchmark of {name} on {model_path} failed: {e}")
+    return timings
+
+
+def select_providers(model_type, model_path, requested, sess_options, shapes,
+                     provider_options=None, repeat=3):
+    """
+    按配置确定最终的 provider 列表; auto 时测速选出最快的 CPU provider, 记录各 provider 的耗时
+    """
+    if requested != "auto":
+        providers, options = resolve_providers(requested, provider_options)
+        logger.info(f"{model_type} providers: {providers}")
+        return providers, options
+
+    candidates = [name for name in AUTO_CPU_PROVIDERS if name in onnxruntime.get_available_providers()]
+    if len(candidates) <= 1:
+        providers, options = resolve_providers(candidates, provider_options)
+        logger.info(f"{model_type} providers (auto, nothing to compare): {providers}")
+        return providers, options
+    timings = benchmark_providers(model_path, sess_options, shapes, provider_options, repeat)
+    if not timings:
+        # 没有任何 provider 测速成功, 不做选择, 按 AUTO_CPU_PROVIDERS 的顺序使用
+        logger.warning(
+            f"{model_type} provider auto selection: no provider could be benchmarked, "
+            f"using {candidates}"
+        )
+        return resolve_providers(candidates, provider_options)
+    best = min(timings, key=timings.get)
+    logger.info(
+        f"{model_type} provider auto selection: "
+        + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+        + f" -> {best}"
+    )
+    return resolve_providers([best], provider_options)
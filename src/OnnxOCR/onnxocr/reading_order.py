@@ -0,0 +1,122 @@
+import bisect
+import numpy as np
+
+
+class ReadingOrder(object):
+    """
+    把文本框聚成行、段落(以及可选的分栏), 得到从上到下、从左到右的阅读顺序, O(n log n)
+
+    args:
+        line_tol_ratio(float): 中心点纵向距离小于 line_tol_ratio * 较矮框高度时视为同一行
+        paragraph_gap_ratio(float): 行间距大于 paragraph_gap_ratio * 行高中位数时另起一段
+        detect_columns(bool): 是否按竖直空白分栏, 分栏后逐栏阅读
+        column_gap_ratio(float): 竖直空白宽度大于 column_gap_ratio * 行高中位数才视为分栏
+    return(dict):
+        order: 框下标的阅读顺序
+        lines: 每行的框下标 (行内从左到右)
+        paragraphs: 每段的行号 (lines 的下标)
+    """
+
+    def __init__(
+        self,
+        line_tol_ratio=0.5,
+        paragraph_gap_ratio=1.0,
+        detect_columns=False,
+        column_gap_ratio=2.0,
+    ):
+        self.line_tol_ratio = line_tol_ratio
+        self.paragraph_gap_ratio = paragraph_gap_ratio
+        self.detect_columns = detect_columns
+        self.column_gap_ratio = column_gap_ratio
+
+    def box_extents(self, boxes):
+        """
+        每个框的 left, top, right, bottom, 支持 [N, 4, 2] 数组或点数不同的多边形列表
+        """
+        extents = np.zeros((len(boxes), 4), dtype=np.float64)
+        for i, box in enumerate(boxes):
+            points = np.asarray(box, dtype=np.float64).reshape(-1, 2)
+            extents[i, :2] = points.min(axis=0)
+            extents[i, 2:] = points.max(axis=0)
+        return extents
+
+    def group_lines(self, extents, indices):
+        """
+        按中心点纵坐标排序后扫描, 与当前行中心足够接近的框并入当前行
+        """
+        heights = np.maximum(extents[:, 3] - extents[:, 1], 1.0)
+        centers = (extents[:, 1] + extents[:, 3]) / 2.0
+        indices = sorted(indices, key=lambda i: (centers[i], extents[i, 0]))
+        lines = []
+        line, line_center, line_height = [], 0.0, 0.0
+        for i in indices:
+            if line:
+                tol = self.line_tol_ratio * min(heights[i], line_height)
+                if abs(centers[i] - line_center) <= tol:
+                    line.append(i)
+                    line_center += (centers[i] - line_center) / len(line)
+                    line_height += (heights[i] - line_height) / len(line)
+                    continue
+                lines.append(line)
+            line, line_center, line_height = [i], centers[i], heights[i]
+        if line:
+            lines.append(line)
+        # 行内从左到右
+        return [sorted(line, key=lambda i: extents[i, 0]) for line in lines]
+
+    def group_paragraphs(self, extents, lines, first_line_no):
+        if not lines:
+            return []
+        line_ext = np.array(
+            [
+                [extents[line, 1].min(), extents[line, 3].max()]
+                for line in lines
+            ]
+        )
+        median_height = float(np.median(line_ext[:, 1] - line_ext[:, 0]))
+        max_gap = self.paragraph_gap_ratio * max(median_height, 1.0)
+        paragraphs = [[first_line_no]]
+        for k in range(1, len(lines)):
+            if line_ext[k, 0] - line_ext[k - 1, 1] > max_gap:
+                paragraphs.append([])
+            paragraphs[-1].append(first_line_no + k)
+        return paragraphs
+
+    def split_columns(self, extents):
+        """
+        合并所有框的横向区间, 宽度足够的空白作为栏间隔, 返回每个框所属的栏号
+        """
+        num = len(extents)
+        if num == 0:
+            return np.zeros(0, dtype=np.int64), 1
+        median_height = float(np.median(np.maximum(extents[:, 3] - extents[:, 1], 1.0)))
+        min_gap = self.column_gap_ratio * median_height
+        order = np.argsort(extents[:, 0], kind="stable")
+        starts = [extents[order[0], 0]]
+        right = extents[order[0], 2]
+        for i in order[1:]:
+            if extents[i, 0] - right > min_gap:
+                starts.append(extents[i, 0])
+            right = max(right, extents[i, 2])
+        columns = np.array(
+            [bisect.bisect_right(starts, left) - 1 for left in extents[:, 0]],
+            dtype=np.int64,
+        )
+        return columns, len(starts)
+
+    def __call__(self, boxes):
+        extents = self.box_extents(boxes)
+        if self.detect_columns:
+            columns, num_columns = self.split_columns(extents)
+            groups = [np.nonzero(columns == c)[0].tolist() for c in range(num_columns)]
+        else:
+            groups = [list(range(len(boxes)))]
+
+        lines, paragraphs = [], []
+        for group in groups:
+            group_lines = self.group_lines(extents, group)
+            paragraphs += self.group_paragraphs(extents, group_lines, len(lines))
+            lines += group_lines
+        order = [i for line in lines for i in line]
+        return {"order": order, "lines": lines, "paragraphs": paragraphs}
+
@@ -0,0 +1,105 @@
+import math
+import numpy as np
+
+
+def padded_width(img_h, min_w, max_wh_ratio):
+    """
+    与 TextRecognizer.resize_norm_img 一致: batch 宽度由最宽的文本条决定, 且不小于 min_w
+    """
+    return int(img_h * max(min_w / float(img_h), max_wh_ratio))
+
+
+def resized_width(img_h, wh_ratio):
+    return int(math.ceil(img_h * wh_ratio))
+
+
+def plan_fixed_batches(wh_ratios, batch_num):
+    """
+    原有策略: 按宽高比排序后每 batch_num 个一组
+    """
+    indices = np.argsort(np.array(wh_ratios))
+    return [
+        indices[beg : beg + batch_num].tolist()
+        for beg in range(0, len(indices), batch_num)
+    ]
+
+
+def plan_bucket_batches(
+    wh_ratios, img_h, min_w, max_batch_num, max_pad_waste, max_batch_pixels
+):
+    """
+    按宽度分桶: 排序后依次把文本条放入当前 batch, 满足以下任一条件时另起一个 batch
+        1. batch 内数量达到 max_batch_num
+        2. 加入后 batch 张量 (N * H * W) 超过 max_batch_pixels
+        3. 加入后 padding 占比超过 max_pad_waste (不足 min_w 的部分是必然的 padding, 不计入)
+    args:
+        wh_ratios(list): 每个文本条的宽高比
+        img_h(int): 识别模型输入高度
+        min_w(int): 识别模型输入最小宽度
+    return(list):
+        batch 列表, 每个 batch 为原始下标列表
+    """
+    indices = np.argsort(np.array(wh_ratios))
+    batches = []
+    batch = []
+    used_w = 0
+    for idx in indices.tolist():
+        ratio = wh_ratios[idx]
+        # 排序后新加入的总是最宽的, 它决定 batch 宽度
+        batch_w = padded_width(img_h, min_w, ratio)
+        crop_w = min(max(resized_width(img_h, ratio), min_w), batch_w)
+        if batch:
+            num = len(batch) + 1
+            waste = 1.0 - (used_w + crop_w) / float(num * batch_w)
+            if (
+                num > max_batch_num
+                or num * img_h * batch_w > max_batch_pixels
+                or waste > max_pad_waste
+            ):
+                batches.append(batch)
+                batch = []
+                used_w = 0
+        batch.append(idx)
+        used_w += crop_w
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def padded_columns(batches, wh_ratios, img_h, min_w):
+    """
+    统计 batch 方案的总列数和 padding 列数 (按单个文本条高度计)
+    """
+    total = 0
+    padding = 0
+    for batch in batches:
+        ratios = [wh_ratios[idx] for idx in batch]
+        batch_w = padded_width(img_h, min_w, max(ratios))
+        total += len(batch) * batch_w
+        padding += sum(
+            batch_w - min(resized_width(img_h, ratio), batch_w) for ratio in ratios
+        )
+    return total, padding
+
+
+def batch_stats(batches, wh_ratios, img_h, min_w, fixed_batch_num):
+    """
+    对比原有固定分组方案, 统计分桶后少计算的 padding
+    """
+    total, padding = padded_columns(batches, wh_ratios, img_h, min_w)
+    fixed_total, fixed_padding = padded_columns(
+        plan_fixed_batches(wh_ratios, fixed_batch_num), wh_ratios, img_h, min_w
+    )
+    return {
+        "num_crops": len(wh_ratios),
+        "num_batches": len(batches),
+        "batch_sizes": [len(batch) for batch in batches],
+        "padded_columns": padding,
+        "total_columns": total,
+        "fixed_padded_columns": fixed_padding,
+        "fixed_total_columns": fixed_total,
+        "padding_avoided": fixed_padding - padding,
+        "padding_avoided_ratio": (
+            (fixed_padding - padding) / float(fixed_padding) if fixed_padding else 0.0
+        ),
+    }
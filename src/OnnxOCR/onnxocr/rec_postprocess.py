@@ -94,20 +94,63 @@ class CTCLabelDecode(BaseRecLabelDecode):
 
     def __init__(self, character_dict_path=None, use_space_char=False, **kwargs):
         super(CTCLabelDecode, self).__init__(character_dict_path, use_space_char)
+        # character table as a numpy array so the batch decoder can index it directly
+        self.character_table = np.array(self.character, dtype=object)
 
-    def __call__(self, preds, label=None, *args, **kwargs):
+    def __call__(self, preds, label=None, seq_lens=None, *args, **kwargs):
         if isinstance(preds, tuple) or isinstance(preds, list):
             preds = preds[-1]
         # if isinstance(preds, paddle.Tensor):
         #     preds = preds.numpy()
-        preds_idx = preds.argmax(axis=2)
-        preds_prob = preds.max(axis=2)
-        text = self.decode(preds_idx, preds_prob, is_remove_duplicate=True)
+        text = self.decode_batch(preds, seq_lens)
         if label is None:
             return text
         label = self.decode(label)
         return text, label
 
+    def decode_batch(self, preds, seq_lens=None):
+        """
+        vectorized CTC decoding of a whole batch, same result as decode(argmax, max, is_remove_duplicate=True)
+        args:
+            preds(array): model output, shape (N, T, num_classes)
+            seq_lens(int|array|None): valid frames per row, later frames are treated as blank
+        return(list):
+            [(text, mean_prob), ...]
+        """
+        batch_size = preds.shape[0]
+        if seq_lens is not None:
+            seq_lens = np.broadcast_to(
+                np.minimum(np.asarray(seq_lens, dtype=np.int64), preds.shape[1]),
+                (batch_size,),
+            )
+            if batch_size > 0:
+                preds = preds[:, : int(seq_lens.max())]
+
+        preds_idx = preds.argmax(axis=2)
+        preds_prob = np.take_along_axis(preds, preds_idx[:, :, None], axis=2)[:, :, 0]
+
+        selection = np.ones(preds_idx.shape, dtype=bool)
+        selection[:, 1:] = preds_idx[:, 1:] != preds_idx[:, :-1]
+        for ignored_token in self.get_ignored_tokens():
+            selection &= preds_idx != ignored_token
+        if seq_lens is not None:
+            selection &= np.arange(preds_idx.shape[1])[None, :] < seq_lens[:, None]
+
+        counts = selection.sum(axis=1)
+        conf_sums = np.where(selection, preds_prob, 0).sum(axis=1)
+        confs = np.where(counts > 0, conf_sums / np.maximum(counts, 1), 0.0)
+
+        # gather the selected characters in row-major order, then split them by per-row counts
+        chars = self.character_table[preds_idx[selection]]
+        ends = np.cumsum(counts)
+        result_list = []
+        for batch_idx in range(batch_size):
+            text = "".join(chars[ends[batch_idx] - counts[batch_idx] : ends[batch_idx]])
+            if self.reverse:  # for arabic rec
+                text = self.pred_reverse(text)
+            result_list.append((text, float(confs[batch_idx])))
+        return result_list
+
     def add_special_char(self, dict_character):
         dict_character = ["blank"] + dict_character
         return dict_character
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import cv2
 import argparse
@@ -53,6 +54,46 @@ def get_rotate_crop_image(img, points):
     return dst_img
 
 
+def is_axis_aligned_box(points, tol=1.0):
+    """
+    box 是否为(近似)水平矩形: 上下边水平、左右边竖直, 误差不超过 tol 像素
+    args:
+        points(array): clockwise box with shape [4, 2]
+    """
+    return (
+        abs(points[0][1] - points[1][1]) <= tol
+        and abs(points[3][1] - points[2][1]) <= tol
+        and abs(points[0][0] - points[3][0]) <= tol
+        and abs(points[1][0] - points[2][0]) <= tol
+    )
+
+
+def get_axis_aligned_crop(img, points):
+    """
+    get_rotate_crop_image 的水平矩形快速版本: 直接切片返回 view, 不做透视变换,
+    输出尺寸和竖排旋转规则与 get_rotate_crop_image 相同
+    """
+    img_crop_width = int(
+        max(
+            np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])
+        )
+    )
+    img_crop_height = int(
+        max(
+            np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])
+        )
+    )
+    left = max(int(round((points[0][0] + points[3][0]) / 2.0)), 0)
+    top = max(int(round((points[0][1] + points[1][1]) / 2.0)), 0)
+    dst_img = img[top : top + img_crop_height, left : left + img_crop_width]
+    dst_img_height, dst_img_width = dst_img.shape[0:2]
+    if dst_img_width == 0 or dst_img_height == 0:
+        return get_rotate_crop_image(img, np.float32(points))
+    if dst_img_height * 1.0 / dst_img_width >= 1.5:
+        dst_img = np.rot90(dst_img)
+    return dst_img
+
+
 def get_minarea_rect_crop(img, points):
     bounding_box = cv2.minAreaRect(np.array(points).astype(np.int32))
     points = sorted(list(cv2.boxPoints(bounding_box)), key=lambda x: x[0])
@@ -244,6 +285,17 @@ def base64_to_cv2(b64str):
     return data
 
 
+def model_variant_path(model_path, variant):
+    """
+    量化等变体模型保存在原模型旁边, 如 rec.onnx -> rec.int8_static.onnx;
+    variant 为空或 fp32 时返回原模型
+    """
+    if not variant or variant == "fp32":
+        return str(model_path)
+    root, ext = os.path.splitext(str(model_path))
+    return "{}.{}{}".format(root, variant, ext)
+
+
 def str2bool(v):
     return v.lower() in ("true", "t", "1")
 
@@ -261,6 +313,26 @@ def infer_args():
     parser.add_argument("--gpu_mem", type=int, default=500)
     parser.add_argument("--gpu_id", type=int, default=0)
 
+    # params for onnxruntime session, det/rec/cls_session_options override per model
+    parser.add_argument("--inter_op_num_threads", type=int, default=0)
+    parser.add_argument("--graph_optimization_level", type=str, default="all")
+    parser.add_argument("--execution_mode", type=str, default="sequential")
+    parser.add_argument("--enable_cpu_mem_arena", type=str2bool, default=True)
+    parser.add_argument("--enable_mem_pattern", type=str2bool, default=True)
+    parser.add_argument("--intra_op_thread_affinity", type=str, default="")
+    # execution providers in priority order, e.g. "openvino,cpu" or ["XnnpackExecutionProvider"];
+    # "auto" benchmarks the CPU providers per model at startup, empty follows use_gpu / enable_mkldnn
+    parser.add_argument("--providers", type=str, default=None)
+    # options per provider, e.g. {"openvino": {"device_type": "CPU"}}
+    parser.add_argument("--provider_options", type=dict, default=None)
+    # directory for optimized models in ORT format, empty disables the cache
+    parser.add_argument("--model_cache_dir", type=str, default="")
+    parser.add_argument("--det_session_options", type=dict, default=None)
+    parser.add_argument("--rec_session_options", type=dict, default=None)
+    parser.add_argument("--cls_session_options", type=dict, default=None)
+    # share det/rec/cls predictors between TextSystem instances in one process
+    parser.add_argument("--share_models", type=str2bool, default=True)
+
     # params for text detector
     parser.add_argument("--image_dir", type=str)
     parser.add_argument("--page_num", type=int, default=0)
@@ -273,6 +345,35 @@ def infer_args():
     parser.add_argument("--det_limit_side_len", type=float, default=960)
     parser.add_argument("--det_limit_type", type=str, default="max")
     parser.add_argument("--det_box_type", type=str, default="quad")
+    # resize + normalize + CHW in one pass, False falls back to the operator chain
+    parser.add_argument("--det_fused_preprocess", type=str2bool, default=True)
+    # TextDetector.detect_batch: images per ORT call and max padded share of a shape bucket
+    parser.add_argument("--det_batch_max_num", type=int, default=8)
+    parser.add_argument("--det_batch_pad_waste", type=float, default=0.2)
+    # tiled detection at native scale: off, auto (only long screenshots / scans the resize would shrink a lot) or on
+    parser.add_argument("--det_tile_mode", type=str, default="auto")
+    parser.add_argument("--det_tile_size", type=int, default=960)
+    # must exceed the tallest text line so every line fits whole in some tile;
+    # the overlap is at least det_tile_overlap_ratio * short side, text height grows with resolution
+    parser.add_argument("--det_tile_overlap", type=int, default=128)
+    parser.add_argument("--det_tile_overlap_ratio", type=float, default=0.1)
+    parser.add_argument("--det_tile_batch", type=int, default=4)
+    # auto mode tiles when det_limit_side_len / long side drops below this
+    parser.add_argument("--det_tile_max_downscale", type=float, default=0.5)
+    # and long side / short side is at least this; ordinary photos are detected with one resize
+    parser.add_argument("--det_tile_min_aspect", type=float, default=3.0)
+    parser.add_argument("--det_tile_merge_thresh", type=float, default=0.5)
+    # single: one pass at det_limit_side_len; adaptive: coarse pass first, refine small/low-confidence text
+    parser.add_argument("--det_scale_mode", type=str, default="single")
+    parser.add_argument("--det_coarse_side_len", type=float, default=480)
+    # boxes lower than this on the coarse probability map are too small to trust
+    parser.add_argument("--det_coarse_min_text_height", type=float, default=10)
+    parser.add_argument("--det_coarse_low_thresh", type=float, default=0.1)
+    parser.add_argument("--det_coarse_min_region_area", type=int, default=6)
+    parser.add_argument("--det_refine_margin", type=int, default=16)
+    parser.add_argument("--det_refine_max_regions", type=int, default=8)
+    # refining more than this share of the image falls back to a full-scale pass
+    parser.add_argument("--det_refine_max_area_ratio", type=float, default=0.4)
 
     # DB parmas
     parser.add_argument("--det_db_thresh", type=float, default=0.3)
@@ -281,6 +382,8 @@ def infer_args():
     parser.add_argument("--max_batch_size", type=int, default=10)
     parser.add_argument("--use_dilation", type=str2bool, default=False)
     parser.add_argument("--det_db_score_mode", type=str, default="fast")
+    # legacy: per-contour shapely/pyclipper, fast: vectorized rectangles + integral image scores
+    parser.add_argument("--det_db_box_engine", type=str, default="legacy")
 
     # EAST parmas
     parser.add_argument("--det_east_score_thresh", type=float, default=0.8)
@@ -313,7 +416,16 @@ def infer_args():
     parser.add_argument("--rec_image_inverse", type=str2bool, default=True)
     parser.add_argument("--rec_image_shape", type=str, default="3, 48, 320")
     parser.add_argument("--rec_batch_num", type=int, default=6)
+    # bucket: group crops by width under a padding budget, fixed: rec_batch_num per batch
+    parser.add_argument("--rec_batch_mode", type=str, default="bucket")
+    parser.add_argument("--rec_bucket_max_batch_num", type=int, default=32)
+    parser.add_argument("--rec_bucket_pad_waste", type=float, default=0.3)
+    parser.add_argument("--rec_bucket_max_pixels", type=int, default=48 * 320 * 32)
     parser.add_argument("--max_text_length", type=int, default=25)
+    # skip CTC frames that only cover the right-hand padding of each crop
+    parser.add_argument("--rec_seq_len_hint", type=str2bool, default=False)
+    # LRU cache of rec results keyed by the resized crop, 0 disables it
+    parser.add_argument("--rec_cache_size", type=int, default=0)
     parser.add_argument(
         "--rec_char_dict_path",
         type=str,
@@ -324,6 +436,19 @@ def infer_args():
         "--vis_font_path", type=str, default=str(module_dir / "fonts/simfang.ttf")
     )
     parser.add_argument("--drop_score", type=float, default=0.5)
+    # drop boxes before recognition: short side under prerec_min_side pixels, det score under
+    # prerec_min_score, long side over prerec_max_aspect times the short side; 0 disables each check
+    parser.add_argument("--prerec_min_side", type=float, default=0)
+    parser.add_argument("--prerec_min_score", type=float, default=0.0)
+    parser.add_argument("--prerec_max_aspect", type=float, default=0)
+    # boxes within this many pixels of an axis-aligned rectangle are sliced instead of warped, <0 disables
+    parser.add_argument("--crop_axis_aligned_tol", type=float, default=1.0)
+    # threads used to warp rotated boxes
+    parser.add_argument("--crop_num_threads", type=int, default=4)
+    # boxes whose centers differ by less than this ratio of the shorter box height share a line
+    parser.add_argument("--reading_order_line_tol", type=float, default=0.5)
+    # read multi-column pages column by column
+    parser.add_argument("--reading_order_columns", type=str2bool, default=False)
 
     # params for e2e
     parser.add_argument("--e2e_algorithm", type=str, default="PGNet")
@@ -352,11 +477,23 @@ def infer_args():
     parser.add_argument("--label_list", type=list, default=["0", "180"])
     parser.add_argument("--cls_batch_num", type=int, default=6)
     parser.add_argument("--cls_thresh", type=float, default=0.9)
+    # full: classify every text line; adaptive: classify a sample and skip the rest when the page orientation is consistent
+    parser.add_argument("--cls_mode", type=str, default="full")
+    parser.add_argument("--cls_sample_num", type=int, default=6)
+    # pages with fewer text lines than this are classified in full
+    parser.add_argument("--cls_adaptive_min_crops", type=int, default=12)
+    # skip only when every sampled line agrees with at least this confidence
+    parser.add_argument("--cls_adaptive_thresh", type=float, default=0.95)
+    # lines whose height / width is at least this are vertical and not sampled
+    parser.add_argument("--cls_tall_ratio", type=float, default=1.5)
 
     parser.add_argument("--enable_mkldnn", type=str2bool, default=False)
-    parser.add_argument("--cpu_threads", type=int, default=10)
+    # intra-op threads of every session, 0 lets onnxruntime decide
+    parser.add_argument("--cpu_threads", type=int, default=0)
     parser.add_argument("--use_pdserving", type=str2bool, default=False)
+    # warm up det / cls / rec with synthetic inputs on construction, in a background thread if warmup_background
     parser.add_argument("--warmup", type=str2bool, default=False)
+    parser.add_argument("--warmup_background", type=str2bool, default=False)
 
     # SR parmas
     parser.add_argument("--sr_model_dir", type=str)
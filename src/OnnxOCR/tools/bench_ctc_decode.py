@@ -0,0 +1,82 @@
+"""
+CTC 解码微基准: 对比逐行解码 (argmax + max + decode) 和整批向量化解码 (decode_batch)
+
+用法 (在 src/OnnxOCR 目录下):
+    python tools/bench_ctc_decode.py --batch_sizes 6 32 --frames 40 80
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from onnxocr.rec_postprocess import CTCLabelDecode
+from onnxocr.utils import module_dir
+
+
+def make_preds(batch_size, frames, num_classes, rng):
+    """
+    模拟识别模型输出: 约一半帧为 blank, 其余为随机字符, 相邻帧有重复
+    """
+    logits = rng.normal(size=(batch_size, frames, num_classes)).astype(np.float32)
+    ids = rng.integers(1, num_classes, size=(batch_size, frames))
+    ids[rng.random((batch_size, frames)) < 0.5] = 0
+    repeat = rng.random((batch_size, frames // 2)) < 0.3
+    ids[:, 1::2] = np.where(repeat, ids[:, ::2][:, : frames // 2], ids[:, 1::2])
+    np.put_along_axis(logits, ids[:, :, None], 20.0, axis=2)
+    logits -= logits.max(axis=2, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=2, keepdims=True)
+    return probs
+
+
+def legacy_decode(decoder, preds):
+    preds_idx = preds.argmax(axis=2)
+    preds_prob = preds.max(axis=2)
+    return decoder.decode(preds_idx, preds_prob, is_remove_duplicate=True)
+
+
+def timeit(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dict_path",
+        type=str,
+        default=str(module_dir / "models/ch_ppocr_server_v2.0/ppocr_keys_v1.txt"),
+    )
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 6, 32])
+    parser.add_argument("--frames", type=int, nargs="+", default=[40, 120])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    decoder = CTCLabelDecode(character_dict_path=args.dict_path, use_space_char=True)
+    num_classes = len(decoder.character)
+    rng = np.random.default_rng(0)
+    print("dict: {} ({} classes)".format(args.dict_path, num_classes))
+    print("{:>6} {:>7} {:>12} {:>12} {:>8} {:>6}".format(
+        "batch", "frames", "legacy(ms)", "batch(ms)", "speedup", "same"))
+    for batch_size in args.batch_sizes:
+        for frames in args.frames:
+            preds = make_preds(batch_size, frames, num_classes, rng)
+            legacy = legacy_decode(decoder, preds)
+            batch = decoder.decode_batch(preds)
+            same = all(
+                a[0] == b[0] and abs(a[1] - b[1]) < 1e-5 for a, b in zip(legacy, batch)
+            )
+            legacy_ms = timeit(lambda: legacy_decode(decoder, preds), args.repeat)
+            batch_ms = timeit(lambda: decoder.decode_batch(preds), args.repeat)
+            print("{:>6} {:>7} {:>12.3f} {:>12.3f} {:>7.2f}x {:>6}".format(
+                batch_size, frames, legacy_ms, batch_ms, legacy_ms / batch_ms, str(same)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+对比 DBPostProcess 的 legacy 和 fast 两种 box 提取方式: 在测试图片上跑检测模型,
+同一张概率图分别后处理, 输出框数量、匹配率、IoU、最大角点偏差和耗时
+
+用法 (在 src/OnnxOCR 目录下):
+    python tools/check_db_postprocess.py --image_dir onnxocr/test_images
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from onnxocr.utils import infer_args
+from onnxocr.imaug import transform
+from onnxocr.predict_det import TextDetector
+from onnxocr.db_postprocess import DBPostProcess
+from onnxocr.utils import module_dir
+
+
+def box_iou(box_a, box_b):
+    box_a = box_a.reshape(-1, 1, 2).astype(np.float32)
+    box_b = box_b.reshape(-1, 1, 2).astype(np.float32)
+    inter, _ = cv2.intersectConvexConvex(box_a, box_b)
+    union = cv2.contourArea(box_a) + cv2.contourArea(box_b) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_boxes(legacy, fast):
+    """
+    贪心匹配: 每个 legacy 框找 IoU 最大且未被占用的 fast 框
+    """
+    used = set()
+    ious = []
+    corner_diffs = []
+    reordered = 0
+    for box in legacy:
+        best, best_iou = None, 0.0
+        for j, other in enumerate(fast):
+            if j in used:
+                continue
+            iou = box_iou(box, other)
+            if iou > best_iou:
+                best, best_iou = j, iou
+        if best is not None and best_iou > 0.5:
+            used.add(best)
+            ious.append(best_iou)
+            # 45 度附近的框起始角点可能不同, 角点偏差按最佳循环对齐计算
+            diffs = [
+                np.abs(box.astype(np.int64) - np.roll(fast[best], shift, axis=0)).max()
+                for shift in range(4)
+            ]
+            reordered += int(np.argmin(diffs) != 0)
+            corner_diffs.append(min(diffs))
+    return ious, corner_diffs, reordered
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image_dir", type=str, default=str(module_dir / "test_images"))
+    parser.add_argument(
+        "--det_model_dir", type=str, default=str(module_dir / "models/ppocrv4/det/det.onnx")
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    cli = parser.parse_args()
+
+    args = infer_args().parse_args([])
+    args.use_gpu = False
+    args.det_model_dir = cli.det_model_dir
+    detector = TextDetector(args)
+    params = dict(
+        thresh=args.det_db_thresh,
+        box_thresh=args.det_db_box_thresh,
+        max_candidates=1000,
+        unclip_ratio=args.det_db_unclip_ratio,
+        use_dilation=args.use_dilation,
+        score_mode=args.det_db_score_mode,
+    )
+    engines = {
+        "legacy": DBPostProcess(box_engine="legacy", **params),
+        "fast": DBPostProcess(box_engine="fast", **params),
+    }
+
+    files = sorted(glob.glob(os.path.join(cli.image_dir, "*.jpg")) +
+                   glob.glob(os.path.join(cli.image_dir, "*.png")))
+    totals = {"legacy": 0.0, "fast": 0.0}
+    all_ious, all_diffs, n_legacy, n_fast, n_reordered = [], [], 0, 0, 0
+    print("{:<40} {:>7} {:>7} {:>8} {:>9} {:>9} {:>9}".format(
+        "image", "legacy", "fast", "matched", "min_iou", "max_diff", "speedup"))
+    for path in files:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        data = transform({"image": img}, detector.preprocess_op)
+        image, shape_list = data
+        image = np.ascontiguousarray(np.expand_dims(image, axis=0))
+        shape_list = np.expand_dims(shape_list, axis=0)
+        input_feed = detector.get_input_feed(detector.det_input_name, image)
+        maps = detector.det_onnx_session.run(detector.det_output_name, input_feed)[0]
+
+        results, times = {}, {}
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            for _ in range(cli.repeat):
+                results[name] = engine({"maps": maps}, shape_list)[0]["points"]
+            times[name] = (time.perf_counter() - start) / cli.repeat
+            totals[name] += times[name]
+
+        ious, diffs, reordered = match_boxes(results["legacy"], results["fast"])
+        n_reordered += reordered
+        all_ious += ious
+        all_diffs += diffs
+        n_legacy += len(results["legacy"])
+        n_fast += len(results["fast"])
+        print("{:<40} {:>7} {:>7} {:>8} {:>9.3f} {:>9} {:>8.2f}x".format(
+            os.path.basename(path)[:40], len(results["legacy"]), len(results["fast"]),
+            len(ious), min(ious) if ious else 1.0, max(diffs) if diffs else 0,
+            times["legacy"] / max(times["fast"], 1e-9)))
+
+    print("-" * 96)
+    print("boxes legacy/fast: {}/{}, matched: {}, start corner differs: {}, mean IoU: {:.4f}, "
+          "corner diff p50/p99/max: {}/{}/{} px".format(
+              n_legacy, n_fast, len(all_ious), n_reordered,
+              float(np.mean(all_ious)) if all_ious else 1.0,
+              int(np.percentile(all_diffs, 50)) if all_diffs else 0,
+              int(np.percentile(all_diffs, 99)) if all_diffs else 0,
+              int(max(all_diffs)) if all_diffs else 0))
+    print("post-process time legacy: {:.1f} ms, fast: {:.1f} ms".format(
+        totals["legacy"] * 1000, totals["fast"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+生成 det / rec / cls 的 INT8 量化模型, 并在测试图片上对比原模型和各量化变体的整条 ONNXPaddleOcr 流水线:
+每张图片的耗时、进程峰值内存、识别文本与原模型的一致程度
+
+    dynamic: 权重 INT8, 激活在运行时量化; 默认只量化 MatMul (Conv 会变成 ConvInteger, 在 CPU 上通常更慢)
+    static: QDQ 格式, 激活的量化范围用 test_images 校准 (det 用整图输入, rec / cls 用原模型检测出的文本条)
+
+量化模型保存在原模型旁边, 如 models/ppocrv4/rec/rec.int8_static.onnx, 某个模型没有该变体时使用原模型;
+OCRService 通过环境变量 OCR_MODEL_VARIANT (如 int8_static) 选用
+
+用法 (在 src/OnnxOCR 目录下):
+    python tools/quantize_models.py --models det rec cls --modes dynamic static
+    python tools/quantize_models.py --skip_quantize  # 只重新生成对比报告
+"""
+import os
+import sys
+import glob
+import time
+import difflib
+import argparse
+import multiprocessing as mp
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from onnxocr.utils import module_dir, model_variant_path
+from onnxocr.imaug import transform
+
+MODEL_PATHS = {
+    "det": module_dir / "models/ppocrv4/det/det.onnx",
+    "rec": module_dir / "models/ppocrv4/rec/rec.onnx",
+    "cls": module_dir / "models/ppocrv4/cls/cls.onnx",
+}
+DICT_PATH = module_dir / "models/ch_ppocr_server_v2.0/ppocr_keys_v1.txt"
+
+
+def list_images(image_dir):
+    return sorted(
+        glob.glob(os.path.join(image_dir, "*.jpg")) + glob.glob(os.path.join(image_dir, "*.png"))
+    )
+
+
+def ocr_kwargs(variant="fp32"):
+    return dict(
+        det_model_dir=existing_variant("det", variant),
+        rec_model_dir=existing_variant("rec", variant),
+        cls_model_dir=existing_variant("cls", variant),
+        rec_char_dict_path=str(DICT_PATH),
+        use_angle_cls=True,
+        use_gpu=False,
+        share_models=False,
+    )
+
+
+def existing_variant(model, variant):
+    path = model_variant_path(MODEL_PATHS[model], variant)
+    return path if os.path.exists(path) else str(MODEL_PATHS[model])
+
+
+def collect_calibration(image_paths, max_crops):
+    """
+    用原模型生成校准输入: det 为预处理后的整图, rec / cls 为检测出的文本条 (batch 为 1)
+    """
+    from onnxocr.onnx_paddleocr import ONNXPaddleOcr
+
+    system = ONNXPaddleOcr(**ocr_kwargs())
+    imgC, imgH, imgW = system.text_recognizer.rec_image_shape
+    inputs = {"det": [], "rec": [], "cls": []}
+    for path in image_paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        data = transform({"image": img}, system.text_detector.preprocess_op)
+        if data is None or data[0] is None:
+            continue
+        # 融合预处理返回的是线程内复用的缓冲区, 必须复制, 否则所有样本都会变成最后一张图片
+        inputs["det"].append(data[0][np.newaxis].copy())
+        if len(inputs["rec"]) >= max_crops:
+            continue
+        # __call__ 返回 (boxes, 耗时), 这里只要框; 预处理失败时为 None
+        dt_boxes, _ = system.text_detector.detect(img)
+        if dt_boxes is None or len(dt_boxes) == 0:
+            continue
+        for crop in system.crop_images(img, dt_boxes):
+            h, w = crop.shape[:2]
+            wh_ratio = max(imgW / float(imgH), w / float(h))
+            inputs["rec"].append(system.text_recognizer.resize_norm_img(crop, wh_ratio)[np.newaxis])
+            inputs["cls"].append(system.text_classifier.resize_norm_img(crop)[np.newaxis])
+            if len(inputs["rec"]) >= max_crops:
+                break
+    return inputs
+
+
+def make_reader(model_path, samples):
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader
+
+    input_name = onnxruntime.InferenceSession(
+        str(model_path), providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+
+    class ListDataReader(CalibrationDataReader):
+        def __init__(self):
+            self.iterator = iter(samples)
+
+        def get_next(self):
+            sample = next(self.iterator, None)
+            return None if sample is None else {input_name: sample}
+
+    return ListDataReader()
+
+
+def quantize(model, mode, calibration, dynamic_ops):
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    src = str(MODEL_PATHS[model])
+    dst = model_variant_path(src, "int8_" + mode)
+    start = time.time()
+    if mode == "dynamic":
+        quantize_dynamic(src, dst, op_types_to_quantize=dynamic_ops, weight_type=QuantType.QInt8)
+    else:
+        if not calibration[model]:
+            print("{}: no calibration data, skipped".format(model))
+            return
+        quantize_static(
+            src,
+            dst,
+            make_reader(src, calibration[model]),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    print("{} -> {} ({:.1f} MB -> {:.1f} MB, {:.1f} s)".format(
+        src, dst, os.path.getsize(src) / 2 ** 20, os.path.getsize(dst) / 2 ** 20,
+        time.time() - start))
+
+
+def evaluate(variant, image_paths, repeat):
+    """
+    在子进程中运行, 峰值内存只包含该变体
+    """
+    import resource
+    from onnxocr.onnx_paddleocr import ONNXPaddleOcr
+
+    kwargs = ocr_kwargs(variant)
+    system = ONNXPaddleOcr(**kwargs)
+    images = [img for img in (cv2.imread(path) for path in image_paths) if img is not None]
+    # 第一遍预热, 不计时
+    texts = [[line[1][0] for line in (system.ocr(img)[0] or [])] for img in images]
+    start = time.time()
+    for _ in range(repeat):
+        for img in images:
+            system.ocr(img)
+    latency = (time.time() - start) / max(repeat * len(images), 1)
+    # Linux 下 ru_maxrss 的单位为 KB
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    # 实际使用了该变体的模型
+    models = [name for name in MODEL_PATHS if kwargs[name + "_model_dir"] != str(MODEL_PATHS[name])]
+    return {"texts": texts, "latency": latency, "peak_rss": peak_rss, "models": models}
+
+
+def agreement(reference, texts):
+    """
+    按图片比较识别文本: 字符级相似度的均值, 以及文本完全一致的图片占比
+    """
+    ratios, identical = [], 0
+    for ref, txt in zip(reference, texts):
+        ref, txt = "\n".join(ref), "\n".join(txt)
+        identical += int(ref == txt)
+        ratios.append(difflib.SequenceMatcher(None, ref, txt).ratio() if ref or txt else 1.0)
+    return float(np.mean(ratios)) if ratios else 1.0, identical / float(max(len(ratios), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image_dir", type=str, default=str(module_dir / "test_images"))
+    parser.add_argument("--models", nargs="+", default=["det", "rec", "cls"], choices=list(MODEL_PATHS))
+    parser.add_argument("--modes", nargs="+", default=["dynamic", "static"], choices=["dynamic", "static"])
+    parser.add_argument("--dynamic_ops", nargs="+", default=["MatMul"])
+    parser.add_argument("--calib_max_crops", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip_quantize", action="store_true")
+    cli = parser.parse_args()
+
+    image_paths = list_images(cli.image_dir)
+    if not cli.skip_quantize:
+        calibration = None
+        if "static" in cli.modes:
+            calibration = collect_calibration(image_paths, cli.calib_max_crops)
+            print("calibration samples: " + ", ".join(
+                "{} {}".format(model, len(samples)) for model, samples in calibration.items()))
+        for mode in cli.modes:
+            for model in cli.models:
+                quantize(model, mode, calibration, cli.dynamic_ops)
+
+    variants = ["fp32"] + ["int8_" + mode for mode in cli.modes]
+    ctx = mp.get_context("spawn")
+    results = {}
+    for variant in variants:
+        # 每个变体一个新进程, 峰值内存互不影响
+        with ctx.Pool(1) as pool:
+            results[variant] = pool.apply(evaluate, (variant, image_paths, cli.repeat))
+
+    base = results["fp32"]
+    print("{:<14} {:<12} {:>10} {:>8} {:>10} {:>10} {:>10}".format(
+        "variant", "models", "ms/image", "speedup", "peak MB", "char agr.", "identical"))
+    for variant in variants:
+        result = results[variant]
+        char_agreement, identical = agreement(base["texts"], result["texts"])
+        print("{:<14} {:<12} {:>10.1f} {:>7.2f}x {:>10.0f} {:>10.4f} {:>9.1%}".format(
+            variant,
+            ",".join(result["models"]) or "-",
+            result["latency"] * 1000,
+            base["latency"] / max(result["latency"], 1e-9),
+            result["peak_rss"],
+            char_agreement,
+            identical,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ import logging
 
 from .config import (
     TOKEN, BOT_USERNAME, MESSAGE_TIMEOUT, 
-    MAX_BUFFER_SIZE, MAX_PROCESSING_TIME,
+    MAX_BUFFER_SIZE, MAX_PROCESSING_TIME, OCR_WARMUP_TIMEOUT,
 )
 from .ocr import OCRProcessor
 from .text_to_speech import convert_to_audio
@@ -46,6 +46,8 @@ class TelegramBot:
         self.last_message_time = defaultdict(datetime.now)
         self.ocr_processor = OCRProcessor()
         self.processing_locks = defaultdict(asyncio.Lock)  # Add lock per chat
+        # Updates are handled concurrently; this keeps each chat's messages in order
+        self.message_locks = defaultdict(asyncio.Lock)
         self.link_processor = LinkProcessor()
         self.debug_mode = False  # Add debug mode flag
         self.ebook_processor = EbookProcessor()
@@ -70,7 +72,8 @@ class TelegramBot:
             '- Images (with OCR)\n'
             '- Links (web pages and videos)\n'
             '- Ebooks (PDF, EPUB)\n'
-            'I will convert the content to audio for you to listen to.'
+            'I will convert the content to audio for you to listen to.\n'
+            'Send /cancel to drop images that are still being read.'
         )
 
     async def download_photo(self, photo) -> bytes:
@@ -199,7 +202,14 @@ class TelegramBot:
                 await update.message.reply_text("❌ An error occurred while processing messages")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Main message handler for both text and photos."""
+        """Main message handler for both text and photos.
+
+        Different chats are handled concurrently, messages of one chat one at a time.
+        """
+        async with self.message_locks[update.effective_chat.id]:
+            await self._handle_message(update, context)
+
+    async def _handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             message_type: str = update.message.chat.type
             text: str = update.message.text
@@ -267,6 +277,7 @@ class TelegramBot:
             print(f"Error processing message: {str(e)}")
             await update.message.reply_text("Sorry, there was an error processing your message.")
             self.message_buffer[chat_id].clear()
+            self.ocr_processor.cancel_chat_jobs(chat_id)
 
     async def _handle_content(self, update: Update) -> str:
         """Process message content based on type."""
@@ -364,7 +375,9 @@ class TelegramBot:
                 else:
                     await update.message.reply_text('Converting image to text...')
                     photo_bytes = await self.download_photo(photo)
-                    ocr_text = self.ocr_processor.process_image(photo_bytes)
+                    ocr_text = await self.ocr_processor.process_image_async(
+                        photo_bytes, chat_id, photo.file_unique_id
+                    )
                     # Clean OCR text
                     cleaned_ocr = self._clean_text(ocr_text) if ocr_text else None
                     return f'OCR: {cleaned_ocr}' if cleaned_ocr else None
@@ -391,6 +404,15 @@ class TelegramBot:
         print(f'Update {update} caused error {context.error}')
         await self.link_processor.close()
 
+    async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Drop pending messages and OCR jobs of this chat."""
+        chat_id = update.message.chat_id
+        cancelled = self.ocr_processor.cancel_chat_jobs(chat_id)
+        self.message_buffer[chat_id].clear()
+        await update.message.reply_text(
+            f"Cancelled {cancelled} pending image(s)." if cancelled else "Nothing to cancel."
+        )
+
     async def toggle_debug(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Toggle debug mode on/off."""
         self.debug_mode = not self.debug_mode
@@ -512,11 +534,14 @@ class TelegramBot:
         """处理照片消息"""
         try:
             chat_id = update.effective_chat.id
-            photo_file = await update.message.photo[-1].get_file()
+            photo = update.message.photo[-1]
+            photo_file = await photo.get_file()
             photo_bytes = await photo_file.download_as_bytearray()
             
-            # 直接调用process_image，不需要await
-            text = self.ocr_processor.process_image(photo_bytes)
+            # OCR 在独立线程池中执行, 不阻塞其他聊天; 同一文件的结果走缓存
+            text = await self.ocr_processor.process_image_async(
+                photo_bytes, chat_id, photo.file_unique_id
+            )
             
             if not text:
                 await context.bot.send_message(
@@ -544,8 +569,7 @@ class TelegramBot:
             
             # 处理PDF页面
             for page_num, image in enumerate(images, 1):
-                # 直接调用process_pdf_page，不需要await
-                text = self.ocr_processor.process_pdf_page(image)
+                text = await self.ocr_processor.process_pdf_page_async(image, chat_id)
                 if text:
                     self.message_buffer[chat_id].append(text)
                     
@@ -561,16 +585,23 @@ class TelegramBot:
     def run(self):
         """Start the bot."""
         print('Starting bot...')
-        app = Application.builder().token(TOKEN).build()
+        # Concurrent updates: one chat's OCR job doesn't hold up other chats or /cancel
+        app = Application.builder().token(TOKEN).concurrent_updates(True).build()
         
         # Initialize handlers
         app.add_handler(CommandHandler('start', self.start_command))
         app.add_handler(CommandHandler('help', self.help_command))
         app.add_handler(CommandHandler('debug', self.toggle_debug))
+        app.add_handler(CommandHandler('cancel', self.cancel_command))
         app.add_handler(MessageHandler(filters.TEXT, self.handle_message))
         app.add_handler(MessageHandler(filters.PHOTO, self.handle_message))
         app.add_handler(MessageHandler(filters.Document.ALL, self.handle_message))
         app.add_error_handler(self.error)
 
+        # Only take traffic once the OCR models are warm
+        print('Waiting for OCR warmup...')
+        if not self.ocr_processor.wait_ready(OCR_WARMUP_TIMEOUT):
+            print(f"OCR warmup not finished after {OCR_WARMUP_TIMEOUT}s, polling anyway")
+
         print('Polling...')
         app.run_polling(poll_interval=5) 
\ No newline at end of file
@@ -8,6 +8,30 @@ from .bot_settings import (
     OCR_LANG,
     USE_EASY_OCR,
     USE_GPU,
+    OCR_SESSION_OPTIONS,
+    OCR_READING_ORDER_COLUMNS,
+    OCR_CLS_MODE,
+    OCR_MAX_CONCURRENCY,
+    OCR_POOL_WORKERS,
+    OCR_POOL_QUEUE_SIZE,
+    OCR_POOL_SLOT_MB,
+    OCR_PIPELINE,
+    OCR_CACHE_SIZE,
+    OCR_CACHE_DIR,
+    OCR_CACHE_DISK_MB,
+    OCR_CACHE_NEAR_DUP_DISTANCE,
+    OCR_REC_CACHE_SIZE,
+    OCR_PREREC_FILTER,
+    OCR_WARMUP,
+    OCR_WARMUP_BACKGROUND,
+    OCR_WARMUP_TIMEOUT,
+    OCR_MODEL_CACHE,
+    OCR_MODEL_CACHE_DIR,
+    OCR_MODEL_VARIANT,
+    OCR_PROVIDERS,
+    OCR_PROVIDER_OPTIONS,
+    OCR_IDLE_UNLOAD_SECONDS,
+    OCR_IDLE_RELOAD_WARMUP,
     MESSAGE_TIMEOUT,
     MAX_BUFFER_SIZE,
     MAX_PROCESSING_TIME
@@ -21,6 +45,30 @@ __all__ = [
     'OCR_LANG',
     'USE_EASY_OCR',
     'USE_GPU',
+    'OCR_SESSION_OPTIONS',
+    'OCR_READING_ORDER_COLUMNS',
+    'OCR_CLS_MODE',
+    'OCR_MAX_CONCURRENCY',
+    'OCR_POOL_WORKERS',
+    'OCR_POOL_QUEUE_SIZE',
+    'OCR_POOL_SLOT_MB',
+    'OCR_PIPELINE',
+    'OCR_CACHE_SIZE',
+    'OCR_CACHE_DIR',
+    'OCR_CACHE_DISK_MB',
+    'OCR_CACHE_NEAR_DUP_DISTANCE',
+    'OCR_REC_CACHE_SIZE',
+    'OCR_PREREC_FILTER',
+    'OCR_WARMUP',
+    'OCR_WARMUP_BACKGROUND',
+    'OCR_WARMUP_TIMEOUT',
+    'OCR_MODEL_CACHE',
+    'OCR_MODEL_CACHE_DIR',
+    'OCR_MODEL_VARIANT',
+    'OCR_PROVIDERS',
+    'OCR_PROVIDER_OPTIONS',
+    'OCR_IDLE_UNLOAD_SECONDS',
+    'OCR_IDLE_RELOAD_WARMUP',
     'MESSAGE_TIMEOUT',
     'MAX_BUFFER_SIZE',
     'MAX_PROCESSING_TIME'
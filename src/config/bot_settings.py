@@ -1,5 +1,6 @@
 from typing import Final
 import os
+import json
 import logging
 from dotenv import load_dotenv
 from .lang_voice import LANG_VOICE_CONFIGS
@@ -9,6 +10,53 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+_TRUE_VALUES = ('true', '1', 'yes', 'on')
+_FALSE_VALUES = ('false', '0', 'no', 'off')
+
+
+def _parse_bool(value: str) -> bool:
+    """Parse a boolean setting, accepting true/1/yes/on and false/0/no/off."""
+    value = value.strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean environment variable, falling back to the default on empty or invalid values."""
+    value = os.getenv(name, '')
+    if value.strip() == '':
+        return default
+    try:
+        return _parse_bool(value)
+    except ValueError:
+        logger.warning(f"Invalid value {value!r} for {name}, using {default}")
+        return default
+
+
+def _env_number(name: str, default, minimum, convert):
+    """Read a numeric environment variable clamped to minimum, falling back to the default
+    on empty or invalid values."""
+    value = os.getenv(name, '')
+    if value.strip() == '':
+        return default
+    try:
+        return max(convert(value), minimum)
+    except ValueError:
+        logger.warning(f"Invalid value {value!r} for {name}, using {default}")
+        return default
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    return _env_number(name, default, minimum, int)
+
+
+def _env_float(name: str, default: float, minimum: float = 0.0) -> float:
+    return _env_number(name, default, minimum, float)
+
+
 # Bot Configuration
 TOKEN: Final = os.getenv('TELEGRAM_BOT_TOKEN')
 BOT_USERNAME: Final = os.getenv('BOT_NAME')
@@ -31,6 +79,117 @@ OCR_LANG = language_config['ocr_lang']
 # OCR settings
 USE_EASY_OCR = selected_language != 'zh'  # Use easyOCR for non-Chinese languages
 
+# ONNX Runtime session settings for the det/rec/cls models.
+# OCR_<KEY> applies to every model, OCR_DET_<KEY>/OCR_REC_<KEY>/OCR_CLS_<KEY> override it per model.
+_OCR_SESSION_ENV_KEYS = {
+    'INTRA_OP_THREADS': ('intra_op_num_threads', int),
+    'INTER_OP_THREADS': ('inter_op_num_threads', int),
+    'GRAPH_OPT_LEVEL': ('graph_optimization_level', str),
+    'EXECUTION_MODE': ('execution_mode', str),
+    'ENABLE_MEM_ARENA': ('enable_cpu_mem_arena', _parse_bool),
+    'ENABLE_MEM_PATTERN': ('enable_mem_pattern', _parse_bool),
+    'THREAD_AFFINITY': ('intra_op_thread_affinity', str),
+}
+
+
+def _ocr_session_options(model: str) -> dict:
+    """Collect session options for one OCR model from the environment."""
+    options = {}
+    for env_key, (option, convert) in _OCR_SESSION_ENV_KEYS.items():
+        value = os.getenv(f'OCR_{model.upper()}_{env_key}', os.getenv(f'OCR_{env_key}'))
+        if value is None or value == '':
+            continue
+        try:
+            options[option] = convert(value)
+        except ValueError:
+            logger.warning(f"Invalid value {value!r} for OCR_{model.upper()}_{env_key}, ignoring")
+    return options
+
+
+OCR_SESSION_OPTIONS: Final = {model: _ocr_session_options(model) for model in ('det', 'rec', 'cls')}
+
+# Angle classification: 'full' classifies every text line, 'adaptive' classifies a sample
+# and skips the rest when the page orientation is consistent
+OCR_CLS_MODE: Final = os.getenv('OCR_CLS_MODE', 'full').lower()
+
+# OCR jobs running at once in the bot; further jobs wait without blocking the event loop
+OCR_MAX_CONCURRENCY: Final = _env_int('OCR_MAX_CONCURRENCY', 2, 1)
+
+# OCR worker processes (0 runs OCR in-process), jobs in flight and the largest shared memory
+# slot per image in MB; slots in /dev/shm grow to the largest image seen
+OCR_POOL_WORKERS: Final = _env_int('OCR_POOL_WORKERS', 0)
+OCR_POOL_QUEUE_SIZE: Final = _env_int('OCR_POOL_QUEUE_SIZE', 0)
+OCR_POOL_SLOT_MB: Final = _env_int('OCR_POOL_SLOT_MB', 64, 1)
+
+# Run det/crop/cls/rec as pipelined stages so concurrent requests overlap (in-process mode only)
+OCR_PIPELINE: Final = _env_bool('OCR_PIPELINE', False)
+
+# OCR result cache: entries kept in memory (0 disables the cache), optional on-disk tier
+# that survives restarts and its size limit, and the dHash distance (in bits, out of 256)
+# under which a re-encoded copy of a cached image with the same dimensions reuses its text (0 disables)
+OCR_CACHE_SIZE: Final = _env_int('OCR_CACHE_SIZE', 256)
+OCR_CACHE_DIR: Final = os.getenv('OCR_CACHE_DIR', '')
+OCR_CACHE_DISK_MB: Final = _env_int('OCR_CACHE_DISK_MB', 256, 1)
+OCR_CACHE_NEAR_DUP_DISTANCE: Final = _env_int('OCR_CACHE_NEAR_DUP_DISTANCE', 0)
+
+# Recognition results cached per text-line crop (timestamps, app names, button labels), 0 disables
+OCR_REC_CACHE_SIZE: Final = _env_int('OCR_REC_CACHE_SIZE', 0)
+
+# Drop detected boxes before recognition when their short side is under OCR_PREREC_MIN_SIDE pixels,
+# their detection score is under OCR_PREREC_MIN_SCORE, or their long side exceeds
+# OCR_PREREC_MAX_ASPECT times the short side (0 disables each check)
+OCR_PREREC_FILTER: Final = {
+    'prerec_min_side': _env_float('OCR_PREREC_MIN_SIDE', 0.0),
+    'prerec_min_score': _env_float('OCR_PREREC_MIN_SCORE', 0.0),
+    'prerec_max_aspect': _env_float('OCR_PREREC_MAX_ASPECT', 0.0),
+}
+
+# Warm up the OCR models with synthetic inputs at startup, in the background; the bot starts
+# polling and the /ocr route accepts requests once warm (the bot waits at most OCR_WARMUP_TIMEOUT seconds)
+OCR_WARMUP: Final = _env_bool('OCR_WARMUP', True)
+OCR_WARMUP_BACKGROUND: Final = _env_bool('OCR_WARMUP_BACKGROUND', True)
+OCR_WARMUP_TIMEOUT: Final = _env_float('OCR_WARMUP_TIMEOUT', 300.0)
+
+# Cache the optimized OCR models in ORT format so later starts (and pool workers) skip
+# graph optimization; OCR_MODEL_CACHE_DIR defaults to $XDG_CACHE_HOME/readlooong/ort (~/.cache)
+OCR_MODEL_CACHE: Final = _env_bool('OCR_MODEL_CACHE', False)
+OCR_MODEL_CACHE_DIR: Final = os.getenv('OCR_MODEL_CACHE_DIR', '')
+
+# OCR model variant, e.g. int8_dynamic or int8_static made by src/OnnxOCR/tools/quantize_models.py;
+# models without that variant fall back to the original fp32 model
+OCR_MODEL_VARIANT: Final = os.getenv('OCR_MODEL_VARIANT', 'fp32').lower()
+
+# ONNX Runtime execution providers in priority order, e.g. "openvino,cpu" or "xnnpack";
+# "auto" benchmarks the CPU providers available at startup and picks the fastest per model.
+# Empty keeps the USE_GPU based default
+OCR_PROVIDERS: Final = os.getenv('OCR_PROVIDERS', '').strip()
+
+
+def _ocr_provider_options() -> dict:
+    """Per-provider options as JSON, e.g. {"openvino": {"num_of_threads": "4"}}."""
+    value = os.getenv('OCR_PROVIDER_OPTIONS', '')
+    if not value:
+        return {}
+    try:
+        options = json.loads(value)
+    except ValueError:
+        options = None
+    if not isinstance(options, dict):
+        logger.warning(f"Invalid value {value!r} for OCR_PROVIDER_OPTIONS, ignoring")
+        return {}
+    return options
+
+
+OCR_PROVIDER_OPTIONS: Final = _ocr_provider_options()
+
+# Memory budget: unload the OCR models after this many idle seconds (0 keeps them loaded)
+# and reload them on the next request, warming them up first if OCR_IDLE_RELOAD_WARMUP
+OCR_IDLE_UNLOAD_SECONDS: Final = _env_float('OCR_IDLE_UNLOAD_SECONDS', 0.0)
+OCR_IDLE_RELOAD_WARMUP: Final = _env_bool('OCR_IDLE_RELOAD_WARMUP', False)
+
+# Reading order: split multi-column pages (newspapers, two-column PDFs) and read column by column
+OCR_READING_ORDER_COLUMNS: Final = _env_bool('OCR_READING_ORDER_COLUMNS', False)
+
 # Message Processing
 MESSAGE_TIMEOUT = 1  # seconds to wait for additional messages
 MAX_BUFFER_SIZE = 400000  # maximum characters in buffer
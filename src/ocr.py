@@ -1,8 +1,17 @@
+import asyncio
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
 import io
+from .config import (
+    OCR_MAX_CONCURRENCY, OCR_LANG, USE_EASY_OCR, OCR_CLS_MODE, OCR_READING_ORDER_COLUMNS,
+    OCR_CACHE_SIZE, OCR_CACHE_DIR, OCR_CACHE_DISK_MB, OCR_CACHE_NEAR_DUP_DISTANCE, OCR_PREREC_FILTER,
+    OCR_MODEL_VARIANT
+)
 from .services.ocr_service import OCRService
+from .services.ocr_cache import OCRResultCache, dhash
 
 logger = logging.getLogger(__name__)
 
@@ -11,26 +20,149 @@ class OCRProcessor:
         """Initialize OCR processor"""
         try:
             self.ocr_service = OCRService()
+            # Dedicated threads so inference never runs on the event loop or its default executor
+            self._executor = ThreadPoolExecutor(
+                max_workers=OCR_MAX_CONCURRENCY, thread_name_prefix='ocr'
+            )
+            self._semaphore = None
+            self._jobs = defaultdict(set)
+            self._abandoned = set()
+            # Results are only reusable under the same OCR settings
+            self.cache = None
+            if OCR_CACHE_SIZE > 0:
+                self.cache = OCRResultCache(
+                    namespace=(f'{USE_EASY_OCR}|{OCR_LANG}|{OCR_CLS_MODE}|{OCR_READING_ORDER_COLUMNS}'
+                               f'|{OCR_MODEL_VARIANT}|{sorted(OCR_PREREC_FILTER.items())}'),
+                    memory_size=OCR_CACHE_SIZE,
+                    disk_dir=OCR_CACHE_DIR or None,
+                    disk_max_bytes=OCR_CACHE_DISK_MB << 20,
+                    near_duplicates=OCR_CACHE_NEAR_DUP_DISTANCE > 0,
+                    max_distance=OCR_CACHE_NEAR_DUP_DISTANCE
+                )
             logger.info("OCR processor initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize OCR processor: {str(e)}")
             raise
 
-    def process_image(self, image_data):
+    def _get_semaphore(self):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(OCR_MAX_CONCURRENCY)
+        return self._semaphore
+
+    async def _run_job(self, func, *args):
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _submit(self, chat_id, func, *args):
+        """Run func in the OCR executor, at most OCR_MAX_CONCURRENCY jobs at once.
+
+        Returns None if the job was abandoned through cancel_chat_jobs.
+        """
+        job = asyncio.ensure_future(self._run_job(func, *args))
+        self._jobs[chat_id].add(job)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            if job in self._abandoned:
+                logger.info(f"OCR job for chat {chat_id} was cancelled")
+                return None
+            # The caller itself was cancelled, don't leave the job queued
+            job.cancel()
+            raise
+        finally:
+            self._abandoned.discard(job)
+            self._jobs[chat_id].discard(job)
+            if not self._jobs[chat_id]:
+                del self._jobs[chat_id]
+
+    def cancel_chat_jobs(self, chat_id):
+        """Cancel a chat's pending OCR jobs and return how many were cancelled.
+
+        Jobs still waiting for a slot never start; a job already running in the
+        executor finishes in the background and its result is dropped.
+        """
+        cancelled = 0
+        for job in list(self._jobs.get(chat_id, ())):
+            if not job.done():
+                self._abandoned.add(job)
+                job.cancel()
+                cancelled += 1
+        return cancelled
+
+    async def process_image_async(self, image_data, chat_id=None, file_unique_id=None):
+        """Non-blocking process_image, cancellable per chat via cancel_chat_jobs"""
+        return await self._submit(chat_id, self.process_image, image_data, file_unique_id)
+
+    async def process_pdf_page_async(self, image, chat_id=None):
+        """Non-blocking process_pdf_page, cancellable per chat via cancel_chat_jobs"""
+        return await self._submit(chat_id, self.process_pdf_page, image)
+
+    def wait_ready(self, timeout=None):
+        """Block until the OCR models are warmed up, return False on timeout"""
+        return self.ocr_service.wait_ready(timeout)
+
+    def close(self):
+        """Stop the OCR executor and release the OCR models"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.ocr_service.close()
+
+    @staticmethod
+    def _results_to_text(results):
+        """Join results already in reading order: words by ' ', lines by newline, paragraphs by a blank line"""
+        paragraphs = []
+        for result in results:
+            if not paragraphs or paragraphs[-1][0] != result['paragraph']:
+                paragraphs.append((result['paragraph'], []))
+            lines = paragraphs[-1][1]
+            if not lines or lines[-1][0] != result['line']:
+                lines.append((result['line'], []))
+            lines[-1][1].append(result['text'])
+        return '\n\n'.join(
+            '\n'.join(' '.join(words) for _, words in lines)
+            for _, lines in paragraphs
+        )
+
+    def _cached_ocr(self, image_data, file_unique_id=None):
+        """OCRService.process_image through the result cache.
+
+        Exact matches (file_unique_id or image hash) are served before decoding;
+        near-duplicate matches need the decoded image for its dHash.
+        """
+        if self.cache is None:
+            return self.ocr_service.process_image(image_data)
+        key = self.cache.key_for(image_data, file_unique_id)
+        results = self.cache.get(key)
+        if results is not None:
+            logger.info(f"OCR cache hit for {key}")
+            return results
+        image_hash = None
+        if self.cache.near_duplicates:
+            image_data = self.ocr_service._convert_to_cv2_image(image_data)
+            image_hash = dhash(image_data)
+            results = self.cache.get_similar(image_hash)
+            if results is not None:
+                logger.info(f"OCR cache near-duplicate hit for {key}")
+                self.cache.put(key, results, image_hash)
+                return results
+        self.cache.miss()
+        results = self.ocr_service.process_image(image_data)
+        self.cache.put(key, results, image_hash)
+        return results
+
+    def process_image(self, image_data, file_unique_id=None):
         """Process image and return OCR results"""
         try:
-            # Process image
-            results = self.ocr_service.process_image(image_data)
+            # Process image, reusing the result of an identical image seen before
+            results = self._cached_ocr(image_data, file_unique_id)
             
             # Extract text
             if not results:
                 return ""
                 
-            # Sort results by y-coordinate for top-to-bottom reading order
-            sorted_results = sorted(results, key=lambda x: x['box'][0][1])
-            
-            # Combine all text
-            text = '\n'.join(result['text'] for result in sorted_results)
+            # Results come back in reading order, grouped into lines and paragraphs
+            text = self._results_to_text(results)
             
             return text
 
@@ -52,8 +184,7 @@ class OCRProcessor:
             if not results:
                 return ""
                 
-            sorted_results = sorted(results, key=lambda x: x['box'][0][1])
-            text = '\n'.join(result['text'] for result in sorted_results)
+            text = self._results_to_text(results)
             
             return text
 
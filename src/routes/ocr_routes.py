@@ -10,6 +10,13 @@ ocr_service = OCRService()
 @ocr_bp.route('/ocr', methods=['POST'])
 def process_image():
     try:
+        # Models still warming up
+        if not ocr_service.is_ready():
+            return jsonify({
+                'success': False,
+                'error': 'OCR service is warming up'
+            }), 503, {'Retry-After': '5'}
+
         # Check request
         if not request.files:
             return jsonify({
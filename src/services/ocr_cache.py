@@ -0,0 +1,237 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image, hash_size=16):
+    """Difference hash of a BGR/gray image as (height, width, hex digest of hash_size**2 bits).
+
+    The hash is robust to recompression; the dimensions keep differently sized
+    images from ever matching as near-duplicates.
+    """
+    height, width = image.shape[:2]
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return height, width, np.packbits(bits).tobytes().hex()
+
+
+def _hash_from_json(value):
+    """dhash stored in a disk entry, None for entries without one or from the old 64-bit format"""
+    if isinstance(value, list) and len(value) == 3:
+        return tuple(value)
+    return None
+
+
+def _plain_results(results):
+    """OCR results as JSON-friendly lists"""
+    return [
+        dict(result, box=np.asarray(result['box'], dtype=float).tolist(),
+             confidence=float(result['confidence']))
+        for result in results
+    ]
+
+
+class OCRResultCache:
+    """Content-addressed cache of OCRService.process_image results.
+
+    Keys are Telegram file_unique_ids or sha256 of the image bytes, namespaced by
+    the OCR configuration. Lookups go through an in-memory LRU, then a size-bounded
+    directory of JSON files that survives restarts. With near_duplicates, images of
+    the same dimensions whose dHash is within max_distance bits of a cached image
+    reuse its result.
+    """
+
+    def __init__(self, namespace, memory_size=256, disk_dir=None, disk_max_bytes=256 << 20,
+                 near_duplicates=False, max_distance=4):
+        self.namespace = namespace
+        self.memory_size = memory_size
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (results, dhash)
+        self._hashes = OrderedDict()  # key -> (height, width, hash bytes), for near-duplicate lookups
+        self._disk_files = OrderedDict()  # file name -> size, oldest first
+        self._disk_bytes = 0
+        self.stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'near_hits': 0, 'misses': 0,
+            'memory_evictions': 0, 'disk_evictions': 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def key_for(self, image_data, file_unique_id=None):
+        """Cache key of an image, None when it cannot be hashed without decoding"""
+        if file_unique_id:
+            return f'tg:{file_unique_id}'
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            return 'sha256:' + hashlib.sha256(image_data).hexdigest()
+        if isinstance(image_data, np.ndarray):
+            digest = hashlib.sha256(str(image_data.shape).encode())
+            digest.update(np.ascontiguousarray(image_data).data)
+            return 'sha256:' + digest.hexdigest()
+        if isinstance(image_data, str) and os.path.isfile(image_data):
+            with open(image_data, 'rb') as f:
+                return 'sha256:' + hashlib.sha256(f.read()).hexdigest()
+        return None
+
+    def _file_name(self, key):
+        return hashlib.sha256(f'{self.namespace}|{key}'.encode()).hexdigest() + '.json'
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._disk_files[name] = size
+            self._disk_bytes += size
+        logger.info(f"OCR cache: {len(self._disk_files)} entries "
+                    f"({self._disk_bytes >> 20} MB) on disk at {self.disk_dir}")
+
+    def _remember(self, key, results, image_hash):
+        """Insert into the memory tier, caller holds the lock"""
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = (results, image_hash)
+        self._memory.move_to_end(key)
+        if image_hash is not None:
+            height, width, digest = image_hash
+            self._hashes[key] = (height, width, np.frombuffer(bytes.fromhex(digest), np.uint8))
+            self._hashes.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            old_key, _ = self._memory.popitem(last=False)
+            self._hashes.pop(old_key, None)
+            self.stats['memory_evictions'] += 1
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        name = self._file_name(key)
+        with self._lock:
+            if name not in self._disk_files:
+                return None
+            self._disk_files.move_to_end(name)
+        path = os.path.join(self.disk_dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"OCR cache: dropping unreadable entry {name}: {e}")
+            with self._lock:
+                self._disk_bytes -= self._disk_files.pop(name, 0)
+            return None
+        return entry['results'], _hash_from_json(entry.get('dhash'))
+
+    def _write_disk(self, key, results, image_hash):
+        if not self.disk_dir:
+            return
+        name = self._file_name(key)
+        data = json.dumps({'key': key, 'dhash': image_hash, 'results': results},
+                          ensure_ascii=False).encode('utf-8')
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.disk_dir, name))
+        except OSError as e:
+            logger.warning(f"OCR cache: failed to write {name}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        evicted = []
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk_files.pop(name, 0)
+            self._disk_files[name] = len(data)
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk_files) > 1:
+                old_name, size = self._disk_files.popitem(last=False)
+                self._disk_bytes -= size
+                self.stats['disk_evictions'] += 1
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.disk_dir, old_name))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """Cached results for key, or None"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return entry[0]
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, *entry)
+        return entry[0]
+
+    def get_similar(self, image_hash):
+        """Results of a cached image within max_distance bits of image_hash, or None"""
+        if not self.near_duplicates or image_hash is None:
+            return None
+        height, width, digest = image_hash
+        target = np.frombuffer(bytes.fromhex(digest), np.uint8)
+        with self._lock:
+            keys = [
+                key for key, (h, w, bits) in self._hashes.items()
+                if h == height and w == width and bits.size == target.size
+            ]
+            if not keys:
+                return None
+            hashes = np.stack([self._hashes[key][2] for key in keys])
+            distances = np.unpackbits(hashes ^ target, axis=1).sum(axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+            self.stats['near_hits'] += 1
+            self._memory.move_to_end(keys[best])
+            return self._memory[keys[best]][0]
+
+    def miss(self):
+        with self._lock:
+            self.stats['misses'] += 1
+
+    def put(self, key, results, image_hash=None):
+        if key is None:
+            return
+        results = _plain_results(results)
+        with self._lock:
+            self._remember(key, results, image_hash)
+        self._write_disk(key, results, image_hash)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = len(self._disk_files)
+            stats['disk_bytes'] = self._disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = (lookups - stats['misses']) / lookups if lookups else 0.0
+        return stats
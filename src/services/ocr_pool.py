@@ -0,0 +1,301 @@
+import os
+import sys
+import time
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Add project root to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from src.OnnxOCR.onnxocr.model_registry import process_rss
+
+
+# Default seconds OCRWorkerPool.ocr waits for a free slot and for the result
+JOB_TIMEOUT = 300
+
+# Shared memory slots grow in steps of this many bytes
+SLOT_ALIGN = 1 << 20
+
+
+class OCRPoolError(RuntimeError):
+    """Raised when a pool job cannot be completed"""
+
+
+def _to_plain(result):
+    """Convert ONNXPaddleOcr.ocr() output to plain Python objects for the result queue"""
+    if not result or not result[0]:
+        return [[]]
+    return [[[np.asarray(box).tolist(), (text, float(score))] for box, (text, score) in result[0]]]
+
+
+def _create_slot(size):
+    """Create a shared memory block with its pages reserved up front.
+
+    On Linux the block lives on /dev/shm; without the reservation a full tmpfs only
+    shows up as SIGBUS when the image is copied in. Raises OSError when it doesn't fit.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    fd = getattr(shm, '_fd', -1)
+    if fd >= 0 and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            shm.close()
+            shm.unlink()
+            raise
+    return shm
+
+
+def _worker_main(worker_id, ocr_kwargs, job_queue, result_queue):
+    """Worker process: one ONNXPaddleOcr, images read in place from shared memory slots"""
+    from src.OnnxOCR.onnxocr.onnx_paddleocr import ONNXPaddleOcr
+
+    ocr = ONNXPaddleOcr(**ocr_kwargs)
+    result_queue.put(('ready', worker_id, None, None))
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, shm_name, shape, dtype, image = job
+        shm = None
+        try:
+            if shm_name is not None:
+                # Slots are resized by the parent, so attach by name for each job
+                shm = shared_memory.SharedMemory(name=shm_name)
+                image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            info = {}
+            result = _to_plain(ocr.ocr(image, info=info))
+            result_queue.put(('done', worker_id, job_id, (result, info)))
+        except Exception as e:
+            result_queue.put(('error', worker_id, job_id, f"{type(e).__name__}: {e}"))
+        finally:
+            # Drop the view before the slot is unmapped and reused
+            image = None
+            if shm is not None:
+                shm.close()
+
+
+class OCRWorkerPool:
+    """Run ONNXPaddleOcr in worker processes.
+
+    Each decoded image is copied once into a free shared memory slot and read in
+    place by the worker; only the slot name and shape go through the job queue.
+    The number of slots bounds the jobs in flight: submit() blocks while all
+    slots are busy. Slots are allocated on first use and grow to the largest image
+    seen so far, up to slot_bytes; larger images, and every image when shared
+    memory can't be allocated (e.g. Docker's 64 MB /dev/shm), are pickled instead.
+    Each worker has its own job queue, so the pool knows which jobs a worker holds:
+    when it dies, those jobs fail with OCRPoolError and the worker is restarted.
+    """
+
+    def __init__(self, num_workers, ocr_kwargs, queue_size=None, slot_bytes=64 << 20,
+                 start_timeout=120):
+        self.num_workers = num_workers
+        self.ocr_kwargs = ocr_kwargs
+        self.slot_bytes = slot_bytes
+        num_slots = queue_size or 2 * num_workers
+        self._ctx = mp.get_context('spawn')
+        self._slots = [None] * num_slots  # SharedMemory per slot, allocated on first use
+        self._slot_size = 0  # size every slot grows to, from the largest image so far
+        self._free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+        self._result_queue = self._ctx.Queue()
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = {}  # job_id -> (future, slot, worker_id)
+        self._job_queues = {}  # worker_id -> its job queue
+        self._assigned = {worker_id: set() for worker_id in range(num_workers)}
+        self._ready = threading.Semaphore(0)
+        self._workers = {}
+        self._closed = False
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'pickled': 0, 'restarts': 0,
+                      'shm_failures': 0}
+
+        for worker_id in range(num_workers):
+            self._job_queues[worker_id] = self._ctx.Queue()
+            self._start_worker(worker_id)
+        self._collector = threading.Thread(target=self._collect, name='ocr-pool-collector', daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._watch, name='ocr-pool-monitor', daemon=True)
+        self._monitor.start()
+        for _ in range(num_workers):
+            if not self._ready.acquire(timeout=start_timeout):
+                self.close()
+                raise OCRPoolError(f"OCR workers did not start within {start_timeout}s")
+        logger.info(f"OCR worker pool started: {num_workers} workers, {num_slots} slots "
+                    f"of up to {slot_bytes >> 20} MB")
+
+    def _start_worker(self, worker_id):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.ocr_kwargs, self._job_queues[worker_id], self._result_queue),
+            name=f'ocr-worker-{worker_id}',
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = process
+
+    def _finish(self, job_id, result=None, error=None):
+        with self._lock:
+            future, slot, worker_id = self._pending.pop(job_id, (None, None, None))
+            if worker_id is not None:
+                self._assigned[worker_id].discard(job_id)
+            if error is None:
+                self.stats['completed'] += 1
+            else:
+                self.stats['failed'] += 1
+        if slot is not None:
+            self._free_slots.put(slot)
+        if future is None:
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(OCRPoolError(error))
+
+    def _collect(self):
+        while True:
+            message = self._result_queue.get()
+            if message is None:
+                return
+            kind, worker_id, job_id, payload = message
+            if kind == 'ready':
+                self._ready.release()
+            else:
+                self._finish(job_id, payload if kind == 'done' else None,
+                             payload if kind == 'error' else None)
+
+    def _watch(self):
+        while not self._closed:
+            time.sleep(1)
+            for worker_id, process in list(self._workers.items()):
+                if self._closed or process.is_alive():
+                    continue
+                with self._lock:
+                    # Every job sent to this worker is lost, including those it hadn't started;
+                    # new jobs go to a fresh queue read by the restarted worker
+                    job_ids = list(self._assigned[worker_id])
+                    self._job_queues[worker_id] = self._ctx.Queue()
+                    self.stats['restarts'] += 1
+                logger.error(f"OCR worker {worker_id} exited with code {process.exitcode}, restarting")
+                for job_id in job_ids:
+                    self._finish(job_id, error=f"OCR worker {worker_id} crashed")
+                self._start_worker(worker_id)
+
+    def _slot_for(self, slot, nbytes):
+        """Shared memory of a slot big enough for nbytes, or None to pickle the image.
+
+        The caller holds the slot, so nothing else touches its block meanwhile.
+        """
+        if nbytes > self.slot_bytes:
+            return None
+        shm = self._slots[slot]
+        if shm is not None and shm.size >= nbytes:
+            return shm
+        with self._lock:
+            aligned = -(-nbytes // SLOT_ALIGN) * SLOT_ALIGN
+            self._slot_size = min(max(self._slot_size, aligned), self.slot_bytes)
+            size = max(self._slot_size, nbytes)
+        if shm is not None:
+            # Workers attach per job and close right after, so the old block is unused
+            self._slots[slot] = None
+            shm.close()
+            shm.unlink()
+        try:
+            shm = _create_slot(size)
+        except OSError as e:
+            with self._lock:
+                self.stats['shm_failures'] += 1
+                first_failure = self.stats['shm_failures'] == 1
+            log = logger.warning if first_failure else logger.debug
+            log(f"Could not allocate {size >> 20} MB of shared memory ({e}), pickling the image; "
+                f"raise the /dev/shm size (docker run --shm-size) or lower OCR_POOL_SLOT_MB")
+            return None
+        self._slots[slot] = shm
+        return shm
+
+    def submit(self, image, timeout=None):
+        """Queue one decoded BGR image, return a Future of (ocr() result, info dict).
+
+        Blocks while every slot is busy; raises OCRPoolError after timeout seconds.
+        """
+        if self._closed:
+            raise OCRPoolError("OCR worker pool is closed")
+        try:
+            slot = self._free_slots.get(timeout=timeout)
+        except queue.Empty:
+            raise OCRPoolError("OCR worker pool is busy")
+        image = np.ascontiguousarray(image)
+        future = Future()
+        job_id = next(self._job_ids)
+        shm = self._slot_for(slot, image.nbytes)
+        if shm is not None:
+            target = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)
+            target[...] = image
+            del target
+            job = (job_id, shm.name, image.shape, image.dtype.str, None)
+        else:
+            job = (job_id, None, None, None, image)
+        with self._lock:
+            # Least loaded worker; the queue is looked up under the lock so a job is never
+            # put on the queue of a worker that was just found dead
+            worker_id = min(self._assigned, key=lambda w: len(self._assigned[w]))
+            self._assigned[worker_id].add(job_id)
+            self._pending[job_id] = (future, slot, worker_id)
+            self.stats['submitted'] += 1
+            if job[1] is None:
+                self.stats['pickled'] += 1
+            self._job_queues[worker_id].put(job)
+        return future
+
+    def ocr(self, image, timeout=JOB_TIMEOUT, info=None):
+        """Same result format as ONNXPaddleOcr.ocr(image, info=info).
+
+        Raises OCRPoolError if no result arrives within timeout seconds.
+        """
+        try:
+            result, job_info = self.submit(image, timeout=timeout).result(timeout=timeout)
+        except FutureTimeoutError:
+            raise OCRPoolError(f"OCR job got no result within {timeout}s")
+        if info is not None:
+            info.update(job_info)
+        return result
+
+    def worker_rss(self):
+        """Resident memory of each worker process in bytes (None where it can't be read)"""
+        return {worker_id: process_rss(process.pid) for worker_id, process in self._workers.items()}
+
+    def close(self):
+        """Stop the workers and free the shared memory slots"""
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            for job_queue in self._job_queues.values():
+                job_queue.put(None)
+        for process in self._workers.values():
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._result_queue.put(None)
+        with self._lock:
+            pending = list(self._pending)
+        for job_id in pending:
+            self._finish(job_id, error="OCR worker pool closed")
+        for shm in self._slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        logger.info("OCR worker pool stopped")
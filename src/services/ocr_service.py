@@ -1,5 +1,10 @@
 import sys
 import os
+import gc
+import time
+import ctypes
+import threading
+from contextlib import contextmanager
 import cv2
 import numpy as np
 import logging
@@ -24,8 +29,31 @@ project_root = os.path.dirname(os.path.dirname(current_dir))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from src.config import USE_EASY_OCR, OCR_LANG, USE_GPU
+from src.config import (
+    USE_EASY_OCR, OCR_LANG, USE_GPU, OCR_SESSION_OPTIONS, OCR_READING_ORDER_COLUMNS, OCR_CLS_MODE,
+    OCR_POOL_WORKERS, OCR_POOL_QUEUE_SIZE, OCR_POOL_SLOT_MB, OCR_PIPELINE, OCR_REC_CACHE_SIZE,
+    OCR_PREREC_FILTER, OCR_WARMUP, OCR_WARMUP_BACKGROUND, OCR_MODEL_CACHE, OCR_MODEL_CACHE_DIR,
+    OCR_MODEL_VARIANT, OCR_PROVIDERS, OCR_PROVIDER_OPTIONS, OCR_IDLE_UNLOAD_SECONDS,
+    OCR_IDLE_RELOAD_WARMUP
+)
 from src.OnnxOCR.onnxocr.onnx_paddleocr import ONNXPaddleOcr
+from src.OnnxOCR.onnxocr.utils import model_variant_path
+from src.OnnxOCR.onnxocr.model_registry import MODEL_REGISTRY, process_rss
+from src.OnnxOCR.onnxocr.reading_order import ReadingOrder
+from src.OnnxOCR.onnxocr.pipeline import OCRPipeline
+from src.services.ocr_pool import OCRWorkerPool
+
+# Log the engine stats every this many processed images
+STATS_LOG_INTERVAL = 100
+
+def _release_freed_memory():
+    """Collect the unloaded models and hand freed heap pages back to the OS (glibc only)"""
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
 
 class OCRService:
     def __init__(self):
@@ -38,24 +66,54 @@ class OCRService:
             dict_path = os.path.join(base_path, 'ch_ppocr_server_v2.0/ppocr_keys_v1.txt')
             
             self._check_model_files(det_path, rec_path, cls_path, dict_path)
+            det_path, rec_path, cls_path = (
+                self._select_variant(path, OCR_MODEL_VARIANT) for path in (det_path, rec_path, cls_path)
+            )
+            model_cache_dir = ''
+            if OCR_MODEL_CACHE:
+                model_cache_dir = OCR_MODEL_CACHE_DIR or self._default_model_cache_dir()
             
-            self.paddle_ocr = ONNXPaddleOcr(
+            self._det_path = det_path
+            self._ocr_kwargs = dict(
                 det_model_dir=det_path,
                 rec_model_dir=rec_path,
                 cls_model_dir=cls_path,
                 rec_char_dict_path=dict_path,
                 use_angle_cls=True,
-                use_gpu=USE_GPU
+                cls_mode=OCR_CLS_MODE,
+                rec_cache_size=OCR_REC_CACHE_SIZE,
+                use_gpu=USE_GPU,
+                providers=OCR_PROVIDERS or None,
+                provider_options=OCR_PROVIDER_OPTIONS or None,
+                det_session_options=OCR_SESSION_OPTIONS['det'],
+                rec_session_options=OCR_SESSION_OPTIONS['rec'],
+                cls_session_options=OCR_SESSION_OPTIONS['cls'],
+                reading_order_columns=OCR_READING_ORDER_COLUMNS,
+                model_cache_dir=model_cache_dir,
+                warmup=OCR_WARMUP,
+                warmup_background=OCR_WARMUP_BACKGROUND,
+                **OCR_PREREC_FILTER
             )
+            self.paddle_ocr = None
+            self.ocr_pool = None
+            self.ocr_pipeline = None
+            self.easy_ocr = None
+            self._pool_key = None
+            self._easy_ocr_key = None
+            # Only used for EasyOCR, PaddleOCR results are ordered by TextSystem
+            self.reading_order = ReadingOrder(detect_columns=OCR_READING_ORDER_COLUMNS)
 
-            # Initialize EasyOCR for other languages
-            if USE_EASY_OCR:
-                try:
-                    self.easy_ocr = easyocr.Reader([OCR_LANG], gpu=USE_GPU)
-                    logger.info(f"EasyOCR initialized for language: {OCR_LANG} (GPU: {USE_GPU})")
-                except Exception as e:
-                    logger.error(f"Failed to initialize EasyOCR: {str(e)}")
-                    raise
+            # Memory budget: requests in flight keep the models loaded, the idle watcher
+            # unloads them once nothing has used them for OCR_IDLE_UNLOAD_SECONDS
+            self._models_lock = threading.RLock()
+            self._models_loaded = False
+            self._active_requests = 0
+            self._requests_done = 0
+            self._last_used = time.monotonic()
+            self._stop_idle_watch = threading.Event()
+            self._load_models()
+            if OCR_IDLE_UNLOAD_SECONDS > 0:
+                threading.Thread(target=self._watch_idle, name='ocr-idle-watch', daemon=True).start()
             
             logger.info(f"OCR services initialized successfully (GPU: {USE_GPU})")
             
@@ -63,6 +121,193 @@ class OCRService:
             logger.error(f"Failed to initialize OCR services: {str(e)}")
             raise
 
+    def _load_models(self, reload=False):
+        """Load (or reload after an idle unload) the OCR models, caller holds _models_lock
+        or is __init__"""
+        start = time.time()
+        ocr_kwargs = self._ocr_kwargs
+        if reload:
+            # The request that triggered the reload needs the models right away
+            ocr_kwargs = dict(ocr_kwargs, warmup=OCR_IDLE_RELOAD_WARMUP, warmup_background=False)
+        # Pool mode: inference runs in worker processes shared by every OCRService in this process
+        if OCR_POOL_WORKERS > 0 and not USE_EASY_OCR:
+            self._pool_key = ('ocr_pool', self._det_path, OCR_POOL_WORKERS)
+            self.ocr_pool = MODEL_REGISTRY.acquire(
+                self._pool_key,
+                lambda: OCRWorkerPool(
+                    OCR_POOL_WORKERS,
+                    # Workers report ready only after warming up
+                    dict(ocr_kwargs, warmup_background=False),
+                    queue_size=OCR_POOL_QUEUE_SIZE or None,
+                    slot_bytes=OCR_POOL_SLOT_MB << 20
+                ),
+                on_release=lambda pool: pool.close()
+            )
+        else:
+            self.paddle_ocr = ONNXPaddleOcr(**ocr_kwargs)
+        self.ocr_pipeline = OCRPipeline(self.paddle_ocr) if OCR_PIPELINE and self.paddle_ocr else None
+
+        # Initialize EasyOCR for other languages, shared by every OCRService in this process
+        if USE_EASY_OCR:
+            try:
+                self._easy_ocr_key = ('easyocr', OCR_LANG, USE_GPU)
+                self.easy_ocr = MODEL_REGISTRY.acquire(
+                    self._easy_ocr_key,
+                    lambda: easyocr.Reader([OCR_LANG], gpu=USE_GPU)
+                )
+                logger.info(f"EasyOCR initialized for language: {OCR_LANG} (GPU: {USE_GPU})")
+            except Exception as e:
+                logger.error(f"Failed to initialize EasyOCR: {str(e)}")
+                raise
+        self._models_loaded = True
+        if reload:
+            logger.info(f"OCR models reloaded in {time.time() - start:.2f} s")
+        self._log_memory_report()
+
+    def _unload_models(self):
+        """Release this service's references to the shared OCR models, caller holds _models_lock"""
+        if self.ocr_pipeline is not None:
+            self.ocr_pipeline.close()
+            self.ocr_pipeline = None
+        if self.paddle_ocr is not None:
+            self.paddle_ocr.close()
+            self.paddle_ocr = None
+        if self._pool_key is not None:
+            MODEL_REGISTRY.release(self._pool_key)
+            self._pool_key = None
+            self.ocr_pool = None
+        if self._easy_ocr_key is not None:
+            MODEL_REGISTRY.release(self._easy_ocr_key)
+            self._easy_ocr_key = None
+            self.easy_ocr = None
+        self._models_loaded = False
+        _release_freed_memory()
+
+    def _watch_idle(self):
+        """Unload the models once they have been idle for OCR_IDLE_UNLOAD_SECONDS"""
+        interval = min(max(OCR_IDLE_UNLOAD_SECONDS / 4, 1.0), 60.0)
+        while not self._stop_idle_watch.wait(interval):
+            with self._models_lock:
+                idle = time.monotonic() - self._last_used
+                if (not self._models_loaded or self._active_requests
+                        or idle < OCR_IDLE_UNLOAD_SECONDS):
+                    continue
+                rss_before = process_rss()
+                self._unload_models()
+                rss_after = process_rss()
+            freed = ''
+            if rss_before is not None and rss_after is not None:
+                freed = f", RSS {rss_before / 2 ** 20:.0f} MB -> {rss_after / 2 ** 20:.0f} MB"
+            logger.info(f"OCR models unloaded after {idle:.0f} s idle{freed}")
+
+    @contextmanager
+    def _models_in_use(self):
+        """Keep the models loaded for the duration of a request, reloading them if needed"""
+        with self._models_lock:
+            if not self._models_loaded:
+                logger.info("Reloading OCR models unloaded while idle")
+                self._load_models(reload=True)
+            self._active_requests += 1
+        try:
+            yield
+        finally:
+            with self._models_lock:
+                self._active_requests -= 1
+                self._requests_done += 1
+                self._last_used = time.monotonic()
+                log_stats = self._requests_done % STATS_LOG_INTERVAL == 0
+            if log_stats:
+                self._log_stats()
+
+    def close(self):
+        """Release this service's references to the shared OCR models"""
+        self._stop_idle_watch.set()
+        with self._models_lock:
+            self._unload_models()
+
+    def is_ready(self):
+        """True once the OCR models are warmed up (pool workers are warm when the pool starts)"""
+        paddle_ocr = self.paddle_ocr
+        return paddle_ocr is None or paddle_ocr.ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Block until the OCR models are warmed up, return False on timeout"""
+        paddle_ocr = self.paddle_ocr
+        return paddle_ocr is None or paddle_ocr.wait_ready(timeout)
+
+    def memory_report(self):
+        """Resident memory of the process, and the RSS growth measured around each model's
+        load and warmup, in bytes.
+
+        The per-model deltas are not the models' footprint: they miss memory shared with
+        other models, include allocator noise, and read close to 0 after an idle reload
+        because the allocator reuses pages freed by the unload. Use process_rss (and
+        pool_workers_rss) for the actual footprint.
+        """
+        report = {
+            'process_rss': process_rss(),
+            'models_loaded': self._models_loaded,
+            'models': MODEL_REGISTRY.memory_report(),
+        }
+        ocr_pool = self.ocr_pool
+        if ocr_pool is not None:
+            report['pool_workers_rss'] = ocr_pool.worker_rss()
+        return report
+
+    def _log_memory_report(self):
+        report = self.memory_report()
+        if report['process_rss'] is None:
+            return
+        to_mb = lambda value: f"{value / 2 ** 20:.1f} MB" if value is not None else "n/a"
+        deltas = ', '.join(
+            f"{model['model']} +{to_mb(model['load_rss_delta'])} load"
+            + (f" +{to_mb(model['warmup_rss_delta'])} warmup" if model['warmup_rss_delta'] is not None else "")
+            for model in report['models']
+        )
+        message = f"OCR memory: process {to_mb(report['process_rss'])}"
+        workers = report.get('pool_workers_rss')
+        if workers:
+            message += ', pool workers ' + ' / '.join(to_mb(rss) for rss in workers.values())
+        if deltas:
+            message += f"; RSS growth around model loads, not their footprint: {deltas}"
+        logger.info(message)
+
+    def stats(self):
+        """Engine counters since startup: images processed, angle classification decisions
+        and, with OCR_PIPELINE, per-stage queue depth and utilization.
+
+        Classifier counters come from the in-process models; pool workers keep their own.
+        """
+        stats = {'requests': self._requests_done}
+        paddle_ocr = self.paddle_ocr
+        if paddle_ocr is not None and paddle_ocr.use_angle_cls:
+            stats['classifier'] = paddle_ocr.text_classifier.stats()
+        ocr_pipeline = self.ocr_pipeline
+        if ocr_pipeline is not None:
+            stats['pipeline'] = ocr_pipeline.stats()
+        return stats
+
+    def _log_stats(self):
+        stats = self.stats()
+        classifier = stats.get('classifier')
+        if classifier and classifier['pages']:
+            crops = classifier['crops_classified'] + classifier['crops_skipped']
+            decisions = ', '.join(
+                f"{name}={classifier[name]}"
+                for name in ('full', 'precheck_full', 'skipped_upright', 'rotated_all', 'sample_disagree')
+                if classifier[name]
+            )
+            logger.info(f"Angle classification ({OCR_CLS_MODE}): {classifier['pages']} pages, "
+                        f"{classifier['crops_skipped']}/{crops} text lines skipped ({decisions})")
+        pipeline = stats.get('pipeline')
+        if pipeline:
+            # The stage with the highest utilization is the bottleneck
+            logger.info("Pipeline stages: " + ", ".join(
+                f"{name} {stage['utilization']:.0%} busy, {stage['avg_time'] * 1000:.0f} ms avg, "
+                f"queue {stage['queue_depth']} (max {stage['max_queue_depth']})"
+                for name, stage in pipeline.items()
+            ))
+
     def _check_model_files(self, det_path, rec_path, cls_path, dict_path):
         """Check if all required model files exist"""
         files_to_check = {
@@ -77,6 +322,21 @@ class OCRService:
                 raise FileNotFoundError(f"{name} not found at: {path}")
             logger.info(f"{name} found at: {path}")
 
+    @staticmethod
+    def _default_model_cache_dir():
+        """Per-user cache directory for optimized models, outside the source tree"""
+        cache_home = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_home, 'readlooong', 'ort')
+
+    def _select_variant(self, model_path, variant):
+        """Path of the requested model variant, or the original model when it doesn't exist"""
+        path = model_variant_path(model_path, variant)
+        if path != model_path and not os.path.exists(path):
+            logger.warning(f"Model variant {variant} not found at {path}, using {model_path}")
+            return model_path
+        logger.info(f"Using model: {path}")
+        return path
+
     def _convert_to_cv2_image(self, image_data):
         """Convert different image formats to CV2 format"""
         try:
@@ -123,6 +383,27 @@ class OCRService:
             logger.error(f"Error converting image: {str(e)}")
             raise ValueError(f"Image conversion failed: {str(e)}")
 
+    def _apply_reading_order(self, ocr_results, layout=None):
+        """Return results in reading order, tagged with their 'line' and 'paragraph' index.
+
+        PaddleOCR results come with the layout TextSystem computed; only EasyOCR
+        results are grouped here.
+        """
+        if layout is None:
+            layout = self.reading_order([result['box'] for result in ocr_results])
+        line_paragraph = {}
+        for paragraph_no, line_nos in enumerate(layout['paragraphs']):
+            for line_no in line_nos:
+                line_paragraph[line_no] = paragraph_no
+        ordered = []
+        for line_no, line in enumerate(layout['lines']):
+            for index in line:
+                result = ocr_results[index]
+                result['line'] = line_no
+                result['paragraph'] = line_paragraph[line_no]
+                ordered.append(result)
+        return ordered
+
     def process_image(self, image_data):
         """Process image and return OCR results"""
         image = None
@@ -130,38 +411,62 @@ class OCRService:
             # Convert image format
             image = self._convert_to_cv2_image(image_data)
             
-            if USE_EASY_OCR:
-                # Use EasyOCR for non-Chinese languages
-                logger.info(f"Using EasyOCR with language: {OCR_LANG}")
-                results = self.easy_ocr.readtext(image)
-                ocr_results = []
-                for result in results:
-                    box, text, confidence = result
-                    if confidence > 0.1:  # Filter low confidence results
-                        ocr_results.append({
-                            'box': box,
-                            'text': text,
-                            'confidence': float(confidence)
-                        })
-            else:
-                # Use PaddleOCR for Chinese
-                logger.info("Using PaddleOCR for Chinese text")
-                result = self.paddle_ocr.ocr(image)
-                if not result or not result[0]:
-                    return []
-                    
-                ocr_results = []
-                for line in result[0]:
-                    box = line[0]
-                    text = line[1][0]
-                    confidence = line[1][1]
+            with self._models_in_use():
+                if USE_EASY_OCR:
+                    # Use EasyOCR for non-Chinese languages
+                    logger.info(f"Using EasyOCR with language: {OCR_LANG}")
+                    results = self.easy_ocr.readtext(image)
+                    ocr_results = []
+                    for result in results:
+                        box, text, confidence = result
+                        if confidence > 0.1:  # Filter low confidence results
+                            ocr_results.append({
+                                'box': box,
+                                'text': text,
+                                'confidence': float(confidence)
+                            })
+                    ocr_results = self._apply_reading_order(ocr_results)
+                else:
+                    # Use PaddleOCR for Chinese
+                    logger.info("Using PaddleOCR for Chinese text")
+                    # Filled with this request's detection details, prefilter skips, cache hits and layout
+                    info = {}
+                    if self.ocr_pool is not None:
+                        result = self.ocr_pool.ocr(image, info=info)
+                    elif self.ocr_pipeline is not None:
+                        dt_boxes, rec_res = self.ocr_pipeline(image, info=info)
+                        result = [[[box.tolist(), res] for box, res in zip(dt_boxes or [], rec_res or [])]]
+                    else:
+                        result = self.paddle_ocr.ocr(image, info=info)
+                    if info.get('det'):
+                        # Which detection path and scale this image took
+                        logger.info("Detection: " + ", ".join(
+                            f"{key}={value}" for key, value in info['det'].items()))
+                    rec_cache = info.get('rec_cache')
+                    prerec = info.get('prerec_filter')
+                    if prerec and prerec['skipped']:
+                        logger.info(f"Skipped {prerec['skipped']} text regions before recognition "
+                                    f"(~{prerec['est_saved_time'] * 1000:.0f} ms saved)")
+                    if rec_cache:
+                        logger.info(f"Recognition cache: {rec_cache['hits']}/{rec_cache['crops']} "
+                                    f"text lines reused ({rec_cache['hit_rate']:.0%})")
+                    if not result or not result[0]:
+                        return []
                     
-                    if confidence > 0.1:  # Filter low confidence results
+                    ocr_results = []
+                    for line in result[0]:
+                        box = line[0]
+                        text = line[1][0]
+                        confidence = line[1][1]
                         ocr_results.append({
                             'box': box,
                             'text': text,
                             'confidence': float(confidence)
                         })
+                    # Tag with the layout before filtering, its indices refer to every result
+                    ocr_results = self._apply_reading_order(ocr_results, info.get('layout'))
+                    # Filter low confidence results
+                    ocr_results = [result for result in ocr_results if result['confidence'] > 0.1]
             
             logger.info(f"Successfully processed image, found {len(ocr_results)} text regions")
             return ocr_results
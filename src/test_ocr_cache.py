@@ -0,0 +1,65 @@
+import os
+import cv2
+import numpy as np
+
+from services.ocr_cache import OCRResultCache, dhash
+
+
+def results_for(text):
+    return [{'box': [[0, 0], [10, 0], [10, 5], [0, 5]], 'text': text, 'confidence': 0.9,
+             'line': 0, 'paragraph': 0}]
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = OCRResultCache('test', memory_size=2)
+    cache.put('a', results_for('a'))
+    cache.put('b', results_for('b'))
+    assert cache.get('a')[0]['text'] == 'a'  # a is now the most recent
+
+    cache.put('c', results_for('c'))
+
+    assert cache.get('b') is None
+    assert cache.get('a')[0]['text'] == 'a'
+    assert cache.get('c')[0]['text'] == 'c'
+    assert cache.get_stats()['memory_evictions'] == 1
+
+
+def test_disk_tier_survives_restart_and_evicts_oldest(tmp_path):
+    cache = OCRResultCache('test', memory_size=1, disk_dir=str(tmp_path))
+    cache.put('a', results_for('a'))
+    entry_size = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    # Room for two entries on disk
+    cache = OCRResultCache('test', memory_size=1, disk_dir=str(tmp_path),
+                           disk_max_bytes=int(entry_size * 2.5))
+    cache.put('b', results_for('b'))
+    cache.put('c', results_for('c'))
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert cache.get_stats()['disk_evictions'] == 1
+
+    restarted = OCRResultCache('test', memory_size=1, disk_dir=str(tmp_path))
+    assert restarted.get('a') is None
+    assert restarted.get('b')[0]['text'] == 'b'
+    assert restarted.get('c')[0]['text'] == 'c'
+    assert restarted.get_stats()['disk_hits'] == 2
+
+
+def test_namespaces_do_not_share_entries(tmp_path):
+    OCRResultCache('lang=ch', disk_dir=str(tmp_path)).put('a', results_for('a'))
+
+    assert OCRResultCache('lang=en', disk_dir=str(tmp_path)).get('a') is None
+
+
+def test_near_duplicates_need_matching_dimensions():
+    rng = np.random.RandomState(0)
+    image = cv2.resize(rng.randint(0, 256, (24, 16, 3), dtype=np.uint8), (320, 480),
+                       interpolation=cv2.INTER_LINEAR)
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    reencoded = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    resized = cv2.resize(image, (160, 240), interpolation=cv2.INTER_AREA)
+    cache = OCRResultCache('test', near_duplicates=True, max_distance=16)
+    cache.put('a', results_for('a'), dhash(image))
+
+    assert cache.get_similar(dhash(reencoded))[0]['text'] == 'a'
+    assert cache.get_similar(dhash(resized)) is None
+    assert cache.get_similar(dhash(np.ascontiguousarray(image[::-1]))) is None
@@ -0,0 +1,221 @@
+import threading
+import cv2
+import numpy as np
+import pytest
+
+from OnnxOCR.onnxocr.rec_postprocess import CTCLabelDecode
+from OnnxOCR.onnxocr.db_postprocess import DBPostProcess
+from OnnxOCR.onnxocr.imaug import create_operators, transform
+from OnnxOCR.onnxocr.operators import DetResizeNormalize
+from OnnxOCR.onnxocr.rec_batching import plan_bucket_batches, padded_width
+from OnnxOCR.onnxocr.reading_order import ReadingOrder
+from OnnxOCR.onnxocr.det_tiling import merge_tile_boxes
+from OnnxOCR.onnxocr.model_registry import ModelRegistry
+
+NORMALIZE_PARAMS = {
+    "std": [0.229, 0.224, 0.225],
+    "mean": [0.485, 0.456, 0.406],
+    "scale": "1./255.",
+}
+
+
+def rect(left, top, right, bottom):
+    return np.array([[left, top], [right, top], [right, bottom], [left, bottom]], dtype=np.float32)
+
+
+def test_decode_batch_matches_decode():
+    decoder = CTCLabelDecode(None, use_space_char=True)
+    rng = np.random.RandomState(0)
+    # Long runs of repeated indices and blanks, like real CTC output
+    preds = rng.rand(5, 40, len(decoder.character)).astype(np.float32)
+    for row in range(5):
+        for start in range(0, 40, 4):
+            preds[row, start:start + 4, rng.randint(len(decoder.character))] += 5.0
+    preds[3] = 0.0
+    preds[3, :, 0] = 1.0  # all blank
+
+    expected = decoder.decode(preds.argmax(axis=2), preds.max(axis=2), is_remove_duplicate=True)
+    result = decoder.decode_batch(preds)
+
+    assert [text for text, _ in result] == [text for text, _ in expected]
+    np.testing.assert_allclose([prob for _, prob in result], [prob for _, prob in expected], rtol=1e-6)
+
+
+def test_decode_batch_skips_frames_past_seq_len():
+    decoder = CTCLabelDecode(None, use_space_char=True)
+    preds = np.zeros((1, 6, len(decoder.character)), dtype=np.float32)
+    for frame, index in enumerate([2, 0, 3, 0, 4, 5]):
+        preds[0, frame, index] = 1.0
+
+    assert decoder.decode_batch(preds, seq_lens=4)[0][0] == decoder.character[2] + decoder.character[3]
+
+
+def test_fast_box_engine_matches_legacy():
+    pred = np.zeros((1, 1, 160, 320), dtype=np.float32)
+    pred[0, 0, 20:40, 30:200] = 0.9
+    pred[0, 0, 60:75, 50:120] = 0.8
+    rotated = np.zeros((160, 320), dtype=np.uint8)
+    cv2.fillPoly(rotated, [cv2.boxPoints(((220, 110), (120, 18), 25)).astype(np.int32)], 1)
+    pred[0, 0][rotated > 0] = 0.85
+    shape_list = np.array([[160, 320, 1.0, 1.0]])
+
+    results = {
+        engine: DBPostProcess(thresh=0.3, box_thresh=0.6, unclip_ratio=1.5, box_engine=engine)(
+            {"maps": pred}, shape_list)[0]
+        for engine in ("legacy", "fast")
+    }
+
+    legacy, fast = results["legacy"], results["fast"]
+    assert len(fast["points"]) == len(legacy["points"]) == 3
+    # Axis-aligned boxes come out identical, the rotated one within a pixel
+    for legacy_box, fast_box in zip(legacy["points"], fast["points"]):
+        assert np.abs(np.asarray(legacy_box) - np.asarray(fast_box)).max() <= 1
+    np.testing.assert_allclose(fast["scores"], legacy["scores"], rtol=1e-6)
+
+
+def test_det_resize_normalize_matches_operator_chain():
+    img = np.random.RandomState(0).randint(0, 256, (300, 500, 3), dtype=np.uint8)
+    chain = create_operators([
+        {"DetResizeForTest": {"limit_side_len": 320, "limit_type": "max"}},
+        {"NormalizeImage": dict(order="hwc", **NORMALIZE_PARAMS)},
+        {"ToCHWImage": None},
+        {"KeepKeys": {"keep_keys": ["image", "shape"]}},
+    ])
+    fused = [DetResizeNormalize(limit_side_len=320, limit_type="max", **NORMALIZE_PARAMS)]
+
+    expected_image, expected_shape = transform({"image": img}, chain)
+    image, shape = transform({"image": img}, fused)
+
+    assert image.shape == expected_image.shape
+    np.testing.assert_allclose(image, expected_image, atol=1e-5)
+    np.testing.assert_allclose(shape, expected_shape)
+
+
+def test_plan_bucket_batches_respects_limits():
+    img_h, min_w = 48, 320
+    wh_ratios = [1.0, 2.0, 3.0, 5.0, 6.5, 8.0, 20.0, 21.0, 40.0, 2.5, 3.5, 7.0]
+    max_batch_num, max_pad_waste, max_batch_pixels = 4, 0.3, 48 * 1400 * 3
+
+    batches = plan_bucket_batches(wh_ratios, img_h, min_w, max_batch_num, max_pad_waste, max_batch_pixels)
+
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(wh_ratios)))
+    for batch in batches:
+        assert len(batch) <= max_batch_num
+        if len(batch) > 1:
+            batch_w = max(padded_width(img_h, min_w, wh_ratios[idx]) for idx in batch)
+            assert len(batch) * img_h * batch_w <= max_batch_pixels
+
+
+def test_plan_bucket_batches_splits_wide_outliers():
+    # One very long line must not pad the short ones to its width
+    batches = plan_bucket_batches([1.0, 1.2, 1.1, 30.0], 48, 320, 6, 0.3, 48 * 320 * 100)
+
+    assert [3] in batches
+
+
+def test_reading_order_two_columns():
+    # Two columns of three lines each with a gutter wider than two line heights
+    boxes = [rect(400, 10 + 40 * row, 680, 40 + 40 * row) for row in range(3)]
+    boxes += [rect(10, 10 + 40 * row, 290, 40 + 40 * row) for row in range(3)]
+
+    layout = ReadingOrder(detect_columns=True)(boxes)
+
+    assert layout["order"] == [3, 4, 5, 0, 1, 2]
+    assert layout["lines"] == [[3], [4], [5], [0], [1], [2]]
+
+
+def test_reading_order_without_columns_reads_across():
+    boxes = [rect(400, 10 + 40 * row, 680, 40 + 40 * row) for row in range(3)]
+    boxes += [rect(10, 10 + 40 * row, 290, 40 + 40 * row) for row in range(3)]
+
+    layout = ReadingOrder(detect_columns=False)(boxes)
+
+    assert layout["lines"] == [[3, 0], [4, 1], [5, 2]]
+
+
+def test_merge_tile_boxes_joins_split_line_and_drops_duplicates():
+    boxes = [
+        rect(0, 100, 520, 130),  # left half of a line cut by the tile border
+        rect(500, 100, 900, 130),  # right half from the next tile
+        rect(0, 200, 400, 230),  # complete line
+        rect(10, 202, 390, 228),  # same line found again in the overlap
+    ]
+    scores = [0.9, 0.7, 0.8, 0.6]
+    truncated = [True, True, False, False]
+
+    merged_boxes, merged_scores = merge_tile_boxes(boxes, scores, truncated, 0.5)
+
+    bounds = sorted(
+        (tuple(np.asarray(box).min(axis=0).astype(int)) + tuple(np.asarray(box).max(axis=0).astype(int)), score)
+        for box, score in zip(merged_boxes, merged_scores)
+    )
+    assert bounds == [((0, 100, 900, 130), 0.9), ((0, 200, 400, 230), 0.8)]
+
+
+def test_merge_tile_boxes_keeps_adjacent_lines():
+    boxes = [rect(0, 100, 500, 130), rect(0, 131, 500, 160)]
+
+    merged_boxes, _ = merge_tile_boxes(boxes, [0.9, 0.9], [True, True], 0.5)
+
+    assert len(merged_boxes) == 2
+
+
+def test_model_registry_shares_and_releases():
+    registry = ModelRegistry()
+    created, released = [], []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    first = registry.acquire(("det", "a.onnx"), factory, on_release=released.append)
+    second = registry.acquire(("det", "a.onnx"), factory, on_release=released.append)
+
+    assert first is second and len(created) == 1
+    assert registry.refcount(("det", "a.onnx")) == 2
+    registry.release(("det", "a.onnx"))
+    assert released == [] and registry.refcount(("det", "a.onnx")) == 1
+    registry.release(("det", "a.onnx"))
+    assert released == [first] and registry.refcount(("det", "a.onnx")) == 0
+    # Released keys load again on the next acquire
+    assert registry.acquire(("det", "a.onnx"), factory) is not first
+
+
+def test_model_registry_loads_once_under_concurrent_acquire():
+    registry = ModelRegistry()
+    loading = threading.Event()
+    proceed = threading.Event()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        loading.set()
+        proceed.wait(5)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.acquire(("rec", "b.onnx"), factory)))
+               for _ in range(4)]
+    threads[0].start()
+    loading.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    proceed.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4 and all(result is results[0] for result in results)
+    assert registry.refcount(("rec", "b.onnx")) == 4
+
+
+def test_model_registry_failed_load_can_be_retried():
+    registry = ModelRegistry()
+
+    def broken():
+        raise RuntimeError("bad model")
+
+    with pytest.raises(RuntimeError):
+        registry.acquire(("cls", "c.onnx"), broken)
+    assert registry.refcount(("cls", "c.onnx")) == 0
+    assert registry.acquire(("cls", "c.onnx"), lambda: "ok") == "ok"